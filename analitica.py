@@ -0,0 +1,223 @@
+# ============================================================
+# 📈 Analítica: instantánea columnar y tablero de ocupación / no-shows
+# ============================================================
+# Convierte Citas (hoja + archivo frío) y Pacientes en DataFrames tipados:
+# categorías para Medico/Especialidad/Estado, fechas reales y columnas
+# derivadas (Dia_Semana, Hora_Bloque, anticipación). Los agregados se
+# calculan con group-bys vectorizados y se guardan en caché por versión de
+# la instantánea: mientras los datos no cambian, el tablero no recalcula nada.
+import os
+import threading
+import time
+
+import numpy as np
+import pandas as pd
+
+from archivo_citas import ENCABEZADOS_CITAS, filas_archivadas, leer_indice
+from trazas import registrar, span
+
+CUPOS_DIA_MEDICO = int(os.environ.get("CUPOS_DIA_MEDICO", 16)) # Citas que un médico atiende en un día lleno
+ANALITICA_TTL_S = float(os.environ.get("ANALITICA_TTL_S", 300)) # Sin marca de modificación: cada cuánto se relee
+
+DIAS_SEMANA = ["Lunes", "Martes", "Miércoles", "Jueves", "Viernes", "Sábado", "Domingo"]
+BLOQUES_HORA = ["Mañana", "Tarde", "Noche"] # Mismos cortes que chatbot_logic._fila_noshow
+# Estado (en minúsculas) -> clase para las tasas; lo demás cuenta como "pendiente"
+CLASES_ESTADO = {
+    "cancelado": "cancelada", "cancelada": "cancelada",
+    "no asistió": "no_show", "no asistio": "no_show", "no_show": "no_show", "ausente": "no_show",
+    "atendido": "atendida", "atendida": "atendida", "completada": "atendida",
+}
+TRAMOS_ANTICIPACION = [-0.5, 0.5, 1.5, 3.5, 7.5, 14.5, 30.5, 60.5, np.inf]
+ETIQUETAS_ANTICIPACION = ["Mismo día", "1 día", "2-3 días", "4-7 días", "8-14 días", "15-30 días", "31-60 días",
+                          "> 60 días"]
+
+
+# --- Tipado columnar ---
+def tabla_citas(filas, hoy=None):
+    """DataFrame tipado de citas a partir de filas de texto (orden de ENCABEZADOS_CITAS)."""
+    ancho = len(ENCABEZADOS_CITAS)
+    df = pd.DataFrame(filas)
+    for j in range(df.shape[1], ancho): # Filas antiguas sin las últimas columnas
+        df[j] = ""
+    df = df.iloc[:, :ancho].set_axis(ENCABEZADOS_CITAS, axis=1).fillna("")
+    hoy = pd.Timestamp(hoy or pd.Timestamp.today().normalize())
+
+    fecha = pd.to_datetime(df["Fecha"], format="%Y-%m-%d", errors="coerce")
+    registro = pd.to_datetime(df["Fecha_Registro"], format="%Y-%m-%d", errors="coerce")
+    # Texto repetido (horas, estados): se parsea por categoría y se expande por código
+    horas = df["Hora"].astype("category")
+    valores_hora = pd.to_numeric(horas.cat.categories.str.extract(r"^\s*(\d{1,2})", expand=False), errors="coerce")
+    hora = pd.Series(np.append(np.asarray(valores_hora, dtype="float64"), np.nan)[horas.cat.codes.to_numpy()])
+    estado = df["Estado"].str.strip().str.lower().astype("category")
+    clases = np.array([CLASES_ESTADO.get(e, "pendiente") for e in estado.cat.categories] + ["pendiente"])
+    clase = clases[estado.cat.codes.to_numpy()]
+    dia = fecha.dt.dayofweek.fillna(-1).astype("int8")
+    bloque = np.select([(hora >= 5) & (hora < 12), (hora >= 12) & (hora < 18), hora.notna()], [0, 1, 2], -1)
+    pasada = (fecha < hoy).to_numpy()
+
+    return pd.DataFrame({
+        "ID_Cita": df["ID_Cita"],
+        "ID_Paciente": df["ID_Paciente"].astype("category"),
+        "Fecha": fecha,
+        "Fecha_Registro": registro,
+        "Hora": hora.astype("float32"),
+        "Dia_Semana": pd.Categorical.from_codes(dia, DIAS_SEMANA, ordered=True),
+        "Hora_Bloque": pd.Categorical.from_codes(bloque, BLOQUES_HORA, ordered=True),
+        "Medico": df["Medico"].astype("category"),
+        "Especialidad": df["Especialidad"].astype("category"),
+        "Estado": estado,
+        "Cancelada": clase == "cancelada",
+        "No_Show": clase == "no_show",
+        # Cita ya ocurrida y no cancelada: base de la tasa de no-show
+        "Cerrada": pasada & (clase != "cancelada"),
+        "Anticipacion_Dias": (fecha - registro).dt.days.astype("float32"),
+    })
+
+
+def tabla_pacientes(filas):
+    df = pd.DataFrame([f[:5] for f in filas], columns=["ID_Paciente", "Nombre", "DNI", "Telefono", "Email"]).fillna("")
+    return pd.DataFrame({"ID_Paciente": df["ID_Paciente"].astype("category"), "DNI": df["DNI"].astype("string")})
+
+
+# --- Agregados ---
+def _tasa(numerador, denominador):
+    return (numerador / denominador.where(denominador > 0)).round(3)
+
+
+def resumen_medicos(citas):
+    """Por médico: volumen, cancelaciones, no-shows y ocupación de los días con agenda."""
+    g = citas.groupby("Medico", observed=True)
+    res = pd.DataFrame({
+        "Especialidad": g["Especialidad"].first(),
+        "Citas": g.size(),
+        "Canceladas": g["Cancelada"].sum(),
+        "Cerradas": g["Cerrada"].sum(),
+        "No_Shows": g["No_Show"].sum(),
+        "Dias_Con_Citas": g["Fecha"].nunique(),
+    })
+    res["Tasa_Cancelacion"] = _tasa(res["Canceladas"], res["Citas"])
+    res["Tasa_No_Show"] = _tasa(res["No_Shows"], res["Cerradas"])
+    res["Ocupacion"] = _tasa(res["Citas"] - res["Canceladas"], res["Dias_Con_Citas"] * CUPOS_DIA_MEDICO)
+    return res.sort_values("Citas", ascending=False).reset_index()
+
+
+def noshow_por_dia_bloque(citas):
+    """Tasa de no-show (citas cerradas) por día de la semana x bloque horario."""
+    cerradas = citas[citas["Cerrada"]]
+    tabla = cerradas.pivot_table(index="Dia_Semana", columns="Hora_Bloque", values="No_Show", aggfunc="mean",
+                                 observed=False, dropna=False).round(3)
+    tabla.columns = [str(c) for c in tabla.columns]
+    return tabla.reset_index()
+
+
+def distribucion_anticipacion(citas):
+    """Citas por tramo de anticipación (días entre registro y cita) y mediana/p90 por especialidad."""
+    con_registro = citas[citas["Anticipacion_Dias"] >= 0]
+    tramo = pd.cut(con_registro["Anticipacion_Dias"], TRAMOS_ANTICIPACION, labels=ETIQUETAS_ANTICIPACION)
+    tabla = pd.crosstab(con_registro["Especialidad"], tramo, dropna=False)
+    g = con_registro.groupby("Especialidad", observed=True)["Anticipacion_Dias"]
+    tabla["Mediana_Dias"] = g.median()
+    tabla["P90_Dias"] = g.quantile(0.9)
+    tabla.columns = [str(c) for c in tabla.columns]
+    return tabla.reset_index()
+
+
+def indicadores(citas, pacientes):
+    hoy = pd.Timestamp.today().normalize()
+    proximas = citas[(citas["Fecha"] >= hoy) & (citas["Fecha"] < hoy + pd.Timedelta(days=30)) & ~citas["Cancelada"]]
+    return {
+        "citas": int(len(citas)),
+        "tasa_cancelacion": round(float(citas["Cancelada"].mean()), 3) if len(citas) else None,
+        "tasa_no_show": round(float(citas.loc[citas["Cerrada"], "No_Show"].mean()), 3) if citas["Cerrada"].any() else None,
+        "pacientes": int(len(pacientes)),
+        "pacientes_con_citas": int(citas["ID_Paciente"].nunique()),
+        "desde": None if citas["Fecha"].isna().all() else str(citas["Fecha"].min().date()),
+        "hasta": None if citas["Fecha"].isna().all() else str(citas["Fecha"].max().date()),
+        "proximos_30_dias": int(len(proximas)),
+    }
+
+
+AGREGADOS = {
+    "medicos": lambda s: resumen_medicos(s.citas),
+    "noshow_dia_bloque": lambda s: noshow_por_dia_bloque(s.citas),
+    "anticipacion": lambda s: distribucion_anticipacion(s.citas),
+    "indicadores": lambda s: indicadores(s.citas, s.pacientes),
+}
+
+
+class InstantaneaAnalitica:
+    """Tablas tipadas de una versión de los datos y sus agregados (calculados una vez)."""
+
+    def __init__(self, citas, pacientes, version):
+        self.citas = citas
+        self.pacientes = pacientes
+        self.version = version
+        self._cache = {}
+        self._lock = threading.Lock()
+
+    def agregado(self, nombre):
+        with self._lock:
+            if nombre not in self._cache:
+                with span(f"analitica.{nombre}"):
+                    self._cache[nombre] = AGREGADOS[nombre](self)
+            return self._cache[nombre]
+
+
+# --- Fuentes y versión ---
+def _version_archivo():
+    indice = leer_indice()
+    return (indice.get("actualizado"), sum(p.get("filas", 0) for p in indice.get("particiones", {}).values()))
+
+
+def _version_y_lectores():
+    """
+    (versión, función que devuelve (filas de citas, filas de pacientes)).
+    Con el espejo (sincronizacion.py) la versión es la suya y leer no cuesta
+    llamadas; si no, la marca de modificación de las hojas (o un TTL).
+    """
+    from sincronizacion import espejo_cargado, marca_remota
+    espejo_citas, espejo_pacientes = espejo_cargado("Citas"), espejo_cargado("Pacientes")
+    if espejo_citas is not None and espejo_pacientes is not None:
+        version = ("espejo", espejo_citas.version, espejo_pacientes.version, _version_archivo())
+        return version, lambda: (espejo_citas.filas(), espejo_pacientes.filas())
+
+    import flujo_agendamiento as flujo
+    hojas = (flujo.citas_sheet, flujo.pacientes_sheet)
+    marcas = tuple(marca_remota(h) if h is not None else None for h in hojas)
+    if any(m is None for m in marcas):
+        marcas = ("ttl", int(time.time() // ANALITICA_TTL_S))
+    return ("hojas",) + marcas + (_version_archivo(),), lambda: tuple(
+        (h.get_all_values()[1:] if h is not None else []) for h in hojas)
+
+
+_instantanea = None
+_lock_instantanea = threading.Lock()
+
+
+def obtener_instantanea():
+    """La instantánea vigente; se reconstruye solo si cambió la versión de los datos."""
+    global _instantanea
+    version, leer = _version_y_lectores()
+    with _lock_instantanea:
+        if _instantanea is None or _instantanea.version != version:
+            with span("analitica.instantanea"):
+                filas_citas, filas_pacientes = leer()
+                # Archivo primero: si una cita está en los dos sitios, manda la de la hoja
+                citas = tabla_citas(list(filas_archivadas()) + list(filas_citas))
+                citas = citas.drop_duplicates("ID_Cita", keep="last").reset_index(drop=True)
+                _instantanea = InstantaneaAnalitica(citas, tabla_pacientes(filas_pacientes), version)
+            registrar("analitica_instantanea", modulo="analitica", citas=len(citas),
+                      memoria_mb=round(citas.memory_usage(deep=True).sum() / 2**20, 1))
+        return _instantanea
+
+
+def tablero():
+    """(resumen en Markdown, por médico, no-show por día/bloque, anticipación) para la pestaña Analítica."""
+    inst = obtener_instantanea()
+    k = inst.agregado("indicadores")
+    porcentaje = lambda v: "—" if v is None else f"{v:.1%}"
+    resumen = (f"**{k['citas']:,} citas** ({k['desde']} → {k['hasta']}) · "
+               f"cancelación {porcentaje(k['tasa_cancelacion'])} · no-show {porcentaje(k['tasa_no_show'])} · "
+               f"{k['pacientes_con_citas']:,} de {k['pacientes']:,} pacientes con citas · "
+               f"{k['proximos_30_dias']:,} citas en los próximos 30 días")
+    return resumen, inst.agregado("medicos"), inst.agregado("noshow_dia_bloque"), inst.agregado("anticipacion")
@@ -0,0 +1,214 @@
+# ============================================================
+# 🔌 API JSON (junto a la interfaz Gradio)
+# ============================================================
+# Las mismas operaciones que la interfaz, como JSON y sin el protocolo de
+# eventos de Gradio, para la central telefónica y los recordatorios. Usa los
+# mismos modelos y hojas del proceso, los pools de ejecutores.py y la
+# admisión de planificador.py (cola llena -> 503). Las variantes /lote
+# reciben listas: leen cada hoja una vez, escriben con append_rows /
+# batch_update y pasan los textos por nlp.pipe. Todas se enrutan por sede
+# (shards.py): los lotes se reparten por médico o por el índice DNI, con una
+# llamada por sede.
+import asyncio
+import os
+from typing import List, Optional
+
+from fastapi import APIRouter, HTTPException, Query
+from pydantic import BaseModel, Field
+
+from chatbot_logic import predecir_noshow, predecir_noshow_lote
+from ejecutores import EJECUTOR_IO, EJECUTOR_ML, EJECUTOR_NLP, en_pool
+import perfilador
+from planificador import ColaLlena, planificador
+from procesador_nlp import procesar_texto, procesar_textos
+from shards import agendar, agendar_lote, cancelar_cita, cancelar_citas_lote, consultar_citas, consultar_citas_lote
+from trazas import peticion
+
+MAX_LOTE = int(os.environ.get("API_MAX_LOTE", 500))
+
+router = APIRouter(prefix="/api", tags=["citas"])
+
+
+# --- Modelos de entrada ---
+class Cita(BaseModel):
+    nombre: str
+    dni: str
+    telefono: str
+    email: str
+    fecha: str = Field(description="AAAA-MM-DD")
+    hora: str = Field(description="HH:MM")
+    medico: str
+
+
+class LoteCitas(BaseModel):
+    citas: List[Cita] = Field(max_length=MAX_LOTE)
+    predecir: bool = True
+
+
+class Cancelacion(BaseModel):
+    dni: str
+    fecha: str
+
+
+class LoteCancelaciones(BaseModel):
+    citas: List[Cancelacion] = Field(max_length=MAX_LOTE)
+
+
+class LoteDNI(BaseModel):
+    dnis: List[str] = Field(max_length=MAX_LOTE)
+
+
+class CitaPrediccion(BaseModel):
+    fecha: str
+    hora: str
+
+
+class LotePrediccion(BaseModel):
+    citas: List[CitaPrediccion] = Field(max_length=MAX_LOTE)
+
+
+class Texto(BaseModel):
+    texto: str
+
+
+class LoteTextos(BaseModel):
+    textos: List[str] = Field(max_length=MAX_LOTE)
+
+
+# --- Ejecución ---
+async def _ejecutar(nombre_pool, ejecutor, funcion, *args, **kwargs):
+    """Admite la petición en su pool del planificador y ejecuta 'funcion' en el ejecutor."""
+    try:
+        await planificador.adquirir(nombre_pool)
+    except ColaLlena as e:
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": "5"})
+    try:
+        return await en_pool(ejecutor, funcion, *args, **kwargs)
+    finally:
+        planificador.liberar(nombre_pool)
+
+
+def _resultado_agendar(mensaje, prob=None):
+    return {"exito": str(mensaje).startswith("¡Éxito!"), "mensaje": mensaje, "prob_noshow": prob}
+
+
+def _resultado_consulta(dni, resultado):
+    if isinstance(resultado, list):
+        return {"dni": dni, "citas": resultado}
+    return {"dni": dni, "citas": [], "mensaje": resultado}
+
+
+# --- Agendar ---
+@router.post("/agendar")
+async def api_agendar(cita: Cita, predecir: bool = True):
+    with peticion("api.agendar"):
+        # La predicción no depende de la escritura: se lanzan a la vez
+        tarea_prob = asyncio.ensure_future(
+            _ejecutar("nlp", EJECUTOR_ML, predecir_noshow, cita.fecha, cita.hora)) if predecir else None
+        try:
+            mensaje = await _ejecutar("io", EJECUTOR_IO, agendar, cita.nombre, cita.dni, cita.telefono, cita.email,
+                                      cita.fecha, cita.hora, cita.medico)
+        finally:
+            prob = await tarea_prob if tarea_prob else None
+        resultado = _resultado_agendar(mensaje)
+        if resultado["exito"] and prob is not None:
+            resultado["prob_noshow"] = float(prob)
+        return resultado
+
+
+@router.post("/agendar/lote")
+async def api_agendar_lote(lote: LoteCitas):
+    with peticion("api.agendar_lote"):
+        mensajes = await _ejecutar("io", EJECUTOR_IO, agendar_lote, [c.model_dump() for c in lote.citas])
+        probs = [None] * len(mensajes)
+        if lote.predecir:
+            probs = await _ejecutar("nlp", EJECUTOR_ML, predecir_noshow_lote, [(c.fecha, c.hora) for c in lote.citas])
+        resultados = [_resultado_agendar(m) for m in mensajes]
+        for resultado, prob in zip(resultados, probs):
+            if resultado["exito"]:
+                resultado["prob_noshow"] = prob
+        return {"resultados": resultados}
+
+
+# --- Consultar ---
+@router.get("/citas/{dni}")
+async def api_consultar(dni: str, incluir_historial: bool = False):
+    with peticion("api.consultar"):
+        return _resultado_consulta(dni, await _ejecutar("io", EJECUTOR_IO, consultar_citas, dni, incluir_historial))
+
+
+@router.post("/citas/lote")
+async def api_consultar_lote(lote: LoteDNI):
+    with peticion("api.consultar_lote"):
+        resultados = await _ejecutar("io", EJECUTOR_IO, consultar_citas_lote, lote.dnis)
+        return {"resultados": [_resultado_consulta(dni, resultados[dni]) for dni in lote.dnis]}
+
+
+# --- Cancelar ---
+@router.post("/cancelar")
+async def api_cancelar(cancelacion: Cancelacion):
+    with peticion("api.cancelar"):
+        mensaje = await _ejecutar("io", EJECUTOR_IO, cancelar_cita, cancelacion.dni, cancelacion.fecha)
+        return {"exito": str(mensaje).startswith("Éxito"), "mensaje": mensaje}
+
+
+@router.post("/cancelar/lote")
+async def api_cancelar_lote(lote: LoteCancelaciones):
+    with peticion("api.cancelar_lote"):
+        mensajes = await _ejecutar("io", EJECUTOR_IO, cancelar_citas_lote, [(c.dni, c.fecha) for c in lote.citas])
+        return {"resultados": [{"exito": str(m).startswith("Éxito"), "mensaje": m} for m in mensajes]}
+
+
+# --- Modelos ---
+@router.post("/predecir_noshow")
+async def api_predecir_noshow(cita: CitaPrediccion):
+    with peticion("api.predecir_noshow"):
+        prob = await _ejecutar("nlp", EJECUTOR_ML, predecir_noshow, cita.fecha, cita.hora)
+        return {"prob_noshow": None if prob is None else float(prob)}
+
+
+@router.post("/predecir_noshow/lote")
+async def api_predecir_noshow_lote(lote: LotePrediccion):
+    with peticion("api.predecir_noshow_lote"):
+        probs = await _ejecutar("nlp", EJECUTOR_ML, predecir_noshow_lote, [(c.fecha, c.hora) for c in lote.citas])
+        return {"prob_noshow": probs}
+
+
+@router.post("/procesar_texto")
+async def api_procesar_texto(entrada: Texto):
+    with peticion("api.procesar_texto"):
+        intencion, entidades = await _ejecutar("nlp", EJECUTOR_NLP, procesar_texto, entrada.texto)
+        return {"intencion": intencion, "entidades": entidades}
+
+
+@router.post("/procesar_texto/lote")
+async def api_procesar_textos(lote: LoteTextos):
+    with peticion("api.procesar_texto_lote"):
+        resultados = await _ejecutar("nlp", EJECUTOR_NLP, procesar_textos, lote.textos)
+        return {"resultados": [{"intencion": i, "entidades": e} for i, e in resultados]}
+
+
+# --- Estado ---
+@router.get("/estado")
+async def api_estado():
+    """Ocupación de los pools del planificador."""
+    return {"pools": planificador.estado()}
+
+
+# --- Perfilador (admin) ---
+@router.get("/perfilador")
+async def api_perfilador():
+    """Si está capturando, umbral de captura automática y últimos perfiles."""
+    return perfilador.estado()
+
+
+@router.post("/perfilador")
+async def api_perfilador_activar(segundos: float = Query(300, gt=0, le=3600)):
+    perfilador.activar(segundos)
+    return perfilador.estado()
+
+
+@router.delete("/perfilador")
+async def api_perfilador_desactivar():
+    perfilador.desactivar()
+    return perfilador.estado()
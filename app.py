@@ -9,7 +9,8 @@ import joblib
 import gspread
 import tempfile
 import scipy.io.wavfile as wavfile
-from datetime import date
+from datetime import date, datetime
+import time
 import os 
 import re 
 from TTS.api import TTS 
@@ -40,14 +41,11 @@ except Exception as e:
 # --- flujo_agendamiento ---
 try:
     from flujo_agendamiento import (
-        agendar,
-        consultar_citas,
-        cancelar_cita,
         obtener_medicos,
         pacientes_sheet,
-        citas_sheet,
-        buscar_paciente_por_dni
+        citas_sheet
     )
+    from shards import agendar, consultar_citas, cancelar_cita, buscar_paciente_por_dni
     flujo_cargado = True
     print("✅ Módulos CRUD y búsqueda cargados.")
 except ImportError as e:
@@ -65,7 +63,7 @@ except ImportError as e:
 
 # --- chatbot_logic ---
 try:
-    from chatbot_logic import responder_chatbot, predecir_noshow
+    from chatbot_logic import responder_chatbot, responder_chatbot_async, predecir_noshow
     chatbot_cargado = True
     print("✅ Módulo 'chatbot_logic.py' cargado.")
 except ImportError as e:
@@ -73,12 +71,52 @@ except ImportError as e:
     chatbot_cargado = False
 
     def responder_chatbot(m, h, s): return f"Error importación chatbot_logic: {e}", {}
+    async def responder_chatbot_async(m, h, s): return responder_chatbot(m, h, s)
     def predecir_noshow(f, h): return None
 
 
+# --- pools de ejecución (handlers async) ---
+from ejecutores import EJECUTOR_TTS, EJECUTOR_STT, en_pool
+
+
+# --- trazas (latencia por etapa, /metrics y logs JSON) ---
+import uuid
+from trazas import peticion, trazado, registrar, observar, exportar_prometheus
+
+# --- perfilador (PERFILAR=1, interruptor de admin o peticiones lentas) ---
+import perfilador
+from perfilador import perfilado
+
+
+# --- planificador (pool, límite y cola por tipo de evento) ---
+from planificador import planificador
+
+
+# --- espejo local de las hojas (sincronización incremental) ---
+# Con ESPEJO_SHEETS=1 la pestaña Datos lee del espejo (sincronizacion.py), que
+# sigue los cambios hechos a mano en la hoja sin volver a descargarla entera.
+ESPEJO_SHEETS = os.environ.get("ESPEJO_SHEETS") == "1"
+if ESPEJO_SHEETS:
+    # Al arrancar (antes del fork en servidor.py): desde la instantánea si existe (ESPEJO_INSTANTANEA).
+    # En el maestro de servidor.py solo se cargan: cada worker arranca su sondeo (iniciar_sondeo)
+    from sincronizacion import espejo
+    sondear = os.environ.get("SERVIDOR_PRECARGA") != "1"
+    espejo("Pacientes", iniciar=sondear)
+    espejo("Citas", iniciar=sondear)
+
+
+# --- sesiones (estado de conversación en el servidor) ---
+from sesiones import AlmacenSesiones
+almacen_sesiones = AlmacenSesiones()
+
+
+# --- analítica (instantánea columnar, agregados en caché por versión de datos) ---
+from analitica import tablero as tablero_analitica
+
+
 # --- transcriptor ---
 try:
-    from transcriptor import transcribir_audio
+    from transcriptor import transcribir_audio, transcribir_array
     stt_cargado = True
     print("✅ Módulo 'transcriptor.py' cargado.")
 except ImportError:
@@ -87,6 +125,7 @@ except ImportError:
 
     def transcribir_audio_placeholder(audio): return "[Transcripción no disponible]"
     transcribir_audio = transcribir_audio_placeholder
+    def transcribir_array(audio, sample_rate): return "[Transcripción no disponible]"
 
 
 # ============================================================
@@ -146,14 +185,16 @@ def cargar_datos_gsheets():
     df_citas = pd.DataFrame(columns=default_cols_citas)
 
     try:
-        if pacientes_sheet:
-            vals = pacientes_sheet.get_all_values()
-            if len(vals) > 1:
-                df_pacientes = pd.DataFrame(vals[1:], columns=vals[0])
-        if citas_sheet:
-            vals = citas_sheet.get_all_values()
-            if len(vals) > 1:
-                df_citas = pd.DataFrame(vals[1:], columns=vals[0])
+        if ESPEJO_SHEETS:
+            vals_pacientes = espejo("Pacientes").filas(con_encabezado=True)
+            vals_citas = espejo("Citas").filas(con_encabezado=True)
+        else:
+            vals_pacientes = pacientes_sheet.get_all_values() if pacientes_sheet else []
+            vals_citas = citas_sheet.get_all_values() if citas_sheet else []
+        if len(vals_pacientes) > 1:
+            df_pacientes = pd.DataFrame(vals_pacientes[1:], columns=vals_pacientes[0])
+        if len(vals_citas) > 1:
+            df_citas = pd.DataFrame(vals_citas[1:], columns=vals_citas[0])
     except Exception as e:
         print(f"❌ app.py: Error al leer GSheets para tabla: {e}")
 
@@ -165,6 +206,41 @@ def cargar_datos_gsheets():
 # 🧩 Wrappers
 # ============================================================
 
+def estado_perfilador():
+    """Resumen en Markdown del perfilador y sus últimas capturas."""
+    e = perfilador.estado()
+    if e["activo"]:
+        lineas = [f"🔴 **Capturando** ({'sin límite' if e['restante_s'] is None else str(e['restante_s']) + ' s restantes'})"]
+    else:
+        lineas = ["⚪ Apagado"]
+    if e["umbral_lenta_s"]:
+        lineas[0] += f" · captura automática de llamadas de más de {e['umbral_lenta_s']:g} s"
+    lineas += [f"- `{p['archivo']}` · {p['funcion']} ({p['disparador']}) · {p['duracion_s']} s · {p['muestras']} muestras"
+               for p in e["recientes"]]
+    return "\n".join(lineas + [f"\nPerfiles en `{e['directorio']}` (pilas plegadas para flamegraph/speedscope)."])
+
+
+def activar_perfilador():
+    perfilador.activar(300)
+    return estado_perfilador()
+
+
+def desactivar_perfilador():
+    perfilador.desactivar()
+    return estado_perfilador()
+
+
+def listar_sesiones():
+    """Sesiones de chat en memoria (campos llenos, no sus valores)."""
+    filas = almacen_sesiones.listar()
+    for f in filas:
+        f["slots"] = ", ".join(f["slots"])
+        f["inactiva_s"] = round(time.time() - f.pop("actualizado"))
+        f["creado"] = datetime.fromtimestamp(f["creado"]).strftime("%H:%M:%S")
+    return pd.DataFrame(filas, columns=["id", "intent", "campo_preguntado", "slots", "creado", "inactiva_s"])
+
+
+@perfilado("agendar_manual_y_predecir")
 def agendar_manual_y_predecir(nombre, dni, telefono, email, fecha_str, hora_str, medico):
     """Agendar cita y mostrar predicción de no-show."""
     res = agendar(nombre, dni, telefono, email, fecha_str, hora_str, medico)
@@ -188,6 +264,7 @@ def consultar_citas_gradio(dni):
     return str(resultado)
 
 
+@trazado("generar_audio_respuesta")
 def generar_audio_respuesta(texto_respuesta):
     """Genera un archivo WAV a partir del texto usando TTS."""
     if not tts_cargado or not texto_respuesta or texto_respuesta.startswith("❌"):
@@ -195,18 +272,31 @@ def generar_audio_respuesta(texto_respuesta):
     try:
         with tempfile.NamedTemporaryFile(suffix=".wav", delete=False) as temp_audio_file:
             tts_model.tts_to_file(text=texto_respuesta, file_path=temp_audio_file.name)
-            print(f"🔊 Audio de respuesta generado en: {temp_audio_file.name}")
             return temp_audio_file.name
     except Exception as e:
-        print(f"❌ Error al generar audio TTS: {e}")
+        registrar("error_tts", nivel="error", modulo="app", error=str(e))
+        return None
+
+@trazado("generar_audio_respuesta")
+def sintetizar_voz(texto_respuesta):
+    """Como generar_audio_respuesta, pero devuelve (sample_rate, array) en memoria, sin WAV temporal."""
+    if not tts_cargado or not texto_respuesta or texto_respuesta.startswith("❌"):
+        return None
+    try:
+        muestras = tts_model.tts(text=texto_respuesta)
+        return tts_model.synthesizer.output_sample_rate, np.asarray(muestras, dtype=np.float32)
+    except Exception as e:
+        registrar("error_tts", nivel="error", modulo="app", error=str(e))
         return None
 
+
 # ============================================================
 # 🧠 Interfaz Gradio
 # ============================================================
 
 with gr.Blocks(theme=gr.themes.Soft(), title="Plataforma de Citas v2") as demo:
-    estado_conversacion = gr.State({})
+    # Solo el id de sesión viaja con cada evento; el estado vive en almacen_sesiones
+    estado_conversacion = gr.State(None)
 
     gr.Markdown("# 🤖 Plataforma de Citas por Voz y Chat (Sprint 4)")
 
@@ -243,59 +333,131 @@ with gr.Blocks(theme=gr.themes.Soft(), title="Plataforma de Citas v2") as demo:
             with gr.Row():
                 btn_procesar_audio = gr.Button("Procesar Audio", variant="secondary", scale=1)
                 btn_enviar_texto = gr.Button("Enviar", variant="primary", scale=1)
+                btn_turno_voz = gr.Button("Hablar (voz → respuesta)", variant="primary", scale=1)
+
+            lbl_latencia_voz = gr.Markdown()
 
         # --- Funciones internas ---
-        def manejar_texto(mensaje, historial, estado):
+        # Handler async: mientras se espera a spaCy, Sheets o TTS (cada uno en su
+        # pool, ver ejecutores.py) el proceso sigue atendiendo otras conversaciones.
+        @perfilado("manejar_texto")
+        async def manejar_texto(mensaje, historial, id_sesion):
             audio_gen = None 
             
             if not mensaje:
-                return historial, estado, gr.update(value=""), None
+                return historial, id_sesion, gr.update(value=""), None
             
             if not chatbot_cargado:
                 respuesta = "❌ Chatbot no cargado."
                 audio_gen = None
             else:
-                respuesta, nuevo_estado = responder_chatbot(mensaje, historial, estado)
-                audio_gen = generar_audio_respuesta(respuesta) 
+                with peticion("turno_chat"):
+                    id_sesion = id_sesion or almacen_sesiones.nueva_sesion()
+                    estado = almacen_sesiones.obtener(id_sesion)
+                    respuesta, nuevo_estado = await responder_chatbot_async(mensaje, historial, estado)
+                    almacen_sesiones.guardar(id_sesion, nuevo_estado)
+                    audio_gen = await en_pool(EJECUTOR_TTS, generar_audio_respuesta, respuesta)
 
-            return historial + [[mensaje, respuesta]], nuevo_estado, gr.update(value=""), audio_gen
+            return historial + [[mensaje, respuesta]], id_sesion, gr.update(value=""), audio_gen
 
+        @perfilado("procesar_audio_a_textbox")
         def procesar_audio_a_textbox(audio_array):
             if audio_array is None or len(audio_array) == 0:
-                print("❌ No se recibió audio (array vacío).")
+                registrar("audio_vacio", nivel="warning", modulo="app")
                 return gr.update(value="[No se grabó audio]")
             try:
                 sample_rate, audio_data = audio_array
                 duration = len(audio_data) / sample_rate
-                print(f"📊 Audio recibido: sample_rate={sample_rate}, duración={duration:.2f}s, tamaño_array={len(audio_data)}")
+                registrar("audio_recibido", modulo="app", sample_rate=sample_rate, duracion_s=round(duration, 2))
 
                 if duration < 1.0:
-                    print("⚠️ Audio demasiado corto (<1s), no se transcribe.")
+                    registrar("audio_corto", nivel="warning", modulo="app", duracion_s=round(duration, 2))
                     return gr.update(value="[Audio demasiado corto, graba más tiempo]")
 
-                with tempfile.NamedTemporaryFile(suffix=".wav", delete=False) as temp_file:
-                    temp_path = temp_file.name
-                    wavfile.write(temp_path, sample_rate, audio_data.astype(np.int16))
-
-                texto = transcribir_audio(temp_path).strip()
+                with peticion("transcripcion"):
+                    texto = transcribir_array(audio_data, sample_rate).strip()
                 if not texto:
                     texto = "[No se reconoció voz]"
-                print(f"📝 Transcripción obtenida: {texto}")
 
-                os.unlink(temp_path)
                 return gr.update(value=texto)
 
             except Exception as e:
-                print(f"❌ Error en procesamiento de audio: {e}")
+                registrar("error_audio", nivel="error", modulo="app", error=str(e))
                 return gr.update(value="[Error al procesar audio]")
 
+        async def manejar_voz(audio_array, historial, id_sesion):
+            """
+            Turno de voz completo en una sola acción: STT -> chatbot -> TTS.
+            Todo pasa en memoria (sin WAV temporales) y cada etapa se envía a la
+            interfaz en cuanto está lista: transcripción, texto de respuesta y audio.
+            """
+            inicio = time.perf_counter()
+            # Un generador puede reanudarse en otro contexto entre 'yield': cada etapa
+            # abre su propia petición con el mismo id en vez de un 'with' que las abarque.
+            id_turno = uuid.uuid4().hex[:12]
+            historial = historial or []
+            if audio_array is None or len(audio_array) == 0 or len(audio_array[1]) == 0:
+                yield historial, id_sesion, None, "❌ No se grabó audio."
+                return
+            sample_rate, audio_data = audio_array
+            if len(audio_data) / sample_rate < 1.0:
+                yield historial, id_sesion, None, "⚠️ Audio demasiado corto, graba más tiempo."
+                return
+
+            # 1. Voz -> texto
+            with peticion("turno_voz.stt", id_turno):
+                texto = (await en_pool(EJECUTOR_STT, transcribir_array, audio_data, sample_rate)).strip()
+            t_stt = time.perf_counter()
+            if not texto or texto.startswith(("⚠️", "❌")):
+                yield historial, id_sesion, None, texto or "[No se reconoció voz]"
+                return
+            historial = historial + [[texto, None]]
+            yield historial, id_sesion, None, f"STT {t_stt - inicio:.2f}s"
+
+            # 2. Texto -> respuesta
+            if not chatbot_cargado:
+                respuesta = "❌ Chatbot no cargado."
+            else:
+                with peticion("turno_voz.chatbot", id_turno):
+                    id_sesion = id_sesion or almacen_sesiones.nueva_sesion()
+                    estado = almacen_sesiones.obtener(id_sesion)
+                    respuesta, nuevo_estado = await responder_chatbot_async(texto, historial[:-1], estado)
+                    almacen_sesiones.guardar(id_sesion, nuevo_estado)
+            t_chat = time.perf_counter()
+            historial[-1][1] = respuesta
+            yield historial, id_sesion, None, f"STT {t_stt - inicio:.2f}s · Chatbot {t_chat - t_stt:.2f}s"
+
+            # 3. Respuesta -> voz
+            with peticion("turno_voz.tts", id_turno):
+                audio = await en_pool(EJECUTOR_TTS, sintetizar_voz, respuesta)
+            t_fin = time.perf_counter()
+            observar("turno_voz", t_fin - inicio)
+            resumen = (f"STT {t_stt - inicio:.2f}s · Chatbot {t_chat - t_stt:.2f}s · "
+                       f"TTS {t_fin - t_chat:.2f}s · **Total {t_fin - inicio:.2f}s**")
+            registrar("turno_voz", modulo="app", id_peticion=id_turno, stt_s=round(t_stt - inicio, 3),
+                      chatbot_s=round(t_chat - t_stt, 3), tts_s=round(t_fin - t_chat, 3), total_s=round(t_fin - inicio, 3))
+            yield historial, id_sesion, audio, resumen
+
         # --- Conexiones ---
-        btn_procesar_audio.click(fn=procesar_audio_a_textbox, inputs=[audio_input], outputs=[entrada_texto])
+        # Cada evento pasa por su pool del planificador (voz, nlp, io, admin); el límite de
+        # Gradio por evento se quita para que sea el planificador quien decide
+        btn_procesar_audio.click(fn=planificador.en_pool("voz")(procesar_audio_a_textbox), inputs=[audio_input],
+                                 outputs=[entrada_texto], concurrency_limit=None)
+
+        # Turno de voz en un paso: al terminar de grabar (o con el botón)
+        salidas_voz = [chatbot, estado_conversacion, audio_respuesta, lbl_latencia_voz]
+        audio_input.stop_recording(fn=planificador.en_pool("voz")(manejar_voz), inputs=[audio_input, chatbot, estado_conversacion],
+                                   outputs=salidas_voz, concurrency_limit=None)
+        btn_turno_voz.click(fn=planificador.en_pool("voz")(manejar_voz), inputs=[audio_input, chatbot, estado_conversacion],
+                            outputs=salidas_voz, concurrency_limit=None)
         
-        btn_enviar_texto.click(fn=manejar_texto, inputs=[entrada_texto, chatbot, estado_conversacion],
-                               outputs=[chatbot, estado_conversacion, entrada_texto, audio_respuesta])
-        entrada_texto.submit(fn=manejar_texto, inputs=[entrada_texto, chatbot, estado_conversacion],
-                             outputs=[chatbot, estado_conversacion, entrada_texto, audio_respuesta])
+        # Sin límite de Gradio por evento: la concurrencia real la acotan los pools
+        btn_enviar_texto.click(fn=planificador.en_pool("nlp")(manejar_texto), inputs=[entrada_texto, chatbot, estado_conversacion],
+                               outputs=[chatbot, estado_conversacion, entrada_texto, audio_respuesta],
+                               concurrency_limit=None)
+        entrada_texto.submit(fn=planificador.en_pool("nlp")(manejar_texto), inputs=[entrada_texto, chatbot, estado_conversacion],
+                             outputs=[chatbot, estado_conversacion, entrada_texto, audio_respuesta],
+                             concurrency_limit=None)
    
     # --------------------------------------------------------
     # 📱 NUEVA PESTAÑA S4-02: QR de Confirmación
@@ -315,9 +477,10 @@ with gr.Blocks(theme=gr.themes.Soft(), title="Plataforma de Citas v2") as demo:
         qr_output_msg = gr.Label(label="Mensaje de Estado")
 
         btn_generar_qr.click(
-            fn=generar_qr_whatsapp,
+            fn=planificador.en_pool("io")(generar_qr_whatsapp),
             inputs=[txt_dni_qr, txt_fecha_qr, txt_hora_qr],
-            outputs=[qr_output_img, qr_output_msg]
+            outputs=[qr_output_img, qr_output_msg],
+            concurrency_limit=None
         )
 
 
@@ -333,8 +496,41 @@ with gr.Blocks(theme=gr.themes.Soft(), title="Plataforma de Citas v2") as demo:
             df_citas_display = gr.DataFrame(label="Citas (Google Sheet)")
 
         btn_actualizar_datos = gr.Button("Actualizar Tablas (desde Google Sheets)")
-        btn_actualizar_datos.click(fn=cargar_datos_gsheets, inputs=None,
-                                   outputs=[df_pacientes_display, df_citas_display])
+        btn_actualizar_datos.click(fn=planificador.en_pool("admin")(cargar_datos_gsheets), inputs=None,
+                                   outputs=[df_pacientes_display, df_citas_display], concurrency_limit=None)
+
+        with gr.Accordion("Sesiones de chat activas", open=False):
+            df_sesiones_display = gr.DataFrame(label="Sesiones (sin datos personales)")
+            btn_ver_sesiones = gr.Button("Ver Sesiones")
+            btn_ver_sesiones.click(fn=planificador.en_pool("admin")(listar_sesiones), inputs=None,
+                                   outputs=[df_sesiones_display], concurrency_limit=None)
+
+        with gr.Accordion("Perfilador (turnos lentos)", open=False):
+            md_perfilador = gr.Markdown()
+            with gr.Row():
+                btn_perfilar = gr.Button("Capturar 5 minutos")
+                btn_no_perfilar = gr.Button("Detener")
+                btn_estado_perfilador = gr.Button("Ver Capturas")
+            for boton, funcion in ((btn_perfilar, activar_perfilador), (btn_no_perfilar, desactivar_perfilador),
+                                   (btn_estado_perfilador, estado_perfilador)):
+                boton.click(fn=planificador.en_pool("admin")(funcion), inputs=None, outputs=[md_perfilador],
+                            concurrency_limit=None)
+
+    # --------------------------------------------------------
+    # 📈 PESTAÑA 3b: Analítica (ocupación / no-shows)
+    # --------------------------------------------------------
+    with gr.Tab("Analítica"):
+        gr.Markdown("### Ocupación, Cancelaciones y No-Shows")
+        gr.Markdown("Incluye el archivo histórico. Solo se recalcula si los datos cambiaron.")
+        md_indicadores = gr.Markdown()
+        btn_analitica = gr.Button("Actualizar Analítica")
+        df_medicos_display = gr.DataFrame(label="Por médico (ocupación sobre días con agenda)")
+        with gr.Row():
+            df_noshow_display = gr.DataFrame(label="Tasa de no-show por día y bloque horario")
+            df_anticipacion_display = gr.DataFrame(label="Anticipación de la reserva por especialidad")
+        btn_analitica.click(fn=planificador.en_pool("admin")(tablero_analitica), inputs=None,
+                            outputs=[md_indicadores, df_medicos_display, df_noshow_display, df_anticipacion_display],
+                            concurrency_limit=None)
 
     # --------------------------------------------------------
     # 🧪 PESTAÑA 4: Testeo (CRUD)
@@ -365,10 +561,11 @@ with gr.Blocks(theme=gr.themes.Soft(), title="Plataforma de Citas v2") as demo:
 
                 lbl_resultado_agendar = gr.Label(label="Resultado Agendar")
                 btn_agendar_test.click(
-                    fn=agendar_manual_y_predecir,
+                    fn=planificador.en_pool("io")(agendar_manual_y_predecir),
                     inputs=[txt_nombre_test, txt_dni_test, txt_telefono_test, txt_email_test,
                             txt_fecha_test, txt_hora_test, dd_medico_test],
-                    outputs=[lbl_resultado_agendar]
+                    outputs=[lbl_resultado_agendar],
+                    concurrency_limit=None
                 )
 
             # --- Consultar ---
@@ -376,9 +573,9 @@ with gr.Blocks(theme=gr.themes.Soft(), title="Plataforma de Citas v2") as demo:
                 txt_dni_consultar = gr.Textbox(label="DNI a Consultar")
                 btn_consultar_test = gr.Button("Consultar Citas", variant="secondary")
                 txt_resultado_consultar = gr.Textbox(label="Resultado Consulta", lines=5, interactive=False)
-                btn_consultar_test.click(fn=consultar_citas_gradio,
+                btn_consultar_test.click(fn=planificador.en_pool("io")(consultar_citas_gradio),
                                          inputs=[txt_dni_consultar],
-                                         outputs=[txt_resultado_consultar])
+                                         outputs=[txt_resultado_consultar], concurrency_limit=None)
 
             # --- Cancelar ---
             with gr.TabItem("Cancelar (Update)"):
@@ -386,12 +583,12 @@ with gr.Blocks(theme=gr.themes.Soft(), title="Plataforma de Citas v2") as demo:
                 txt_fecha_cancelar = gr.Textbox(label="Fecha a Cancelar", placeholder="AAAA-MM-DD")
                 btn_cancelar_test = gr.Button("Cancelar Cita", variant="stop")
                 lbl_resultado_cancelar = gr.Label(label="Resultado Cancelación")
-                btn_cancelar_test.click(fn=cancelar_cita,
+                btn_cancelar_test.click(fn=planificador.en_pool("io")(cancelar_cita),
                                         inputs=[txt_dni_cancelar, txt_fecha_cancelar],
-                                        outputs=[lbl_resultado_cancelar])
+                                        outputs=[lbl_resultado_cancelar], concurrency_limit=None)
 
     # Carga inicial de datos
-    demo.load(fn=cargar_datos_gsheets, inputs=None,
+    demo.load(fn=planificador.en_pool("admin")(cargar_datos_gsheets), inputs=None, concurrency_limit=None,
               outputs=[df_pacientes_display, df_citas_display])
 
 
@@ -399,5 +596,31 @@ with gr.Blocks(theme=gr.themes.Soft(), title="Plataforma de Citas v2") as demo:
 # 🚀 Ejecución
 # ============================================================
 
+def crear_servidor():
+    """
+    App FastAPI con la interfaz Gradio en '/', las métricas Prometheus en
+    '/metrics' y la API JSON en '/api' (ver api.py).
+    """
+    from fastapi import FastAPI
+    from fastapi.responses import PlainTextResponse
+
+    servidor = FastAPI(title="Plataforma de Citas v2")
+
+    @servidor.get("/metrics", response_class=PlainTextResponse)
+    def metricas():
+        return exportar_prometheus()
+
+    # Las rutas registradas antes de montar Gradio en '/' tienen prioridad
+    try:
+        from api import router as router_api
+        servidor.include_router(router_api)
+    except ImportError as e:
+        print(f"⚠️ ADVERTENCIA: API JSON no disponible: {e}")
+
+    # Sin límite global en la cola de Gradio: la admisión la hace planificador.py
+    return gr.mount_gradio_app(servidor, demo.queue(default_concurrency_limit=None), path="/")
+
+
 if __name__ == "__main__":
-    demo.queue().launch(server_name="0.0.0.0", server_port=7860)
+    import uvicorn
+    uvicorn.run(crear_servidor(), host="0.0.0.0", port=7860)
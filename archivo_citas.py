@@ -0,0 +1,216 @@
+# ============================================================
+# 🗄️ Archivo de Citas (hoja caliente + particiones frías por mes)
+# ============================================================
+# La hoja Citas solo conserva las citas futuras y recientes. Las citas ya
+# cerradas (canceladas, atendidas...) anteriores al corte se mueven a
+# particiones mensuales comprimidas (data/archivo_citas/citas_AAAA-MM.csv.gz)
+# y dejan de pesar en get_all_values, col_values y findall. El índice guarda
+# las particiones y el mayor ID archivado, para que generar_id no reutilice IDs.
+#
+#   python archivo_citas.py --dias 90 --simular   # Qué se movería
+#   python archivo_citas.py --dias 90             # Archivar (mejor en horario sin tráfico)
+import argparse
+import csv
+import functools
+import gzip
+import io
+import json
+import os
+import re
+from datetime import date, timedelta
+
+CARPETA_ARCHIVO = os.environ.get("ARCHIVO_CITAS_CARPETA", "data/archivo_citas")
+ARCHIVO_INDICE = "indice.json"
+DIAS_CORTE = 90
+ESTADOS_ACTIVOS = {"pendiente"} # Nunca se archivan (aunque la fecha haya pasado)
+ENCABEZADOS_CITAS = ["ID_Cita", "ID_Paciente", "Fecha", "Hora", "Medico", "Especialidad", "Estado", "Fecha_Registro"]
+COL_FECHA, COL_ESTADO = 2, 6
+
+
+# --- Índice ---
+def _ruta_indice(carpeta):
+    return os.path.join(carpeta, ARCHIVO_INDICE)
+
+
+def _escribir_atomico(ruta, contenido_bytes):
+    temporal = ruta + ".tmp"
+    with open(temporal, "wb") as f:
+        f.write(contenido_bytes)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(temporal, ruta)
+
+
+@functools.lru_cache(maxsize=4)
+def _leer_indice_cache(ruta, mtime):
+    with open(ruta, encoding="utf-8") as f:
+        return json.load(f)
+
+
+def leer_indice(carpeta=CARPETA_ARCHIVO):
+    ruta = _ruta_indice(carpeta)
+    try:
+        return _leer_indice_cache(ruta, os.path.getmtime(ruta))
+    except (FileNotFoundError, json.JSONDecodeError):
+        return {"particiones": {}, "max_id": {}}
+
+
+def max_id_archivado(prefijo, carpeta=CARPETA_ARCHIVO):
+    """Mayor número de ID archivado con ese prefijo (0 si no hay archivo)."""
+    return leer_indice(carpeta).get("max_id", {}).get(prefijo, 0)
+
+
+# --- Particiones ---
+def _mes(fecha):
+    return fecha[:7] if re.match(r"^\d{4}-\d{2}", fecha or "") else "sin_fecha"
+
+
+def _ruta_particion(carpeta, mes):
+    return os.path.join(carpeta, f"citas_{mes}.csv.gz")
+
+
+@functools.lru_cache(maxsize=24)
+def _leer_particion_cache(ruta, mtime):
+    with gzip.open(ruta, "rt", newline="", encoding="utf-8") as f:
+        filas = list(csv.reader(f))
+    return tuple(tuple(fila) for fila in filas[1:])
+
+
+def leer_particion(mes, carpeta=CARPETA_ARCHIVO):
+    ruta = _ruta_particion(carpeta, mes)
+    try:
+        return _leer_particion_cache(ruta, os.path.getmtime(ruta))
+    except FileNotFoundError:
+        return ()
+
+
+def _escribir_particion(carpeta, mes, filas_nuevas):
+    """Une las filas nuevas con las ya archivadas del mes (sin duplicar ID_Cita) y reescribe la partición."""
+    por_id = {fila[0]: fila for fila in leer_particion(mes, carpeta)}
+    for fila in filas_nuevas:
+        por_id[fila[0]] = tuple(fila)
+    filas = sorted(por_id.values(), key=lambda f: (f[COL_FECHA], f[0]))
+    texto = io.StringIO()
+    writer = csv.writer(texto)
+    writer.writerow(ENCABEZADOS_CITAS)
+    writer.writerows(filas)
+    _escribir_atomico(_ruta_particion(carpeta, mes), gzip.compress(texto.getvalue().encode("utf-8"), mtime=0))
+    return {
+        "archivo": os.path.basename(_ruta_particion(carpeta, mes)),
+        "filas": len(filas),
+        "desde": filas[0][COL_FECHA] if filas else None,
+        "hasta": filas[-1][COL_FECHA] if filas else None,
+    }
+
+
+# --- Consulta del historial ---
+def consultar_historial(id_paciente=None, desde=None, hasta=None, carpeta=CARPETA_ARCHIVO):
+    """
+    Citas archivadas (dicts con los encabezados de Citas), opcionalmente de un
+    paciente y/o entre dos fechas AAAA-MM-DD. Solo abre los meses del rango.
+    """
+    resultado = []
+    for mes in sorted(leer_indice(carpeta)["particiones"]):
+        if desde and mes != "sin_fecha" and mes < desde[:7]:
+            continue
+        if hasta and mes != "sin_fecha" and mes > hasta[:7]:
+            continue
+        for fila in leer_particion(mes, carpeta):
+            if id_paciente is not None and fila[1] != id_paciente:
+                continue
+            if (desde and fila[COL_FECHA] < desde) or (hasta and fila[COL_FECHA] > hasta):
+                continue
+            resultado.append(dict(zip(ENCABEZADOS_CITAS, fila)))
+    return resultado
+
+
+def filas_archivadas(carpeta=CARPETA_ARCHIVO):
+    """Todas las filas archivadas (tuplas en el orden de ENCABEZADOS_CITAS), mes a mes."""
+    for mes in sorted(leer_indice(carpeta)["particiones"]):
+        yield from leer_particion(mes, carpeta)
+
+
+# --- Archivado ---
+def seleccionar_archivables(filas, dias_corte=DIAS_CORTE, hoy=None):
+    """Números de fila (desde 2) de las citas cerradas con fecha anterior al corte."""
+    corte = ((hoy or date.today()) - timedelta(days=dias_corte)).isoformat()
+    seleccion = []
+    for n_fila, fila in enumerate(filas[1:], start=2):
+        if len(fila) <= COL_ESTADO or not fila[0]:
+            continue
+        if fila[COL_ESTADO].strip().lower() in ESTADOS_ACTIVOS:
+            continue
+        if re.match(r"^\d{4}-\d{2}-\d{2}$", fila[COL_FECHA]) and fila[COL_FECHA] < corte:
+            seleccion.append(n_fila)
+    return seleccion
+
+
+def _rangos_contiguos(numeros):
+    """[2, 3, 4, 7, 9, 10] -> [(9, 10), (7, 7), (2, 4)] (de abajo arriba, para borrar sin desplazar)."""
+    rangos = []
+    for n in sorted(numeros):
+        if rangos and n == rangos[-1][1] + 1:
+            rangos[-1][1] = n
+        else:
+            rangos.append([n, n])
+    return [tuple(r) for r in reversed(rangos)]
+
+
+def archivar(hoja_citas=None, dias_corte=DIAS_CORTE, hoy=None, simular=False, carpeta=CARPETA_ARCHIVO):
+    """
+    Mueve las citas cerradas anteriores al corte a las particiones frías.
+    Primero escribe el archivo (y el índice) y luego borra de la hoja: si algo
+    falla en medio, la cita queda en los dos sitios y la consulta no la duplica.
+    """
+    if hoja_citas is None:
+        import flujo_agendamiento
+        hoja_citas = flujo_agendamiento.citas_sheet
+    if hoja_citas is None:
+        raise RuntimeError("No hay hoja de Citas disponible.")
+
+    filas = hoja_citas.get_all_values()
+    seleccion = seleccionar_archivables(filas, dias_corte, hoy)
+    por_mes = {}
+    for n_fila in seleccion:
+        fila = (filas[n_fila - 1] + [""] * len(ENCABEZADOS_CITAS))[:len(ENCABEZADOS_CITAS)]
+        por_mes.setdefault(_mes(fila[COL_FECHA]), []).append(fila)
+    informe = {"filas_hoja": len(filas) - 1, "archivadas": len(seleccion),
+               "meses": {mes: len(f) for mes, f in sorted(por_mes.items())}}
+    if simular or not seleccion:
+        return informe
+
+    # 1. Particiones e índice (max_id incluye los IDs de la hoja: ninguno se reutilizará)
+    os.makedirs(carpeta, exist_ok=True)
+    indice = json.loads(json.dumps(leer_indice(carpeta))) # Copia: el de la caché no se modifica
+    for mes, filas_mes in por_mes.items():
+        indice["particiones"][mes] = _escribir_particion(carpeta, mes, filas_mes)
+    numeros = [int(f[0][1:]) for f in filas[1:] if f and re.match(r"^C\d+$", f[0])]
+    indice["max_id"]["C"] = max([indice["max_id"].get("C", 0)] + numeros)
+    indice["actualizado"] = date.today().isoformat()
+    _escribir_atomico(_ruta_indice(carpeta), json.dumps(indice, indent=2, ensure_ascii=False).encode("utf-8"))
+
+    # 2. Borrar de la hoja caliente, comprobando que las filas no se movieron desde la lectura
+    ids_actuales = hoja_citas.col_values(1)
+    for n_fila in seleccion:
+        if n_fila > len(ids_actuales) or ids_actuales[n_fila - 1] != filas[n_fila - 1][0]:
+            informe["error"] = "La hoja cambió durante el archivado; no se borró nada (el archivo ya está al día)."
+            return informe
+    for inicio, fin in _rangos_contiguos(seleccion):
+        hoja_citas.delete_rows(inicio, fin)
+    informe["filas_hoja"] -= len(seleccion)
+    return informe
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Archiva en frío las citas cerradas antiguas de la hoja Citas.")
+    parser.add_argument("--dias", type=int, default=DIAS_CORTE, help="Antigüedad mínima (días) para archivar.")
+    parser.add_argument("--simular", action="store_true", help="Solo mostrar qué se archivaría.")
+    args = parser.parse_args()
+
+    informe = archivar(dias_corte=args.dias, simular=args.simular)
+    print(f"{'🔎 Simulación' if args.simular else '🗄️ Archivado'}: {informe['archivadas']} citas "
+          f"({informe['filas_hoja']} quedan en la hoja)")
+    for mes, n in informe["meses"].items():
+        print(f"  {mes}: {n}")
+    if informe.get("error"):
+        print(f"⚠️ {informe['error']}")
@@ -0,0 +1,199 @@
+# ============================================================
+# ⏱️ Benchmark Offline (sin Google Sheets)
+# ============================================================
+# Mide el CRUD, el NLP, la predicción No-Show y diálogos completos del chatbot
+# contra hojas en memoria (hoja_memoria.py) sembradas desde data/*.csv.
+# Cada ejecución se guarda en benchmarks/*.json con el commit actual para
+# comparar entre versiones:
+#   python benchmark.py --filas 5000 --latencia-ms 300
+#   python benchmark.py --comparar benchmarks/<anterior>.json
+import os
+
+# Antes de importar la lógica: sin conexión real y sin un log JSON por span
+os.environ.setdefault("SHEETS_OFFLINE", "1")
+os.environ.setdefault("LOG_NIVEL", "WARNING")
+os.environ.setdefault("LOG_SPANS", "0")
+
+import argparse
+import json
+import platform
+import random
+import subprocess
+import time
+from datetime import date, datetime, timedelta
+
+from hoja_memoria import sembrar_hojas
+from flujo_agendamiento import agendar, consultar_citas, cancelar_cita, configurar_hojas
+from trazas import resumen_spans
+from guiones_prueba import DIALOGOS, DNI_BASE, DNI_NUEVOS, MAX_TURNOS_DIALOGO, guion, dialogo_exitoso, resumir
+
+try:
+    from procesador_nlp import procesar_texto
+    nlp_cargado = True
+except Exception as e:
+    print(f"⚠️ benchmark: procesador_nlp no disponible ({e}), se omite.")
+    nlp_cargado = False
+
+try:
+    from chatbot_logic import responder_chatbot, predecir_noshow
+    chatbot_cargado = True
+except Exception as e:
+    print(f"⚠️ benchmark: chatbot_logic no disponible ({e}), se omite.")
+    chatbot_cargado = False
+
+CARPETA_RESULTADOS = "benchmarks"
+
+FRASES_NLP = [
+    "quiero agendar una cita con el Dr. Vega mañana a las 10:30",
+    "hola buenas tardes",
+    "consultar mis citas, mi dni es 70000001",
+    "necesito cancelar la cita del 2025-10-11",
+    "a qué hora atiende la doctora Morales",
+]
+
+
+def conversar(responder, frase, respuestas, max_turnos=MAX_TURNOS_DIALOGO):
+    """
+    Mantiene un diálogo con 'responder' (responder_chatbot) contestando lo que
+    pregunte. Devuelve (latencias por turno, última respuesta).
+    """
+    estado, mensaje, latencias = {}, frase, []
+    for _ in range(max_turnos):
+        inicio = time.perf_counter()
+        respuesta, estado = responder(mensaje, [], estado)
+        latencias.append(time.perf_counter() - inicio)
+        campo = estado.get("campo_preguntado") if estado else None
+        if campo is None:
+            break
+        if campo not in respuestas:
+            raise ValueError(f"El diálogo no sabe responder al campo '{campo}'")
+        mensaje = respuestas[campo]
+    return latencias, respuesta
+
+
+def medir(funcion, llamadas, hojas=()):
+    """Ejecuta funcion(*args) por cada args de 'llamadas'; devuelve resumen y llamadas a Sheets por operación."""
+    for hoja in hojas:
+        hoja.reiniciar_contadores()
+    latencias = []
+    for args in llamadas:
+        inicio = time.perf_counter()
+        funcion(*args)
+        latencias.append(time.perf_counter() - inicio)
+    resultado = resumir(latencias)
+    if hojas:
+        total = {}
+        for hoja in hojas:
+            for metodo, n in hoja.llamadas.items():
+                clave = f"{hoja.title}.{metodo}"
+                total[clave] = total.get(clave, 0) + n
+        resultado["sheets_por_op"] = {k: round(v / len(latencias), 2) for k, v in sorted(total.items())}
+    return resultado
+
+
+# --- Benchmark ---
+def ejecutar_benchmark(filas, latencia_ms, repeticiones, semilla):
+    azar = random.Random(semilla)
+    hoja_pacientes, hoja_citas = sembrar_hojas(filas, semilla=semilla, latencia_s=latencia_ms / 1000)
+    configurar_hojas(hoja_pacientes, hoja_citas, backup_csv=False)
+    hojas = (hoja_pacientes, hoja_citas)
+    resumen_spans(reiniciar=True)
+
+    fecha = (date.today() + timedelta(days=7)).isoformat()
+    existentes = [str(DNI_BASE + azar.randrange(filas)) for _ in range(repeticiones)]
+    nuevos = [str(DNI_NUEVOS + i) for i in range(repeticiones)] # No sembrados: se crean
+
+    resultados = {}
+    print(f"⏱️ CRUD ({filas} pacientes, latencia {latencia_ms} ms, {repeticiones} repeticiones)...")
+    resultados["agendar_existente"] = medir(
+        agendar, [("Paciente Prueba", dni, "987654321", "p@correo.com", fecha, "10:30", "Dr.Vega") for dni in existentes], hojas)
+    resultados["agendar_nuevo"] = medir(
+        agendar, [("Paciente Nuevo", dni, "987654321", "n@correo.com", fecha, "11:00", "Dra.Morales") for dni in nuevos], hojas)
+    resultados["consultar_citas"] = medir(consultar_citas, [(dni,) for dni in existentes], hojas)
+    resultados["cancelar_cita"] = medir(cancelar_cita, [(dni, fecha) for dni in existentes], hojas)
+
+    if nlp_cargado:
+        print("⏱️ procesar_texto...")
+        procesar_texto(FRASES_NLP[0]) # Calentamiento
+        resultados["procesar_texto"] = medir(procesar_texto, [(FRASES_NLP[i % len(FRASES_NLP)],) for i in range(repeticiones)])
+
+    if chatbot_cargado:
+        print("⏱️ predecir_noshow...")
+        predecir_noshow(fecha, "10:30") # Calentamiento
+        resultados["predecir_noshow"] = medir(predecir_noshow, [(fecha, f"{8 + i % 12:02d}:00") for i in range(repeticiones)])
+
+        print("⏱️ Diálogos completos (responder_chatbot)...")
+        casos = [("agendar", dni) for dni in nuevos] + [("consultar", dni) for dni in existentes] + \
+                [("cancelar", dni) for dni in nuevos]
+        for tipo in DIALOGOS:
+            turnos, totales, fallidos = [], [], 0
+            for _, dni in [c for c in casos if c[0] == tipo]:
+                latencias, respuesta = conversar(responder_chatbot, *guion(tipo, dni, fecha))
+                turnos.extend(latencias)
+                totales.append(sum(latencias))
+                fallidos += not dialogo_exitoso(tipo, respuesta)
+            resultados[f"dialogo_{tipo}"] = {**resumir(totales), "turno": resumir(turnos), "fallidos": fallidos}
+
+    return resultados
+
+
+def commit_actual():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except Exception:
+        return "desconocido"
+
+
+def comparar(actual, anterior):
+    """Imprime la variación de la media entre dos resultados."""
+    print(f"\n📊 {anterior['meta']['commit']} -> {actual['meta']['commit']} (media)")
+    for operacion, datos in actual["resultados"].items():
+        previo = anterior["resultados"].get(operacion)
+        if not previo:
+            continue
+        cambio = datos["media_ms"] / previo["media_ms"] - 1 if previo["media_ms"] else 0.0
+        marca = "🔺" if cambio > 0.10 else ("🟢" if cambio < -0.10 else "  ")
+        print(f"  {marca} {operacion:<22} {previo['media_ms']:>10.2f} ms -> {datos['media_ms']:>10.2f} ms ({cambio:+.0%})")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark offline de la plataforma de citas.")
+    parser.add_argument("--filas", type=int, default=1000, help="Pacientes sembrados en la hoja en memoria.")
+    parser.add_argument("--latencia-ms", type=float, default=0.0, help="Latencia inyectada por llamada a Sheets.")
+    parser.add_argument("--repeticiones", type=int, default=20)
+    parser.add_argument("--semilla", type=int, default=42)
+    parser.add_argument("--salida", default=None, help="Archivo JSON (por defecto benchmarks/<commit>_<fecha>.json).")
+    parser.add_argument("--comparar", default=None, help="JSON de una ejecución anterior para comparar.")
+    args = parser.parse_args()
+
+    resultados = ejecutar_benchmark(args.filas, args.latencia_ms, args.repeticiones, args.semilla)
+    informe = {
+        "meta": {
+            "commit": commit_actual(),
+            "fecha": datetime.now().isoformat(timespec="seconds"),
+            "python": platform.python_version(),
+            "plataforma": platform.platform(),
+            "filas": args.filas,
+            "latencia_ms": args.latencia_ms,
+            "repeticiones": args.repeticiones,
+            "semilla": args.semilla,
+        },
+        "resultados": resultados,
+        "spans": resumen_spans(),
+    }
+
+    salida = args.salida or os.path.join(
+        CARPETA_RESULTADOS, f"{informe['meta']['commit']}_{datetime.now():%Y%m%d%H%M%S}.json")
+    os.makedirs(os.path.dirname(salida) or ".", exist_ok=True)
+    with open(salida, "w", encoding="utf-8") as f:
+        json.dump(informe, f, indent=2, ensure_ascii=False)
+
+    print(f"\n{'Operación':<24}{'media':>10}{'p50':>10}{'p95':>10}  (ms)")
+    for operacion, datos in resultados.items():
+        print(f"{operacion:<24}{datos['media_ms']:>10.2f}{datos['p50_ms']:>10.2f}{datos['p95_ms']:>10.2f}")
+    print(f"\n💾 Resultados guardados en {salida}")
+
+    if args.comparar:
+        with open(args.comparar, encoding="utf-8") as f:
+            comparar(informe, json.load(f))
@@ -0,0 +1,220 @@
+# ============================================================
+# 📈 Generador de Carga (conversaciones concurrentes)
+# ============================================================
+# Simula N pacientes conversando a la vez y sube la concurrencia por etapas
+# para ver dónde se degrada la latencia. Cada sesión repite el ciclo
+# agendar -> consultar -> cancelar (guiones_prueba.py) con un DNI nuevo.
+#
+#   En proceso (responder_chatbot_async contra hojas en memoria):
+#     python carga.py --modo proceso --concurrencia 1,10,50,100 --latencia-ms 300
+#   Contra la app lanzada (Gradio) con SHEETS_OFFLINE=1:
+#     SHEETS_OFFLINE=1 SHEETS_OFFLINE_LATENCIA_MS=300 python app.py
+#     python carga.py --modo http --url http://localhost:7860 --concurrencia 1,10,50
+#
+# Con --wavs CARPETA, el primer turno de cada diálogo puede ser de voz: se usa
+# un WAV cuyo nombre empiece por el tipo de diálogo (agendar*.wav, consultar*.wav,
+# cancelar*.wav) grabado con la frase inicial.
+import os
+
+os.environ.setdefault("SHEETS_OFFLINE", "1")
+os.environ.setdefault("LOG_NIVEL", "WARNING")
+os.environ.setdefault("LOG_SPANS", "0")
+
+import argparse
+import asyncio
+import glob
+import itertools
+import json
+import random
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, timedelta
+
+from guiones_prueba import DIALOGOS, DNI_NUEVOS, MAX_TURNOS_DIALOGO, guion, dialogo_exitoso, campo_en_pregunta, resumir
+
+ORDEN_DIALOGOS = ("agendar", "consultar", "cancelar")
+_contador_dni = itertools.count()
+
+
+def nuevo_dni():
+    return str(DNI_NUEVOS + next(_contador_dni))
+
+
+def cargar_wavs(carpeta):
+    """{tipo de diálogo: [rutas WAV]} según el prefijo del nombre del archivo."""
+    wavs = {tipo: [] for tipo in DIALOGOS}
+    for ruta in sorted(glob.glob(os.path.join(carpeta, "*.wav"))):
+        nombre = os.path.basename(ruta).lower()
+        for tipo in wavs:
+            if nombre.startswith(tipo):
+                wavs[tipo].append(ruta)
+    return wavs
+
+
+# --- Clientes ---
+class ClienteProceso:
+    """Conversación en el mismo proceso con responder_chatbot_async."""
+
+    def __init__(self, latencia_ms, filas):
+        from hoja_memoria import sembrar_hojas
+        from flujo_agendamiento import configurar_hojas
+        from chatbot_logic import responder_chatbot_async
+        configurar_hojas(*sembrar_hojas(filas, latencia_s=latencia_ms / 1000), backup_csv=False)
+        self._responder = responder_chatbot_async
+        self._transcribir = None
+
+    def nueva_sesion(self):
+        return {"estado": {}}
+
+    async def turno(self, sesion, mensaje):
+        respuesta, sesion["estado"] = await self._responder(mensaje, [], sesion["estado"])
+        return respuesta, (sesion["estado"] or {}).get("campo_preguntado")
+
+    async def turno_voz(self, sesion, ruta_wav):
+        import scipy.io.wavfile as wavfile
+        from ejecutores import EJECUTOR_STT, en_pool
+        from transcriptor import transcribir_array
+        sample_rate, audio = wavfile.read(ruta_wav)
+        texto = await en_pool(EJECUTOR_STT, transcribir_array, audio, sample_rate)
+        return await self.turno(sesion, texto)
+
+
+class ClienteHTTP:
+    """Conversación con la app Gradio lanzada (gradio_client; una sesión de Gradio por paciente)."""
+
+    def __init__(self, url, hilos):
+        from gradio_client import Client, handle_file
+        self._url = url
+        self._Client = Client
+        self._handle_file = handle_file
+        # gradio_client es bloqueante: cada petición ocupa un hilo mientras espera
+        self._ejecutor = ThreadPoolExecutor(max_workers=hilos, thread_name_prefix="carga")
+
+    def nueva_sesion(self):
+        return {"cliente": self._Client(self._url, verbose=False)}
+
+    async def _llamar(self, funcion, *args):
+        return await asyncio.get_running_loop().run_in_executor(self._ejecutor, lambda: funcion(*args))
+
+    @staticmethod
+    def _ultima_respuesta(historial):
+        return historial[-1][1] if historial else ""
+
+    async def turno(self, sesion, mensaje):
+        historial, *_ = await self._llamar(
+            lambda: sesion["cliente"].predict(mensaje, [], api_name="/manejar_texto"))
+        respuesta = self._ultima_respuesta(historial)
+        return respuesta, campo_en_pregunta(respuesta)
+
+    async def turno_voz(self, sesion, ruta_wav):
+        historial, *_ = await self._llamar(
+            lambda: sesion["cliente"].predict(self._handle_file(ruta_wav), [], api_name="/manejar_voz"))
+        respuesta = self._ultima_respuesta(historial)
+        return respuesta, campo_en_pregunta(respuesta)
+
+
+# --- Sesiones ---
+async def sesion_paciente(cliente, fin, metricas, azar, wavs, proporcion_voz):
+    """Repite agendar -> consultar -> cancelar hasta 'fin' (perf_counter) y anota cada turno."""
+    sesion = cliente.nueva_sesion()
+    fecha = (date.today() + timedelta(days=7 + azar.randrange(60))).isoformat()
+    while time.perf_counter() < fin:
+        dni = nuevo_dni()
+        for tipo in ORDEN_DIALOGOS:
+            frase, respuestas = guion(tipo, dni, fecha)
+            wav = None
+            if wavs and wavs.get(tipo) and azar.random() < proporcion_voz:
+                wav = azar.choice(wavs[tipo])
+            try:
+                respuesta = None
+                for n_turno in range(MAX_TURNOS_DIALOGO):
+                    inicio = time.perf_counter()
+                    if n_turno == 0 and wav:
+                        respuesta, campo = await cliente.turno_voz(sesion, wav)
+                        metricas["turnos_voz"].append(time.perf_counter() - inicio)
+                    else:
+                        respuesta, campo = await cliente.turno(sesion, frase if n_turno == 0 else respuestas[campo])
+                        metricas["turnos"].append(time.perf_counter() - inicio)
+                    if campo is None:
+                        break
+                    if campo not in respuestas:
+                        raise ValueError(f"campo inesperado '{campo}'")
+                metricas["dialogos"] += 1
+                if not dialogo_exitoso(tipo, respuesta):
+                    metricas["fallidos"] += 1
+            except Exception as e:
+                metricas["errores"] += 1
+                metricas["ultimo_error"] = f"{type(e).__name__}: {e}"
+                sesion = cliente.nueva_sesion() # Estado desconocido tras un error: empezar de cero
+                break
+
+
+async def etapa(cliente, concurrencia, duracion_s, semilla, wavs, proporcion_voz):
+    metricas = {"turnos": [], "turnos_voz": [], "dialogos": 0, "fallidos": 0, "errores": 0, "ultimo_error": None}
+    fin = time.perf_counter() + duracion_s
+    inicio = time.perf_counter()
+    await asyncio.gather(*(
+        sesion_paciente(cliente, fin, metricas, random.Random(semilla + i), wavs, proporcion_voz)
+        for i in range(concurrencia)
+    ))
+    transcurrido = time.perf_counter() - inicio
+    n_turnos = len(metricas["turnos"]) + len(metricas["turnos_voz"])
+    return {
+        "concurrencia": concurrencia,
+        "duracion_s": round(transcurrido, 2),
+        "turnos_por_s": round(n_turnos / transcurrido, 2),
+        "dialogos_por_s": round(metricas["dialogos"] / transcurrido, 2),
+        "turno": resumir(metricas["turnos"]),
+        "turno_voz": resumir(metricas["turnos_voz"]),
+        "dialogos": metricas["dialogos"],
+        "tasa_fallidos": round(metricas["fallidos"] / max(metricas["dialogos"], 1), 4),
+        "errores": metricas["errores"],
+        "tasa_errores": round(metricas["errores"] / max(metricas["dialogos"] + metricas["errores"], 1), 4),
+        "ultimo_error": metricas["ultimo_error"],
+    }
+
+
+async def rampa(cliente, niveles, duracion_s, semilla, wavs, proporcion_voz):
+    resultados = []
+    print(f"{'sesiones':>9}{'turnos/s':>10}{'p50':>9}{'p95':>9}{'p99':>9}{'fallidos':>10}{'errores':>9}  (ms)")
+    for concurrencia in niveles:
+        r = await etapa(cliente, concurrencia, duracion_s, semilla, wavs, proporcion_voz)
+        t = r["turno"]
+        print(f"{concurrencia:>9}{r['turnos_por_s']:>10.1f}{t.get('p50_ms', 0):>9.0f}{t.get('p95_ms', 0):>9.0f}"
+              f"{t.get('p99_ms', 0):>9.0f}{r['tasa_fallidos']:>10.1%}{r['tasa_errores']:>9.1%}")
+        if r["ultimo_error"]:
+            print(f"          ⚠️ {r['ultimo_error']}")
+        resultados.append(r)
+    return resultados
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Prueba de carga con conversaciones concurrentes.")
+    parser.add_argument("--modo", choices=["proceso", "http"], default="proceso")
+    parser.add_argument("--url", default="http://localhost:7860", help="App Gradio para --modo http.")
+    parser.add_argument("--concurrencia", default="1,5,10,25,50",
+                        help="Sesiones simultáneas por etapa de la rampa (separadas por comas).")
+    parser.add_argument("--duracion", type=float, default=30.0, help="Segundos por etapa.")
+    parser.add_argument("--filas", type=int, default=1000, help="Pacientes sembrados (--modo proceso).")
+    parser.add_argument("--latencia-ms", type=float, default=300.0, help="Latencia por llamada a Sheets (--modo proceso).")
+    parser.add_argument("--wavs", default=None, help="Carpeta con WAV para turnos de voz.")
+    parser.add_argument("--proporcion-voz", type=float, default=1.0, help="Fracción de diálogos que empiezan por voz.")
+    parser.add_argument("--semilla", type=int, default=42)
+    parser.add_argument("--salida", default=None, help="Guardar los resultados en este JSON.")
+    args = parser.parse_args()
+
+    niveles = [int(n) for n in args.concurrencia.split(",") if n.strip()]
+    wavs = cargar_wavs(args.wavs) if args.wavs else None
+    if args.modo == "proceso":
+        cliente = ClienteProceso(args.latencia_ms, args.filas)
+    else:
+        cliente = ClienteHTTP(args.url, hilos=max(niveles))
+
+    print(f"📈 Carga {args.modo}: etapas de {args.duracion:.0f}s con {niveles} sesiones simultáneas")
+    resultados = asyncio.run(rampa(cliente, niveles, args.duracion, args.semilla, wavs, args.proporcion_voz))
+
+    if args.salida:
+        os.makedirs(os.path.dirname(args.salida) or ".", exist_ok=True)
+        with open(args.salida, "w", encoding="utf-8") as f:
+            json.dump({"modo": args.modo, "parametros": vars(args), "etapas": resultados}, f, indent=2, ensure_ascii=False)
+        print(f"💾 Resultados guardados en {args.salida}")
@@ -3,6 +3,11 @@ from datetime import date
 import spacy
 import re
 import numpy as np 
+import threading
+import asyncio
+import contextvars
+from ejecutores import EJECUTOR_IO, EJECUTOR_NLP, EJECUTOR_ML, en_pool
+from trazas import trazado, registrar, incrementar
 
 # =========================================================
 # 🚨 CORRECCIÓN CLAVE: MOVER CONSTANTES FUERA DE LAS FUNCIONES
@@ -10,12 +15,13 @@ import numpy as np
 
 # --- Definiciones de Flujo (Constantes) ---
 CAMPOS_AGENDAR = ["DNI", "Nombre", "Telefono", "Email", "Medico", "Fecha", "Hora"]
+CAMPOS_PACIENTE = ["Nombre", "Telefono", "Email"] # Se pueden completar desde el registro del paciente
 RESPUESTAS_PREGUNTAS = {
     "DNI": "¿Cuál es tu número de DNI?",
     "Nombre": "¿Cuál es tu nombre completo?",
     "Telefono": "¿Me proporcionas un número de teléfono?",
     "Email": "¿Me das tu email?",
-    "Medico": "¿Con qué médico quieres agendar? Tenemos al Dr. Vega, Dra. Perez, o Dr. Morales.",
+    "Medico": lambda: f"¿Con qué médico quieres agendar? Tenemos a {describir_medicos()}.", # Sale del directorio
     "Fecha": "¿Qué fecha quieres la cita? (Formato AAAA-MM-DD)",
     "Hora": "¿A qué hora? (Formato HH:MM)"
 }
@@ -24,7 +30,9 @@ RESPUESTAS_PREGUNTAS = {
 
 # --- Importaciones de Lógica Externa ---
 try:
-    from flujo_agendamiento import agendar, consultar_citas, cancelar_cita, obtener_medicos, buscar_paciente_por_dni
+    from flujo_agendamiento import obtener_medicos
+    # Las operaciones pasan por el mapa de sedes (con una sola sede delega sin más en flujo_agendamiento)
+    from shards import agendar, consultar_citas, cancelar_cita, buscar_paciente_por_dni
     flujo_cargado = True
 except ImportError:
     print("ERROR chatbot_logic: No se encontró 'flujo_agendamiento.py'")
@@ -44,73 +52,166 @@ except ImportError as e:
     nlp_cargado = False
     def procesar_texto(texto): return "desconocido", {"error": "Procesador NLP no encontrado."}
 
+# Parsers baratos para la respuesta a una pregunta pendiente (sin NLP)
+from slots import parsear_slot
+from directorio_medicos import describir as describir_medicos
+
 # --- Importaciones de Modelo ML ---
+# El Pipeline No-Show (preprocesador + modelo) lo gestiona el registro: se carga
+# con mmap y se reemplaza en caliente cuando entrenar_noshow.py publica otra versión.
 try:
-    import joblib
-    modelo_noshow = joblib.load("modelo_noshow.joblib") 
-    preprocesador_noshow = joblib.load("preprocesador_noshow.joblib")
-    print("✅ chatbot_logic: Modelo ML 'No-Show' cargado.")
-    ml_cargado = True
-except FileNotFoundError:
-    print("❌ ADVERTENCIA: Archivo de modelo ML no encontrado (modelo_noshow.joblib).")
-    modelo_noshow, preprocesador_noshow, ml_cargado = None, None, False
+    from registro_modelos import RegistroModeloNoShow
+    registro_noshow = RegistroModeloNoShow()
+    ml_cargado = registro_noshow.cargar()
+    if ml_cargado:
+        print("✅ chatbot_logic: Modelo ML 'No-Show' cargado.")
 except Exception as e:
     print(f"❌ Error chatbot_logic al cargar modelo ML: {e}")
-    modelo_noshow, preprocesador_noshow, ml_cargado = None, None, False
+    registro_noshow, ml_cargado = None, False
 
 
 # --- Lógica de Predicción No-Show ---
+@trazado("predecir_noshow")
 def predecir_noshow(fecha_str, hora_str):
     """Prepara datos y predice la probabilidad de No-Show."""
-    if not ml_cargado: return None
+    if registro_noshow is None: return None
+    modelo_noshow, _ = registro_noshow.obtener()
+    if modelo_noshow is None: return None
     try:
-        fecha_obj = pd.to_datetime(fecha_str); dia_semana = fecha_obj.strftime('%A')
-        hora_num = int(hora_str.split(':')[0])
-        if 5 <= hora_num < 12: hora_bloque = "Mañana"
-        elif 12 <= hora_num < 18: hora_bloque = "Tarde"
-        else: hora_bloque = "Noche"
-        ant_no_shows = 0; distancia_km = 5 # Placeholders
-        datos_cita = pd.DataFrame([{'Dia_Semana': dia_semana, 'Hora_Bloque': hora_bloque,'Ant_No_Shows': ant_no_shows, 'Distancia_Km': distancia_km}])
-        datos_procesados = preprocesador_noshow.transform(datos_cita)
-        
-        # Asumiendo que joblib.load() devuelve un modelo compatible con scikit-learn
-        prob = modelo_noshow.predict_proba(datos_procesados)[0][1]
+        datos_cita = pd.DataFrame([_fila_noshow(fecha_str, hora_str)])
+        # El Pipeline aplica el preprocesador y el modelo de la misma versión
+        prob = modelo_noshow.predict_proba(datos_cita)[0][1]
         
-        print(f"📈 chatbot_logic: Predicción No-Show ({fecha_str} {hora_str}): {prob:.2f}"); return prob
-    except Exception as e: print(f"❌ chatbot_logic: Error en predicción: {e}"); return None
+        registrar("prediccion_noshow", modulo="chatbot", prob=round(float(prob), 3)); return prob
+    except Exception as e: registrar("error_prediccion", nivel="error", modulo="chatbot", error=str(e)); return None
 
 
-# --- Función Principal del Chatbot (Estado) ---
-def responder_chatbot(mensaje, historial_chat, estado_actual):
+def _fila_noshow(fecha_str, hora_str):
+    """Variables del modelo No-Show para una cita."""
+    fecha_obj = pd.to_datetime(fecha_str); dia_semana = fecha_obj.strftime('%A')
+    hora_num = int(hora_str.split(':')[0])
+    if 5 <= hora_num < 12: hora_bloque = "Mañana"
+    elif 12 <= hora_num < 18: hora_bloque = "Tarde"
+    else: hora_bloque = "Noche"
+    ant_no_shows = 0; distancia_km = 5 # Placeholders
+    return {'Dia_Semana': dia_semana, 'Hora_Bloque': hora_bloque,'Ant_No_Shows': ant_no_shows, 'Distancia_Km': distancia_km}
+
+
+@trazado("predecir_noshow_lote")
+def predecir_noshow_lote(citas):
+    """Probabilidad de No-Show para [(fecha, hora), ...] con un solo predict_proba (None si la cita no es válida)."""
+    probs = [None] * len(citas)
+    if registro_noshow is None: return probs
+    modelo_noshow, _ = registro_noshow.obtener()
+    if modelo_noshow is None: return probs
+    filas, indices = [], []
+    for i, (fecha_str, hora_str) in enumerate(citas):
+        try:
+            filas.append(_fila_noshow(fecha_str, hora_str)); indices.append(i)
+        except Exception as e:
+            registrar("error_prediccion", nivel="warning", modulo="chatbot", error=str(e))
+    if filas:
+        try:
+            for i, prob in zip(indices, modelo_noshow.predict_proba(pd.DataFrame(filas))[:, 1]):
+                probs[i] = float(prob)
+        except Exception as e:
+            registrar("error_prediccion", nivel="error", modulo="chatbot", error=str(e))
+    return probs
+
+
+# --- Precarga del Paciente (en cuanto se conoce el DNI) ---
+# La búsqueda en la hoja Pacientes se lanza en segundo plano en el turno del DNI.
+# Su resultado se guarda en la sesión (estado["paciente"]) y se pasa a agendar(),
+# que así no repite la búsqueda en el último turno.
+ESPERA_MAX_PRECARGA_S = 10
+MAX_PRECARGAS_PENDIENTES = 512
+_precargas = {} # DNI -> Future
+_lock_precargas = threading.Lock()
+
+
+def precargar_paciente(dni):
+    """Lanza (una sola vez por DNI) buscar_paciente_por_dni en segundo plano y devuelve el Future."""
+    with _lock_precargas:
+        futuro = _precargas.get(dni)
+        if futuro is None:
+            if len(_precargas) >= MAX_PRECARGAS_PENDIENTES:
+                # Conversaciones abandonadas: descartar las búsquedas ya terminadas
+                for clave in [k for k, f in _precargas.items() if f.done()]:
+                    del _precargas[clave]
+            # Con el contexto copiado, los spans de gspread llevan el id de la petición
+            futuro = EJECUTOR_IO.submit(contextvars.copy_context().run, buscar_paciente_por_dni, dni)
+            _precargas[dni] = futuro
+    return futuro
+
+
+def obtener_paciente_precargado(dni, esperar=False):
     """
-    Función principal del chatbot con flujo conversacional para agendar.
+    Resultado de la precarga: el registro del paciente, {'DNI': dni} si no existe,
+    o None si la búsqueda sigue en curso (y esperar=False).
     """
-    respuesta = ""
-    accion_completada = False
-    
-    # Aseguramos que el estado inicial sea un diccionario
-    if estado_actual is None: estado_actual = {}
-    print(f"Estado IN: {estado_actual}")
+    futuro = precargar_paciente(dni)
+    if not esperar and not futuro.done():
+        return None
+    try:
+        paciente = futuro.result(timeout=ESPERA_MAX_PRECARGA_S)
+    except Exception as e:
+        registrar("error_precarga_paciente", nivel="error", modulo="chatbot", error=str(e))
+        paciente = None
+    with _lock_precargas:
+        _precargas.pop(dni, None) # A partir de aquí lo guarda la sesión
+    return paciente or {"DNI": dni}
 
-    campos_paciente = ["DNI", "Nombre", "Telefono", "Email"]
-    campos_cita = ["Fecha", "Hora", "Medico"]
-    todos_campos = campos_paciente + campos_cita
 
+# --- Etapas del Turno ---
+# Un turno se divide en: interpretar (slot o NLP) -> planificar (estado y
+# respuesta, sin E/S) -> ejecutar la acción de almacenamiento si la hay.
+# responder_chatbot las encadena en el hilo actual; responder_chatbot_async
+# reparte cada etapa en su pool y ejecuta en paralelo lo independiente.
+
+def _entrada_invalida(mensaje, estado_actual):
+    """Respuesta inmediata (respuesta, estado) si el turno no se puede procesar; si no, None."""
     if not nlp_cargado: 
         return "Error: El módulo NLP no está disponible.", estado_actual
 
     if isinstance(mensaje, str) and mensaje.startswith("Error:"):
          respuesta = "Hubo un error de formato. Por favor, reinicia la conversación."
          return respuesta, {}
+    return None
+
+
+def _interpretar_slot(mensaje, estado_actual):
+    """Vía rápida: si el mensaje responde al campo preguntado, (intención, entidades) sin NLP."""
+    campo_preguntado = estado_actual.get("campo_preguntado")
+    valor_slot = parsear_slot(campo_preguntado, mensaje) if estado_actual.get("intent") and campo_preguntado else None
+    if valor_slot is None:
+        return None
+    registrar("slot_resuelto", modulo="chatbot", campo=campo_preguntado)
+    incrementar("slots_sin_nlp", campo=campo_preguntado)
+    return estado_actual["intent"], {campo_preguntado: valor_slot}
 
 
+def _interpretar_nlp(mensaje):
     intencion_raw, entidades_raw = procesar_texto(mensaje)
-    print(f"Intención RAW: {intencion_raw}, Entidades RAW: {entidades_raw}")
-    
+    # Solo los nombres de las entidades: los valores son datos personales
+    registrar("interpretacion_nlp", modulo="chatbot", intencion=intencion_raw, entidades=sorted(entidades_raw))
+    return intencion_raw, entidades_raw
+
+
+def _planificar_turno(estado_actual, interpretacion):
+    """
+    Actualiza el estado con la interpretación del mensaje y decide la respuesta.
+    No hace E/S bloqueante: si hay que agendar/consultar/cancelar, lo devuelve
+    como 'accion' (dict) para que la etapa siguiente la ejecute.
+    Devuelve (respuesta, estado, accion).
+    """
+    respuesta = ""
+    accion = None
+    intencion_raw, entidades_raw = interpretacion
+
     # 2. Lógica de Reinicio o Cambio de Intención
     if intencion_raw in ["saludo", "desconocido"]:
         respuesta = "Hola. Puedo ayudarte a agendar, consultar o cancelar citas."
-        return respuesta, {} 
+        return respuesta, {}, None
 
     if estado_actual.get("intent") and estado_actual["intent"] != intencion_raw and intencion_raw not in ["saludo", "desconocido"]:
         estado_actual = {} 
@@ -126,66 +227,56 @@ def responder_chatbot(mensaje, historial_chat, estado_actual):
     
     # 4. Lógica de Flujo (Estado y Respuesta)
     if estado_actual.get("intent") == "agendar":
-        if not flujo_cargado: return "Error: La lógica de agendamiento no está disponible.", {}
+        if not flujo_cargado: return "Error: La lógica de agendamiento no está disponible.", {}, None
         
+        # Precarga del paciente: se lanza al conocer el DNI y se consulta sin bloquear
+        dni = estado_actual.get("DNI")
+        paciente = estado_actual.get("paciente")
+        if paciente and paciente.get("DNI") != dni:
+            paciente = None # Cambió el DNI: el registro guardado ya no sirve
+            estado_actual.pop("paciente", None)
+        saludo_paciente = ""
+        if dni and paciente is None:
+            paciente = obtener_paciente_precargado(dni)
+            if paciente is not None:
+                estado_actual["paciente"] = paciente
+                if paciente.get("ID_Paciente"):
+                    # Paciente conocido: no hace falta preguntar Nombre/Telefono/Email
+                    for campo in CAMPOS_PACIENTE:
+                        if paciente.get(campo):
+                            estado_actual.setdefault(campo, paciente[campo])
+                    saludo_paciente = f"Hola de nuevo, {paciente.get('Nombre')}. Ya tengo tus datos. "
+
         # 🚨 LA CORRECCIÓN SE APLICA AQUÍ: CAMPOS_AGENDAR ahora es global
         campos_pendientes = [c for c in CAMPOS_AGENDAR if c not in estado_actual]
+        if dni and paciente is None:
+            # Búsqueda aún en curso: primero los datos de la cita, luego los del paciente
+            campos_pendientes.sort(key=lambda c: c in CAMPOS_PACIENTE)
         
         if not campos_pendientes:
-            # Todos los campos listos
-            try:
-                # 1. Buscar si el paciente existe y consolidar datos
-                paciente = buscar_paciente_por_dni(estado_actual["DNI"])
-                if paciente is None:
-                    nombre, telefono, email = estado_actual["Nombre"], estado_actual["Telefono"], estado_actual["Email"]
-                else:
-                    nombre = paciente.get("Nombre", estado_actual["Nombre"]) 
-                    telefono = paciente.get("Telefono", estado_actual["Telefono"])
-                    email = paciente.get("Email", estado_actual["Email"])
-
-                # 2. Agendar 
-                res_agendar = agendar(nombre, estado_actual["DNI"], telefono, email, estado_actual["Fecha"], estado_actual["Hora"], estado_actual["Medico"])
-
-                # 3. Predecir No-Show
-                prob = predecir_noshow(estado_actual["Fecha"], estado_actual["Hora"])
-
-                respuesta = res_agendar
-                if prob is not None:
-                     respuesta += f"\n{'⚠️ Riesgo ausencia:' if prob>0.6 else '(Riesgo bajo:'} {prob:.0%})"
-                
-                estado_actual = {} # Limpiar estado
-                accion_completada = True
-
-            except Exception as e:
-                respuesta = f"Error al agendar: {e}. Por favor, revisa tus datos."
-                accion_completada = True 
-
+            # Todos los campos listos: agendar (etapa de E/S)
+            accion = {"tipo": "agendar", "datos": {c: estado_actual[c] for c in CAMPOS_AGENDAR}, "paciente": paciente}
+            estado_actual = {} # Limpiar estado
         else:
             # Pedir el siguiente campo pendiente
             campo_a_pedir = campos_pendientes[0]
-            respuesta = RESPUESTAS_PREGUNTAS[campo_a_pedir]
+            pregunta = RESPUESTAS_PREGUNTAS[campo_a_pedir]
+            respuesta = saludo_paciente + (pregunta() if callable(pregunta) else pregunta)
             estado_actual["campo_preguntado"] = campo_a_pedir
 
 
     elif estado_actual.get("intent") == "consultar":
-        if not flujo_cargado: return "Error: Lógica de consulta no disponible.", {}
+        if not flujo_cargado: return "Error: Lógica de consulta no disponible.", {}, None
         dni = estado_actual.get("DNI") or entidades_limpias.get("DNI")
         if not dni: 
             respuesta = "Necesito tu DNI para consultar."
             estado_actual["campo_preguntado"] = "DNI"
         else:
-            res_crud = consultar_citas(dni)
-            if isinstance(res_crud, list):
-                if not res_crud: respuesta = f"No encontré citas para DNI {dni}."
-                else:
-                    respuesta = f"He encontrado {len(res_crud)} citas para DNI {dni}:\n"
-                    for c in res_crud: respuesta += f"- {c.get('ID_Cita','N/A')} el {c.get('Fecha','N/A')} {c.get('Hora','N/A')} ({c.get('Estado','N/A')})\n"
-            else: respuesta = str(res_crud)
+            accion = {"tipo": "consultar", "dni": dni}
             estado_actual = {} # Limpiar estado
-        accion_completada = True
 
     elif estado_actual.get("intent") == "cancelar":
-        if not flujo_cargado: return "Error: Lógica de cancelación no disponible.", {}
+        if not flujo_cargado: return "Error: Lógica de cancelación no disponible.", {}, None
         dni = estado_actual.get("DNI") or entidades_limpias.get("DNI")
         fecha = estado_actual.get("Fecha") or entidades_limpias.get("Fecha")
         
@@ -196,26 +287,160 @@ def responder_chatbot(mensaje, historial_chat, estado_actual):
             respuesta = "¿Para qué fecha es la cita que quieres cancelar? (AAAA-MM-DD)"
             estado_actual["campo_preguntado"] = "Fecha"
         else: 
-            respuesta = cancelar_cita(dni, fecha)
+            accion = {"tipo": "cancelar", "dni": dni, "fecha": fecha}
             estado_actual = {} # Limpiar estado
-        accion_completada = True
 
     elif estado_actual.get("intent") == "desconocido":
         respuesta = "No entendí. Intenta: agendar, consultar o cancelar."
         estado_actual = {} # Limpiar estado
-        accion_completada = True
 
     elif not respuesta:
         respuesta = "Disculpa, tengo un problema interno. Por favor, reinicia el chat."
         estado_actual = {}
 
-    
-    # 5. Devolver Respuesta y Estado
-    
+    return respuesta, estado_actual, accion
+
+
+def _datos_contacto(datos, paciente):
+    """Nombre, teléfono y email: los del registro si el paciente existe, si no los de la conversación."""
+    if not paciente or not paciente.get("ID_Paciente"):
+        return datos["Nombre"], datos["Telefono"], datos["Email"]
+    return (paciente.get("Nombre") or datos["Nombre"],
+            paciente.get("Telefono") or datos["Telefono"],
+            paciente.get("Email") or datos["Email"])
+
+
+def _texto_agendar(res_agendar, prob):
+    respuesta = res_agendar
+    if prob is not None and "¡Éxito!" in str(res_agendar):
+        respuesta += f"\n{'⚠️ Riesgo ausencia:' if prob>0.6 else '(Riesgo bajo:'} {prob:.0%})"
+    return respuesta
+
+
+def _texto_consulta(dni, res_crud):
+    if not isinstance(res_crud, list):
+        return str(res_crud)
+    if not res_crud:
+        return f"No encontré citas para DNI {dni}."
+    respuesta = f"He encontrado {len(res_crud)} citas para DNI {dni}:\n"
+    for c in res_crud: respuesta += f"- {c.get('ID_Cita','N/A')} el {c.get('Fecha','N/A')} {c.get('Hora','N/A')} ({c.get('Estado','N/A')})\n"
+    return respuesta
+
+
+def _ejecutar_accion(accion):
+    """Ejecuta la acción de almacenamiento del turno y devuelve el texto de respuesta."""
+    if accion["tipo"] == "agendar":
+        datos = accion["datos"]
+        try:
+            # 1. Datos del paciente (precargados; solo se espera si la búsqueda no terminó)
+            paciente = accion["paciente"] or obtener_paciente_precargado(datos["DNI"], esperar=True)
+            nombre, telefono, email = _datos_contacto(datos, paciente)
+            # 2. Agendar (con el paciente precargado no se vuelve a buscar en la hoja)
+            res_agendar = agendar(nombre, datos["DNI"], telefono, email, datos["Fecha"], datos["Hora"], datos["Medico"],
+                                  paciente=paciente)
+            # 3. Predecir No-Show
+            prob = predecir_noshow(datos["Fecha"], datos["Hora"])
+            return _texto_agendar(res_agendar, prob)
+        except Exception as e:
+            return f"Error al agendar: {e}. Por favor, revisa tus datos."
+    if accion["tipo"] == "consultar":
+        return _texto_consulta(accion["dni"], consultar_citas(accion["dni"]))
+    if accion["tipo"] == "cancelar":
+        return cancelar_cita(accion["dni"], accion["fecha"])
+    return "Disculpa, tengo un problema interno. Por favor, reinicia el chat."
+
+
+async def _ejecutar_accion_async(accion):
+    """Como _ejecutar_accion, con E/S en EJECUTOR_IO y el modelo en EJECUTOR_ML."""
+    if accion["tipo"] == "agendar":
+        datos = accion["datos"]
+        # La predicción No-Show no depende de la escritura: se lanzan a la vez
+        tarea_prob = asyncio.ensure_future(en_pool(EJECUTOR_ML, predecir_noshow, datos["Fecha"], datos["Hora"]))
+        try:
+            paciente = accion["paciente"] or await _obtener_paciente_precargado_async(datos["DNI"])
+            nombre, telefono, email = _datos_contacto(datos, paciente)
+            res_agendar = await en_pool(EJECUTOR_IO, agendar, nombre, datos["DNI"], telefono, email,
+                                        datos["Fecha"], datos["Hora"], datos["Medico"], paciente=paciente)
+        except Exception as e:
+            return f"Error al agendar: {e}. Por favor, revisa tus datos."
+        finally:
+            prob = await tarea_prob
+        return _texto_agendar(res_agendar, prob)
+    if accion["tipo"] == "consultar":
+        return _texto_consulta(accion["dni"], await en_pool(EJECUTOR_IO, consultar_citas, accion["dni"]))
+    if accion["tipo"] == "cancelar":
+        return await en_pool(EJECUTOR_IO, cancelar_cita, accion["dni"], accion["fecha"])
+    return "Disculpa, tengo un problema interno. Por favor, reinicia el chat."
+
+
+def _respuesta_segura(respuesta):
     # VALIDACIÓN DE SEGURIDAD
     if not isinstance(respuesta, str):
-        print("⚠️ Alerta: La respuesta final no es una cadena. Forzando a string.")
+        registrar("respuesta_no_texto", nivel="warning", modulo="chatbot", tipo=type(respuesta).__name__)
         respuesta = "Error interno de formato (DEBUG). Por favor, reinicia la conversación."
+    return respuesta
+
+
+def _registrar_estado_entrada(estado_actual):
+    registrar("estado_entrada", nivel="debug", modulo="chatbot", intent=estado_actual.get("intent"),
+              pendiente=estado_actual.get("campo_preguntado"),
+              slots=[k for k in estado_actual if k not in ("intent", "campo_preguntado")])
 
+
+async def _obtener_paciente_precargado_async(dni):
+    """Espera la precarga sin ocupar un hilo (esperarla desde EJECUTOR_IO podría bloquear el pool)."""
+    try:
+        paciente = await asyncio.wait_for(asyncio.wrap_future(precargar_paciente(dni)), ESPERA_MAX_PRECARGA_S)
+    except Exception as e:
+        registrar("error_precarga_paciente", nivel="error", modulo="chatbot", error=str(e))
+        paciente = None
+    with _lock_precargas:
+        _precargas.pop(dni, None)
+    return paciente or {"DNI": dni}
+
+
+# --- Función Principal del Chatbot (Estado) ---
+def responder_chatbot(mensaje, historial_chat, estado_actual):
+    """
+    Función principal del chatbot con flujo conversacional para agendar.
+    """
+    # Aseguramos que el estado inicial sea un diccionario
+    if estado_actual is None: estado_actual = {}
+    _registrar_estado_entrada(estado_actual)
+
+    invalida = _entrada_invalida(mensaje, estado_actual)
+    if invalida is not None:
+        return invalida
+
+    # 1. Interpretar: vía rápida del slot pendiente o pipeline NLP
+    interpretacion = _interpretar_slot(mensaje, estado_actual) or _interpretar_nlp(mensaje)
+    respuesta, estado_actual, accion = _planificar_turno(estado_actual, interpretacion)
+    if accion is not None:
+        respuesta = _ejecutar_accion(accion)
+
+    # 5. Devolver Respuesta y Estado
     # El retorno siempre debe ser una tupla (string, dict) para Gradio
-    return respuesta, estado_actual
+    return _respuesta_segura(respuesta), estado_actual
+
+
+async def responder_chatbot_async(mensaje, historial_chat, estado_actual):
+    """
+    Versión async de responder_chatbot: el NLP corre en EJECUTOR_NLP, las
+    llamadas a Sheets en EJECUTOR_IO y el modelo No-Show en EJECUTOR_ML, sin
+    ocupar un hilo de Gradio mientras se espera.
+    """
+    if estado_actual is None: estado_actual = {}
+    _registrar_estado_entrada(estado_actual)
+
+    invalida = _entrada_invalida(mensaje, estado_actual)
+    if invalida is not None:
+        return invalida
+
+    interpretacion = _interpretar_slot(mensaje, estado_actual)
+    if interpretacion is None:
+        interpretacion = await en_pool(EJECUTOR_NLP, _interpretar_nlp, mensaje)
+    respuesta, estado_actual, accion = _planificar_turno(estado_actual, interpretacion)
+    if accion is not None:
+        respuesta = await _ejecutar_accion_async(accion)
+
+    return _respuesta_segura(respuesta), estado_actual
@@ -0,0 +1,189 @@
+# ============================================================
+# 🩺 Directorio de Médicos (catálogo único + búsqueda tolerante)
+# ============================================================
+# Un solo catálogo (data/Medicos.csv: Medico, Especialidad, Nombre, Alias)
+# para flujo_agendamiento (especialidad y lista de médicos), los slots, el
+# extractor de entidades y la pregunta del chatbot. Se vuelve a leer solo
+# cuando cambia el archivo, sin reiniciar.
+#
+# Los nombres transcritos ("doctor perez", "la dra moralez") se resuelven sin
+# spaCy: primero por clave normalizada (sin tildes ni título) en un dict, y si
+# no, con un índice de trigramas sobre una forma fonética (b/v, s/z...): los
+# candidatos salen de los trigramas compartidos y se puntúan con Dice.
+import csv
+import functools
+import os
+import re
+import unicodedata
+from collections import Counter, defaultdict
+
+from trazas import registrar
+
+MEDICOS_CSV = os.environ.get("MEDICOS_CSV", "data/Medicos.csv")
+UMBRAL_SIMILITUD = float(os.environ.get("MEDICOS_UMBRAL", 0.6)) # Dice mínimo para aceptar un nombre aproximado
+ESPECIALIDAD_POR_DEFECTO = "General"
+PALABRAS_TITULO = {"dr", "dra", "doctor", "doctora"}
+_TITULO = re.compile(r"^(?:(?:el|la)\s+)?(?:dra?|doctora?)\s+")
+
+
+def normalizar(texto):
+    """Minúsculas, sin tildes, solo letras y dígitos separados por un espacio."""
+    texto = unicodedata.normalize("NFKD", str(texto).lower())
+    texto = "".join(c for c in texto if not unicodedata.combining(c))
+    return " ".join(re.findall(r"[a-z0-9]+", texto))
+
+
+def clave(nombre):
+    """Clave de búsqueda: 'Dra. María Paredes' -> 'maria paredes', 'Dr.Vega' -> 'vega'."""
+    return _TITULO.sub("", normalizar(nombre) + " ", count=1).strip()
+
+
+# Confusiones típicas al transcribir español: b/v, s/z/c, k/c/qu, h muda, ll/y
+_FONETICA = [("ch", "x"), ("qu", "k"), ("ce", "se"), ("ci", "si"), ("c", "k"), ("z", "s"), ("v", "b"), ("h", ""),
+             ("ll", "y")]
+
+
+def _fonetica(texto):
+    for origen, destino in _FONETICA:
+        texto = texto.replace(origen, destino)
+    return texto
+
+
+def _trigramas(texto):
+    relleno = f"  {_fonetica(texto)} "
+    return {relleno[i:i + 3] for i in range(len(relleno) - 2)}
+
+
+class Directorio:
+    """Catálogo en memoria: especialidad en O(1) y búsqueda exacta o aproximada por nombre."""
+
+    def __init__(self, filas):
+        self.medicos = []
+        self._especialidad = {}
+        self._nombre = {}
+        self._por_clave = {}
+        self._indice = defaultdict(set) # trigrama -> claves que lo contienen
+        self._tamano = {}
+        for fila in filas:
+            medico = (fila.get("Medico") or "").strip()
+            if not medico or medico in self._especialidad:
+                continue
+            self.medicos.append(medico)
+            self._especialidad[medico] = (fila.get("Especialidad") or "").strip() or ESPECIALIDAD_POR_DEFECTO
+            self._nombre[medico] = (fila.get("Nombre") or "").strip() or medico
+            nombres = [medico, self._nombre[medico]] + (fila.get("Alias") or "").split("|")
+            claves = {clave(n) for n in nombres}
+            claves |= {c.split()[-1] for c in claves if c} # El apellido solo: "perez"
+            for c in claves:
+                if c:
+                    self._por_clave.setdefault(c, medico)
+        for c in self._por_clave:
+            trigramas = _trigramas(c)
+            self._tamano[c] = len(trigramas)
+            for t in trigramas:
+                self._indice[t].add(c)
+
+    def __len__(self):
+        return len(self.medicos)
+
+    def especialidad(self, medico):
+        if medico not in self._especialidad:
+            medico = self._por_clave.get(clave(medico))
+        return self._especialidad.get(medico, ESPECIALIDAD_POR_DEFECTO)
+
+    def nombre(self, medico):
+        return self._nombre.get(medico, medico)
+
+    def _puntuar(self, c):
+        """(médico, puntuación) del mejor candidato para la clave 'c'; exacto = 1.0."""
+        if c in self._por_clave:
+            return self._por_clave[c], 1.0
+        trigramas = _trigramas(c)
+        comunes = Counter()
+        for t in trigramas:
+            comunes.update(self._indice.get(t, ()))
+        mejor, puntuacion = None, 0.0
+        for candidato, n in comunes.items():
+            dice = 2 * n / (len(trigramas) + self._tamano[candidato])
+            if dice > puntuacion:
+                mejor, puntuacion = candidato, dice
+        return (self._por_clave[mejor] if mejor else None), puntuacion
+
+    def buscar(self, texto, umbral=UMBRAL_SIMILITUD):
+        """Médico cuyo nombre coincide (exacto o aproximado) con todo 'texto', o None."""
+        c = clave(texto)
+        if not c:
+            return None
+        medico, puntuacion = self._puntuar(c)
+        return medico if puntuacion >= umbral else None
+
+    def en_texto(self, texto, umbral=UMBRAL_SIMILITUD):
+        """
+        Médico mencionado en una frase libre: nombre exacto en cualquier parte,
+        o aproximado en las 1-2 palabras que siguen a un título ("doctor perez").
+        """
+        palabras = normalizar(texto).split()
+        candidatos = []
+        for i, palabra in enumerate(palabras):
+            for n in (1, 2):
+                grupo = " ".join(palabras[i:i + n])
+                if len(palabras[i:i + n]) == n and grupo in self._por_clave:
+                    return self._por_clave[grupo]
+            if palabra in PALABRAS_TITULO:
+                candidatos += [" ".join(palabras[i + 1:i + 1 + n]) for n in (1, 2) if i + n < len(palabras)]
+        mejor, puntuacion = None, umbral
+        for candidato in candidatos:
+            medico, p = self._puntuar(candidato)
+            if p >= puntuacion:
+                mejor, puntuacion = medico, p
+        return mejor
+
+    def describir(self, maximo=5):
+        """'Dr. Vega (Endodoncia), ... o Dra. Paredes (Cirugia Oral)' para la pregunta del chatbot."""
+        partes = [f"{self.nombre(m)} ({self._especialidad[m]})" for m in self.medicos[:maximo]]
+        if len(self.medicos) > maximo:
+            return ", ".join(partes) + f" y {len(self.medicos) - maximo} más"
+        return " o ".join([", ".join(partes[:-1]), partes[-1]]) if len(partes) > 1 else "".join(partes)
+
+
+# --- Carga (se relee si cambia el archivo) ---
+@functools.lru_cache(maxsize=2)
+def _cargar(ruta, mtime):
+    with open(ruta, newline="", encoding="utf-8") as f:
+        resultado = Directorio(csv.DictReader(f))
+    registrar("directorio_medicos_cargado", modulo="directorio", archivo=ruta, medicos=len(resultado))
+    return resultado
+
+
+@functools.lru_cache(maxsize=2)
+def _vacio(ruta):
+    registrar("directorio_medicos_no_encontrado", nivel="warning", modulo="directorio", archivo=ruta)
+    return Directorio([])
+
+
+def directorio(ruta=MEDICOS_CSV):
+    try:
+        return _cargar(ruta, os.path.getmtime(ruta))
+    except FileNotFoundError:
+        return _vacio(ruta)
+
+
+# --- Atajos ---
+def medicos():
+    return list(directorio().medicos)
+
+
+def especialidad(medico):
+    return directorio().especialidad(medico)
+
+
+def buscar(texto):
+    return directorio().buscar(texto)
+
+
+def en_texto(texto):
+    return directorio().en_texto(texto)
+
+
+def describir():
+    return directorio().describir()
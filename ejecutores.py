@@ -0,0 +1,34 @@
+# ============================================================
+# 🧵 Pools de Ejecución (versión async del pipeline)
+# ============================================================
+# Cada tipo de trabajo bloqueante tiene su propio pool acotado, así una
+# síntesis TTS larga no ocupa los hilos que esperan a Google Sheets y el
+# bucle de eventos queda libre para atender cientos de conversaciones.
+# Las etapas de CPU (spaCy, scikit-learn, torch) liberan el GIL en su parte
+# pesada, por eso bastan hilos y los modelos se comparten en memoria.
+import asyncio
+import contextvars
+import functools
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+# --- Tamaños (sobrescribibles por variables de entorno) ---
+HILOS_IO = int(os.environ.get("HILOS_IO", 32))    # Google Sheets / almacenamiento (espera de red)
+HILOS_NLP = int(os.environ.get("HILOS_NLP", 2))   # spaCy (intención + entidades)
+HILOS_ML = int(os.environ.get("HILOS_ML", 2))     # Predicción No-Show
+HILOS_TTS = int(os.environ.get("HILOS_TTS", 1))   # Coqui TTS (el modelo no es reentrante)
+HILOS_STT = int(os.environ.get("HILOS_STT", 8))   # faster-whisper: esperan aquí y transcriptor.py los agrupa en lotes
+
+EJECUTOR_IO = ThreadPoolExecutor(max_workers=HILOS_IO, thread_name_prefix="io")
+EJECUTOR_NLP = ThreadPoolExecutor(max_workers=HILOS_NLP, thread_name_prefix="nlp")
+EJECUTOR_ML = ThreadPoolExecutor(max_workers=HILOS_ML, thread_name_prefix="ml")
+EJECUTOR_TTS = ThreadPoolExecutor(max_workers=HILOS_TTS, thread_name_prefix="tts")
+EJECUTOR_STT = ThreadPoolExecutor(max_workers=HILOS_STT, thread_name_prefix="stt")
+
+
+async def en_pool(ejecutor, funcion, *args, **kwargs):
+    """Ejecuta 'funcion' bloqueante en 'ejecutor' y la espera sin bloquear el bucle de eventos."""
+    loop = asyncio.get_running_loop()
+    # Se copia el contexto para que el id de la petición (trazas) siga en el hilo del pool
+    contexto = contextvars.copy_context()
+    return await loop.run_in_executor(ejecutor, functools.partial(contexto.run, funcion, *args, **kwargs))
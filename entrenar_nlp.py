@@ -1,6 +1,7 @@
 # entrenar_nlp.py
 import spacy
 from spacy.training import Example
+from spacy.tokens import DocBin
 import pandas as pd
 from sklearn.model_selection import train_test_split
 from sklearn.metrics import classification_report, f1_score
@@ -10,6 +11,11 @@ from google.oauth2.service_account import Credentials
 import re
 import os # ⭐️ Añadido para la lógica de HF
 import json # ⭐️ Añadido para la lógica de HF
+import time
+import hashlib
+import argparse
+import shutil
+import numpy as np
 
 
 # --- Configuración ---
@@ -18,6 +24,50 @@ NOMBRE_HOJA_DATASET = "Dataset_Intenciones"
 CARPETA_MODELO_GUARDADO = "modelo_intent_spacy"
 INTENTS_VALIDOS = ["agendar", "consultar", "cancelar"]
 
+# Corpus preparado (DocBin) reutilizable entre ejecuciones
+CARPETA_CORPUS = "corpus_intenciones"
+PARTICIONES_CORPUS = ("train", "dev", "test")
+
+# Entrenamiento con parada temprana sobre 'dev'
+MAX_EPOCAS = 30
+PACIENCIA = 4 # Épocas sin mejorar el F1 de dev antes de parar
+TAMANO_LOTE_EVAL = 256
+
+# --- Barrido de arquitecturas textcat (latencia vs. F1) ---
+CARPETA_BARRIDO = "barrido_textcat"
+META_F1 = 0.90 # Misma meta que evaluar_modelo
+REPETICIONES_LATENCIA = 5 # Pasadas por el set de benchmark al medir latencia
+
+
+def _bow(length, ngram_size=1):
+    return {"@architectures": "spacy.TextCatBOW.v3", "exclusive_classes": True,
+            "length": length, "ngram_size": ngram_size, "no_output_layer": False, "nO": None}
+
+
+def _ensemble(length, width, rows):
+    return {
+        "@architectures": "spacy.TextCatEnsemble.v2", "nO": None,
+        "linear_model": _bow(length),
+        "tok2vec": {
+            "@architectures": "spacy.Tok2Vec.v2",
+            "embed": {"@architectures": "spacy.MultiHashEmbed.v2", "width": width, "rows": rows,
+                      "attrs": ["NORM", "LOWER", "PREFIX", "SUFFIX", "SHAPE"], "include_static_vectors": False},
+            "encode": {"@architectures": "spacy.MaxoutWindowEncoder.v2", "width": width,
+                       "window_size": 1, "maxout_pieces": 3, "depth": 2},
+        },
+    }
+
+
+# Variantes, de la más ligera a la actual (config.cfg: ensemble con BOW de 262144 filas)
+ARQUITECTURAS_TEXTCAT = {
+    "bow_4k":            _bow(4096),
+    "bow_16k":           _bow(16384),
+    "bow_16k_bigramas":  _bow(16384, ngram_size=2),
+    "bow_262k":          _bow(262144),
+    "ensemble_reducido": _ensemble(16384, 32, [500, 500, 200, 200, 200]),
+    "ensemble":          _ensemble(262144, 64, [2000, 2000, 500, 1000, 500]),
+}
+
 # =========================================================================
 # ⚠️ ADVERTENCIA: La lista EJEMPLOS_LOCALES usa claves diferentes a INTENTS_VALIDOS.
 # Las claves deben ser 'agendar', 'consultar', 'cancelar' para que spaCy las reconozca.
@@ -152,14 +202,89 @@ def cargar_y_preparar_datos_gsheets():
     except FileNotFoundError: print("❌ Error: No se encontró 'credenciales.json'."); return None
     except Exception as e: print(f"❌ Error al cargar/preparar datos GSheets: {e}"); return None
 
+# --- 1b. Corpus en DocBin (se prepara una vez y se reutiliza) ---
+def _huella_datos(datos):
+    """Hash del dataset; se guarda en meta.json para identificar qué datos generaron el corpus."""
+    h = hashlib.sha256()
+    for texto, anotacion in datos:
+        h.update(texto.encode("utf-8"))
+        h.update(json.dumps(anotacion["cats"], sort_keys=True).encode("utf-8"))
+    return h.hexdigest()
+
+
+def guardar_corpus_docbin(datos_completos, carpeta=CARPETA_CORPUS):
+    """
+    Divide los datos en train/dev/test y guarda cada partición como DocBin.
+    Así los Doc se tokenizan una sola vez y las particiones son estables entre ejecuciones.
+    """
+    train_dev, test = train_test_split(datos_completos, test_size=0.2, random_state=42)
+    train, dev = train_test_split(train_dev, test_size=0.15, random_state=42)
+    particiones = {"train": train, "dev": dev, "test": test}
+
+    nlp = spacy.blank("es")
+    os.makedirs(carpeta, exist_ok=True)
+    for nombre, datos in particiones.items():
+        docs = []
+        for doc, anotacion in zip(nlp.pipe(t for t, _ in datos), (a for _, a in datos)):
+            doc.cats = {intent: float(bool(anotacion["cats"].get(intent))) for intent in INTENTS_VALIDOS}
+            docs.append(doc)
+        DocBin(docs=docs, store_user_data=False).to_disk(os.path.join(carpeta, f"{nombre}.spacy"))
+
+    meta = {"huella": _huella_datos(datos_completos), **{n: len(d) for n, d in particiones.items()}}
+    with open(os.path.join(carpeta, "meta.json"), "w", encoding="utf-8") as f:
+        json.dump(meta, f, indent=2)
+    print(f"💾 Corpus guardado en '{carpeta}': {len(train)} train, {len(dev)} dev, {len(test)} test.")
+
+
+def cargar_corpus_docbin(carpeta=CARPETA_CORPUS, huella=None):
+    """
+    Devuelve {'train'|'dev'|'test': DocBin} o None si el corpus no existe o si
+    se pasa 'huella' y no coincide con la de meta.json (el dataset cambió).
+    """
+    rutas = {n: os.path.join(carpeta, f"{n}.spacy") for n in PARTICIONES_CORPUS}
+    if not all(os.path.exists(r) for r in rutas.values()):
+        return None
+    if huella is not None:
+        try:
+            with open(os.path.join(carpeta, "meta.json"), encoding="utf-8") as f:
+                huella_guardada = json.load(f).get("huella")
+        except (OSError, ValueError):
+            huella_guardada = None
+        if huella_guardada != huella:
+            print(f"🔄 El dataset cambió desde que se generó el corpus en '{carpeta}': se regenera.")
+            return None
+    corpus = {n: DocBin().from_disk(r) for n, r in rutas.items()}
+    print(f"✅ Corpus cargado desde '{carpeta}': " + ", ".join(f"{len(db)} {n}" for n, db in corpus.items()))
+    return corpus
+
+
+def docs_a_datos(docs):
+    """Convierte Doc con cats al formato (texto, {'cats': ...}) que usa evaluar_modelo."""
+    return [(doc.text, {"cats": dict(doc.cats)}) for doc in docs]
+
+
 # --- 2. Entrenar Modelo spaCy textcat (CORREGIDO) ---
-def entrenar_modelo_spacy(datos_entrenamiento, carpeta_salida):
-    """Entrena un modelo textcat de spaCy."""
+def _predecir_lote(nlp_modelo, textos):
+    """Predice las intenciones de varios textos en lote con nlp.pipe."""
+    return [max(doc.cats, key=doc.cats.get) for doc in nlp_modelo.pipe(textos, batch_size=TAMANO_LOTE_EVAL)]
+
+
+def _intencion_real(cats):
+    return max(cats, key=cats.get)
+
+
+def entrenar_modelo_spacy(corpus, carpeta_salida, max_epocas=MAX_EPOCAS, paciencia=PACIENCIA, modelo_textcat=None):
+    """
+    Entrena un modelo textcat de spaCy con parada temprana sobre 'dev'.
+    'corpus' es el dict de DocBin devuelto por cargar_corpus_docbin.
+    'modelo_textcat' es la arquitectura (ver ARQUITECTURAS_TEXTCAT); None usa la de spaCy por defecto.
+    """
     print("🧠 Iniciando entrenamiento del modelo spaCy...")
 
     nlp = spacy.blank("es")  # modelo base en blanco
     if "textcat" not in nlp.pipe_names:
-        textcat = nlp.add_pipe("textcat")
+        config = {"model": modelo_textcat} if modelo_textcat else {}
+        textcat = nlp.add_pipe("textcat", config=config)
     else:
         textcat = nlp.get_pipe("textcat")
 
@@ -167,30 +292,45 @@ def entrenar_modelo_spacy(datos_entrenamiento, carpeta_salida):
     for intent in INTENTS_VALIDOS:
         textcat.add_label(intent)
 
-    # Definir hiperparámetros de entrenamiento
-    n_iter = 10               # 🔁 Número de épocas (puedes ajustar entre 5–20)
-    batch_sizes = [8, 16, 32] # 📦 Tamaños de lote para minibatch
+    # Los Example se construyen una sola vez (no en cada época)
+    docs_train = list(corpus["train"].get_docs(nlp.vocab))
+    ejemplos_train = [Example(nlp.make_doc(doc.text), doc) for doc in docs_train]
+    docs_dev = list(corpus["dev"].get_docs(nlp.vocab))
+    textos_dev = [doc.text for doc in docs_dev]
+    reales_dev = [_intencion_real(doc.cats) for doc in docs_dev]
 
     # Inicializar el optimizador
-    optimizer = nlp.initialize()
+    optimizer = nlp.initialize(lambda: ejemplos_train)
 
-    print("Iniciando bucle de entrenamiento...")
-    for i in range(n_iter):
-        random.shuffle(datos_entrenamiento)
-        from spacy.util import compounding
-        batches = spacy.util.minibatch(datos_entrenamiento, size=compounding(4.0, 32.0, 1.5))
+    mejor_f1, mejor_epoca, mejor_modelo = -1.0, 0, None
+    print(f"Iniciando bucle de entrenamiento (máx. {max_epocas} épocas, paciencia {paciencia})...")
+    for i in range(max_epocas):
+        inicio = time.perf_counter()
+        random.shuffle(ejemplos_train)
+        batches = spacy.util.minibatch(ejemplos_train, size=spacy.util.compounding(4.0, 32.0, 1.5))
         losses = {}
         batch_count = 0
         for batch in batches:
-            texts, annotations = zip(*batch)
-            examples = [Example.from_dict(nlp.make_doc(t), a) for t, a in zip(texts, annotations)]
-
             try:
-                nlp.update(examples, sgd=optimizer, drop=0.2, losses=losses)
+                nlp.update(batch, sgd=optimizer, drop=0.2, losses=losses)
                 batch_count += 1
             except Exception as e_update:
                 print(f"❌ Error durante nlp.update en batch {batch_count}: {e_update}")
-        print(f"  Época {i+1}/{n_iter}, Pérdida: {losses.get('textcat', 0.0):.3f}")
+
+        f1_dev = f1_score(reales_dev, _predecir_lote(nlp, textos_dev), average='macro', zero_division=0) if textos_dev else 0.0
+        duracion = time.perf_counter() - inicio
+        print(f"  Época {i+1}/{max_epocas}, Pérdida: {losses.get('textcat', 0.0):.3f}, F1 dev: {f1_dev:.4f}, Tiempo: {duracion:.2f}s")
+
+        if f1_dev > mejor_f1:
+            mejor_f1, mejor_epoca = f1_dev, i + 1
+            mejor_modelo = nlp.to_bytes()
+        elif i + 1 - mejor_epoca >= paciencia:
+            print(f"⏹️ Parada temprana: sin mejora en dev desde la época {mejor_epoca}.")
+            break
+
+    if mejor_modelo is not None:
+        nlp.from_bytes(mejor_modelo)
+        print(f"✅ Se conserva el modelo de la época {mejor_epoca} (F1 dev: {mejor_f1:.4f}).")
 
     # Guardar modelo
     try:
@@ -203,41 +343,141 @@ def entrenar_modelo_spacy(datos_entrenamiento, carpeta_salida):
 
 
 
-# --- 3. Evaluar Modelo (Sin cambios) ---
+# --- 3. Evaluar Modelo (en lote con nlp.pipe) ---
 def evaluar_modelo(nlp_modelo, datos_prueba):
     print("\n📊 Evaluando modelo...")
     textos_prueba, anotaciones_prueba = zip(*datos_prueba)
-    predicciones = []
-    reales = []
-    for texto, anotacion in zip(textos_prueba, anotaciones_prueba):
-        doc = nlp_modelo(texto)
-        prediccion = max(doc.cats, key=doc.cats.get)
-        predicciones.append(prediccion)
-        real = [intent for intent, valor in anotacion['cats'].items() if valor][0]
-        reales.append(real)
+    inicio = time.perf_counter()
+    predicciones = _predecir_lote(nlp_modelo, list(textos_prueba))
+    duracion = time.perf_counter() - inicio
+    reales = [_intencion_real(anotacion['cats']) for anotacion in anotaciones_prueba]
 
     f1_macro = f1_score(reales, predicciones, average='macro', zero_division=0)
-    print(f"\n  F1-Score (macro): {f1_macro:.4f}")
+    print(f"\n  F1-Score (macro): {f1_macro:.4f}  ({len(reales)} textos en {duracion:.3f}s)")
     print("\n  Reporte de Clasificación Detallado:")
     print(classification_report(reales, predicciones, zero_division=0))
 
     if f1_macro >= 0.90: print("\n🎉 ¡Meta cumplida! F1-Score >= 0.90")
     else: print("\n⚠️ F1-Score < 0.90. El modelo necesita mejorar.")
+    return f1_macro
+
+# --- 4. Barrido de Arquitecturas (latencia vs. F1) ---
+def _tamano_carpeta(carpeta):
+    return sum(os.path.getsize(os.path.join(raiz, f)) for raiz, _, archivos in os.walk(carpeta) for f in archivos)
+
+
+def medir_latencia(nlp_modelo, textos, repeticiones=REPETICIONES_LATENCIA):
+    """Latencia por mensaje (ms) llamando nlp(texto) uno a uno, como en procesador_nlp."""
+    for texto in textos[:10]:  # Calentamiento
+        nlp_modelo(texto)
+    tiempos = []
+    for _ in range(repeticiones):
+        for texto in textos:
+            inicio = time.perf_counter()
+            nlp_modelo(texto)
+            tiempos.append((time.perf_counter() - inicio) * 1000)
+    return float(np.percentile(tiempos, 50)), float(np.percentile(tiempos, 99))
+
+
+def frente_pareto(resultados):
+    """Variantes no dominadas: ninguna otra tiene F1 dev >= y latencia p99 y tamaño <= (con alguna estricta)."""
+    def domina(a, b):
+        no_peor = a["f1_dev"] >= b["f1_dev"] and a["p99_ms"] <= b["p99_ms"] and a["tamano_mb"] <= b["tamano_mb"]
+        mejor = a["f1_dev"] > b["f1_dev"] or a["p99_ms"] < b["p99_ms"] or a["tamano_mb"] < b["tamano_mb"]
+        return no_peor and mejor
+    return [r for r in resultados if not any(domina(o, r) for o in resultados if o is not r)]
+
+
+def barrido_arquitecturas(corpus, variantes=None, carpeta=CARPETA_BARRIDO, carpeta_salida=CARPETA_MODELO_GUARDADO,
+                          max_epocas=MAX_EPOCAS, paciencia=PACIENCIA):
+    """
+    Entrena cada arquitectura de 'variantes', mide F1 macro en dev, latencia p50/p99
+    por mensaje y tamaño en disco. Guarda en 'carpeta_salida' la variante más barata
+    del frente de Pareto que cumple META_F1 (o la de mejor F1 si ninguna la cumple).
+    La selección solo mira dev: test se evalúa una vez, con la elegida, para el informe.
+    """
+    variantes = variantes or list(ARQUITECTURAS_TEXTCAT)
+    os.makedirs(carpeta, exist_ok=True)
+    resultados = []
+
+    for nombre in variantes:
+        print(f"\n{'=' * 60}\n🔬 Variante: {nombre}\n{'=' * 60}")
+        carpeta_variante = os.path.join(carpeta, nombre)
+        nlp = entrenar_modelo_spacy(corpus, carpeta_variante, max_epocas=max_epocas, paciencia=paciencia,
+                                    modelo_textcat=ARQUITECTURAS_TEXTCAT[nombre])
+        if nlp is None:
+            continue
+        # Set de benchmark fijo: las frases de dev del corpus (test queda para la elegida)
+        datos_dev = docs_a_datos(corpus["dev"].get_docs(nlp.vocab))
+        f1 = evaluar_modelo(nlp, datos_dev)
+        p50, p99 = medir_latencia(nlp, [t for t, _ in datos_dev])
+        resultados.append({
+            "variante": nombre, "f1_dev": round(f1, 4), "p50_ms": round(p50, 3), "p99_ms": round(p99, 3),
+            "tamano_mb": round(_tamano_carpeta(carpeta_variante) / 1e6, 2), "carpeta": carpeta_variante,
+        })
+
+    if not resultados:
+        print("❌ Ninguna variante se pudo entrenar.")
+        return None
+
+    pareto = frente_pareto(resultados)
+    print(f"\n{'Variante':<20}{'F1 dev':>8}{'p50 ms':>10}{'p99 ms':>10}{'MB':>8}  Pareto")
+    for r in resultados:
+        marca = "  ★" if r in pareto else ""
+        print(f"{r['variante']:<20}{r['f1_dev']:>8.4f}{r['p50_ms']:>10.3f}{r['p99_ms']:>10.3f}{r['tamano_mb']:>8.2f}{marca}")
+
+    candidatos = [r for r in pareto if r["f1_dev"] >= META_F1]
+    if candidatos:
+        elegido = min(candidatos, key=lambda r: (r["p99_ms"], r["tamano_mb"]))
+        print(f"\n🎉 Elegida '{elegido['variante']}': la más barata con F1 dev >= {META_F1}.")
+    else:
+        elegido = max(resultados, key=lambda r: (r["f1_dev"], -r["p99_ms"]))
+        print(f"\n⚠️ Ninguna variante alcanza F1 dev >= {META_F1}. Se usa la de mejor F1: '{elegido['variante']}'.")
+
+    # Única evaluación en test: la cifra que se reporta, sin influir en la elección
+    nlp_elegido = spacy.load(elegido["carpeta"])
+    elegido["f1_test"] = round(evaluar_modelo(nlp_elegido, docs_a_datos(corpus["test"].get_docs(nlp_elegido.vocab))), 4)
+    print(f"📊 '{elegido['variante']}': F1 test = {elegido['f1_test']:.4f}")
+
+    shutil.rmtree(carpeta_salida, ignore_errors=True)
+    shutil.copytree(elegido["carpeta"], carpeta_salida)
+    print(f"💾 Modelo '{elegido['variante']}' copiado a: {carpeta_salida}")
+
+    with open(os.path.join(carpeta, "resultados.json"), "w", encoding="utf-8") as f:
+        json.dump({"resultados": resultados, "pareto": [r["variante"] for r in pareto],
+                   "elegido": elegido["variante"], "f1_test_elegido": elegido["f1_test"], "meta_f1": META_F1}, f, ensure_ascii=False, indent=2)
+    return elegido
 
-# --- Ejecución Principal ---
 # --- Ejecución Principal ---
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Entrena el clasificador de intenciones spaCy.")
+    parser.add_argument("--refrescar-corpus", action="store_true",
+                        help="Regenera el corpus DocBin aunque su huella coincida con la del dataset.")
+    parser.add_argument("--max-epocas", type=int, default=MAX_EPOCAS)
+    parser.add_argument("--paciencia", type=int, default=PACIENCIA)
+    parser.add_argument("--barrido", nargs="*", metavar="VARIANTE", choices=list(ARQUITECTURAS_TEXTCAT),
+                        help="Compara arquitecturas textcat (todas si no se indican) y guarda la óptima.")
+    args = parser.parse_args()
+
     datos_completos = cargar_y_preparar_datos_gsheets()
 
     # Si no se pudieron cargar los datos desde GSheets, usa ejemplos locales
     if not datos_completos:
         print("⚠️ No se pudo cargar dataset desde Google Sheets. Usando ejemplos locales por defecto...")
-        datos_comleto = adaptar_ejemplos_locales(EJEMPLOS_LOCALES)  # ✅ corregido
+        datos_completos = adaptar_ejemplos_locales(EJEMPLOS_LOCALES)
+
+    # El DocBin se reutiliza solo si se generó con estos mismos datos (huella en meta.json)
+    corpus = None if args.refrescar_corpus else cargar_corpus_docbin(huella=_huella_datos(datos_completos))
+    if corpus is None:
+        guardar_corpus_docbin(datos_completos)
+        corpus = cargar_corpus_docbin()
 
-    if datos_completos:
-        train_data, test_data = train_test_split(datos_completos, test_size=0.2, random_state=42)
-        print(f"\nDatos divididos: {len(train_data)} para entrenar, {len(test_data)} para probar.")
-        modelo_entrenado = entrenar_modelo_spacy(train_data, CARPETA_MODELO_GUARDADO)
+    if corpus and args.barrido is not None:
+        barrido_arquitecturas(corpus, variantes=args.barrido, max_epocas=args.max_epocas, paciencia=args.paciencia)
+    elif corpus:
+        modelo_entrenado = entrenar_modelo_spacy(corpus, CARPETA_MODELO_GUARDADO,
+                                                 max_epocas=args.max_epocas, paciencia=args.paciencia)
+        test_data = docs_a_datos(corpus["test"].get_docs(modelo_entrenado.vocab)) if modelo_entrenado else []
         if modelo_entrenado and test_data:
             evaluar_modelo(modelo_entrenado, test_data)
         else:
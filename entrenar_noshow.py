@@ -1,22 +1,62 @@
 import pandas as pd
-from sklearn.model_selection import train_test_split
+import numpy as np
+import argparse
+import time
+from sklearn.model_selection import train_test_split, GridSearchCV, StratifiedKFold
 from sklearn.linear_model import LogisticRegression
 from sklearn.neighbors import KNeighborsClassifier
 from sklearn.preprocessing import LabelEncoder, OneHotEncoder
 from sklearn.compose import ColumnTransformer
+from sklearn.pipeline import Pipeline
 from sklearn.metrics import accuracy_score, roc_auc_score, confusion_matrix, classification_report
 import gspread
 from google.oauth2.service_account import Credentials
 import joblib # Para guardar el modelo
 import os # ⭐️ Añadido para la lógica de HF
 import json # ⭐️ Añadido para la lógica de HF
+from datetime import datetime
+from registro_modelos import CARPETA_MODELOS_NOSHOW, ARCHIVO_PUNTERO, calcular_sha256, escribir_json_atomico
 
 # --- Configuración ---
 NOMBRE_DOCUMENTO = "Base de Datos Citas (Proyecto Voz y Chat)"
 NOMBRE_HOJA_TRAINING = "Training_NoShow"
 MODELO_A_USAR = "logistic" # Puedes cambiar a "knn"
-ARCHIVO_MODELO_GUARDADO = "modelo_noshow.joblib"
-ARCHIVO_PREPROCESADOR_GUARDADO = "preprocesador_noshow.joblib"
+VERSIONES_A_CONSERVAR = 5 # Versiones antiguas del Pipeline que se mantienen en disco
+
+# Esquema de entrada del Pipeline (se guarda en el manifiesto)
+COLUMNAS_CATEGORICAS = ['Dia_Semana', 'Hora_Bloque']
+COLUMNAS_NUMERICAS = ['Ant_No_Shows', 'Distancia_Km']
+
+# --- Fuente local (CSV/Parquet) ---
+ARCHIVO_TRAINING_LOCAL = "data/Training_NoShow.csv"
+FILAS_POR_BLOQUE = 200_000 # Tamaño de cada bloque leído del archivo
+
+# Mapeo declarativo: columna esperada por preparar_datos -> cómo obtenerla del archivo.
+#   origen:   columna en el archivo (None si no existe)
+#   defecto:  valor cuando no hay columna de origen o viene vacía
+#   invertir: 1 - valor (el histórico guarda No_Show=1, aquí se espera asistio=1)
+#   obligatoria: las filas sin valor se descartan (el objetivo: vacío no es "faltó")
+MAPEO_COLUMNAS_LOCAL = {
+    'Dia_Semana':   {'origen': 'Dia_Semana'},
+    'Hora_Bloque':  {'origen': 'Hora_Bloque'},
+    'Ant_No_Shows': {'origen': 'Historial_NoShow', 'defecto': 0},
+    'Distancia_Km': {'origen': None, 'defecto': 5}, # No existe en el histórico (mismo placeholder que chatbot_logic)
+    'asistio':      {'origen': 'No_Show', 'invertir': True, 'obligatoria': True},
+}
+
+# --- Búsqueda de modelo (validación cruzada en paralelo) ---
+PLIEGUES_CV = 5
+ESPACIO_BUSQUEDA = {
+    "logistic": {
+        "modelo": [LogisticRegression(random_state=42, class_weight='balanced', max_iter=1000)],
+        "modelo__C": [0.01, 0.1, 1.0, 10.0],
+    },
+    "knn": {
+        "modelo": [KNeighborsClassifier()],
+        "modelo__n_neighbors": [5, 15, 45],
+        "modelo__weights": ["uniform", "distance"],
+    },
+}
 
 # --- 1. Cargar Datos desde Google Sheets ---
 def cargar_datos_gsheets():
@@ -49,7 +89,92 @@ def cargar_datos_gsheets():
         print(f"❌ Error al cargar datos: {e}")
         return None
 
+# --- 1b. Cargar Datos desde archivo local (CSV/Parquet por bloques) ---
+def _aplicar_mapeo(bloque, mapeo):
+    """Convierte un bloque del archivo al esquema que espera preparar_datos."""
+    salida = {}
+    for destino, regla in mapeo.items():
+        origen = regla.get('origen')
+        if origen is not None and origen in bloque.columns:
+            col = bloque[origen]
+        else:
+            col = pd.Series(regla.get('defecto'), index=bloque.index)
+        if destino in COLUMNAS_CATEGORICAS:
+            salida[destino] = col.astype('category') # Ocupa mucho menos que object con millones de filas
+        else:
+            col = pd.to_numeric(col, errors='coerce')
+            if 'defecto' in regla:
+                col = col.fillna(regla['defecto'])
+            if regla.get('invertir'):
+                col = 1 - col
+            salida[destino] = col.astype('float32')
+    salida = pd.DataFrame(salida)
+    obligatorias = [destino for destino, regla in mapeo.items() if regla.get('obligatoria')]
+    return salida.dropna(subset=obligatorias) if obligatorias else salida
+
+
+def _iterar_bloques(ruta, columnas, filas_por_bloque):
+    """Genera DataFrames de 'filas_por_bloque' filas leyendo solo 'columnas'."""
+    if ruta.endswith(".parquet"):
+        try:
+            import pyarrow.parquet as pq
+        except ImportError:
+            raise ImportError("Leer Parquet requiere 'pyarrow' (pip install pyarrow).")
+        archivo = pq.ParquetFile(ruta)
+        columnas = [c for c in columnas if c in archivo.schema_arrow.names]
+        for lote in archivo.iter_batches(batch_size=filas_por_bloque, columns=columnas):
+            yield lote.to_pandas()
+        return
+
+    # Algunos CSV exportados traen el encabezado completo entre comillas ("A,B,C")
+    with open(ruta, encoding="utf-8") as f:
+        encabezado = f.readline().strip()
+    opciones = {}
+    if encabezado.startswith('"') and encabezado.endswith('"') and "," in encabezado:
+        opciones = {"names": encabezado.strip('"').split(","), "skiprows": 1}
+        nombres = opciones["names"]
+    else:
+        nombres = encabezado.split(",")
+    usecols = [c for c in columnas if c in nombres]
+    yield from pd.read_csv(ruta, usecols=usecols, chunksize=filas_por_bloque, **opciones)
+
+
+def cargar_datos_locales(ruta=ARCHIVO_TRAINING_LOCAL, mapeo=MAPEO_COLUMNAS_LOCAL, filas_por_bloque=FILAS_POR_BLOQUE):
+    """
+    Carga el histórico de entrenamiento desde un CSV o Parquet local, por bloques,
+    aplicando 'mapeo' para producir las columnas que espera preparar_datos.
+    """
+    print(f"📥 Cargando datos locales desde '{ruta}' (bloques de {filas_por_bloque} filas)...")
+    columnas = [r['origen'] for r in mapeo.values() if r.get('origen')]
+    try:
+        bloques = []
+        for i, bloque in enumerate(_iterar_bloques(ruta, columnas, filas_por_bloque)):
+            bloques.append(_aplicar_mapeo(bloque, mapeo))
+            print(f"  Bloque {i + 1}: {len(bloque)} filas")
+        if not bloques or sum(len(b) for b in bloques) == 0:
+            raise ValueError("El archivo de entrenamiento está vacío.")
+        # Si los bloques traen categorías distintas, concat devuelve 'object': se vuelve a convertir
+        df = pd.concat(bloques, ignore_index=True)
+        for col in COLUMNAS_CATEGORICAS:
+            df[col] = df[col].astype('category')
+        print(f"✅ Datos cargados: {len(df)} filas.")
+        return df
+    except Exception as e:
+        print(f"❌ Error al cargar datos locales: {e}")
+        return None
+
 # --- 2. Preparar Datos (Feature Engineering) ---
+def construir_preprocesador():
+    """OneHotEncoder para Dia_Semana/Hora_Bloque y las numéricas sin cambios."""
+    return ColumnTransformer(
+        transformers=[
+            ('cat', OneHotEncoder(handle_unknown='ignore'), COLUMNAS_CATEGORICAS), # Convierte Lunes, Martes.. en 0s y 1s
+            ('num', 'passthrough', COLUMNAS_NUMERICAS) # Deja las numéricas como están
+        ],
+        remainder='drop' # Ignora otras columnas si las hubiera
+    )
+
+
 def preparar_datos(df):
     """Preprocesa los datos para el modelo de ML."""
     print("⚙️ Preparando datos...")
@@ -74,7 +199,12 @@ def preparar_datos(df):
     # ¡IMPORTANTE! Confirma si en tu hoja 'asistio'=0 significa NO asistió.
     # Si es al revés, invierte la lógica aquí.
     if 'asistio' in df.columns:
-         y = df['asistio'].apply(lambda x: 0 if x == 1 else 1) # Asumiendo asistio=1 es SÍ, No_Show=0. Queremos predecir No_Show=1 (faltó)
+         # Sin objetivo no hay etiqueta: (NaN != 1) la contaría como "faltó"
+         asistio = pd.to_numeric(df['asistio'], errors='coerce')
+         if asistio.isna().any():
+             print(f"⚠️ Se descartan {int(asistio.isna().sum())} filas sin valor en 'asistio'.")
+             X, asistio = X[asistio.notna()], asistio[asistio.notna()]
+         y = (asistio != 1).astype(int) # Asumiendo asistio=1 es SÍ, No_Show=0. Queremos predecir No_Show=1 (faltó)
          print("\nVariable objetivo 'No_Show' (1=Faltó, 0=Asistió):")
          print(y.value_counts())
     else:
@@ -82,34 +212,16 @@ def preparar_datos(df):
         return None, None, None
 
     # b) Convertir categóricas a numéricas
-    # Usaremos OneHotEncoder para Dia_Semana y Hora_Bloque
-    columnas_categoricas = ['Dia_Semana', 'Hora_Bloque']
-    columnas_numericas = ['Ant_No_Shows', 'Distancia_Km']
-
-    # Crear el preprocesador
-    preprocesador = ColumnTransformer(
-        transformers=[
-            ('cat', OneHotEncoder(handle_unknown='ignore'), columnas_categoricas), # Convierte Lunes, Martes.. en 0s y 1s
-            ('num', 'passthrough', columnas_numericas) # Deja las numéricas como están
-        ],
-        remainder='drop' # Ignora otras columnas si las hubiera
-    )
-
-    # c) Aplicar el preprocesador
-    print("Aplicando preprocesamiento (OneHotEncoder)...")
-    X_procesado = preprocesador.fit_transform(X)
-    print(f"✅ Datos preparados. Shape de X_procesado: {X_procesado.shape}")
-
-    # Guardar el preprocesador para usarlo después en la predicción
-    joblib.dump(preprocesador, ARCHIVO_PREPROCESADOR_GUARDADO)
-    print(f"💾 Preprocesador guardado en {ARCHIVO_PREPROCESADOR_GUARDADO}")
-
+    # El preprocesador se ajusta junto al modelo dentro de un único Pipeline
+    # (ver entrenar_modelo), así se serializa y carga como un solo artefacto.
+    preprocesador = construir_preprocesador()
+    print(f"✅ Datos preparados. Shape de X: {X.shape}")
 
-    return X_procesado, y, preprocesador
+    return X, y, preprocesador
 
 # --- 3. Entrenar Modelo ---
-def entrenar_modelo(X, y, tipo_modelo="logistic"):
-    """Entrena un modelo de clasificación."""
+def entrenar_modelo(X, y, preprocesador, tipo_modelo="logistic"):
+    """Entrena un Pipeline (preprocesador + clasificador)."""
     print(f"\n🧠 Entrenando modelo: {tipo_modelo.upper()}...")
 
     # Dividir datos en entrenamiento y prueba (80/20)
@@ -126,9 +238,55 @@ def entrenar_modelo(X, y, tipo_modelo="logistic"):
         print(f"❌ Modelo '{tipo_modelo}' no soportado. Usando Regresión Logística.")
         modelo = LogisticRegression(random_state=42, class_weight='balanced')
 
-    modelo.fit(X_train, y_train)
+    pipeline = Pipeline([("preprocesador", preprocesador), ("modelo", modelo)])
+    pipeline.fit(X_train, y_train)
     print("✅ Modelo entrenado.")
-    return modelo, X_test, y_test
+    return pipeline, X_test, y_test
+
+# --- 3b. Búsqueda de Modelo (logistic/KNN + hiperparámetros, en paralelo) ---
+def buscar_mejor_modelo(X, y, preprocesador, tipos_modelo=("logistic", "knn"), n_jobs=-1, pliegues=PLIEGUES_CV):
+    """
+    Elige entre los tipos de modelo y sus hiperparámetros con validación cruzada
+    (AUC) repartida en 'n_jobs' procesos. Devuelve el mejor Pipeline reajustado,
+    el conjunto de prueba y un resumen con tiempos de ajuste.
+    """
+    print(f"\n🔎 Búsqueda de modelo: {', '.join(tipos_modelo)} ({pliegues} pliegues, n_jobs={n_jobs})...")
+
+    stratify_target = y if len(y.unique()) > 1 else None
+    X_train, X_test, y_train, y_test = train_test_split(X, y, test_size=0.2, random_state=42, stratify=stratify_target)
+    print(f"Datos divididos: {len(X_train)} para entrenar, {len(X_test)} para probar.")
+
+    pipeline = Pipeline([("preprocesador", preprocesador), ("modelo", LogisticRegression())])
+    grilla = [ESPACIO_BUSQUEDA[t] for t in tipos_modelo if t in ESPACIO_BUSQUEDA]
+    busqueda = GridSearchCV(
+        pipeline, grilla, scoring="roc_auc", n_jobs=n_jobs, refit=True,
+        cv=StratifiedKFold(n_splits=pliegues, shuffle=True, random_state=42),
+    )
+
+    inicio = time.perf_counter()
+    busqueda.fit(X_train, y_train)
+    tiempo_total = time.perf_counter() - inicio
+
+    res = busqueda.cv_results_
+    print("\n  AUC (CV)   ±std    ajuste(s)  parámetros")
+    for i in np.argsort(res["rank_test_score"]):
+        params = {k.replace("modelo__", ""): v for k, v in res["params"][i].items() if k != "modelo"}
+        nombre = type(res["params"][i]["modelo"]).__name__
+        print(f"  {res['mean_test_score'][i]:.4f}   {res['std_test_score'][i]:.4f}  {res['mean_fit_time'][i]:8.2f}   {nombre} {params}")
+
+    mejor = busqueda.best_estimator_
+    tipo_mejor = "knn" if isinstance(mejor.named_steps["modelo"], KNeighborsClassifier) else "logistic"
+    resumen = {
+        "tipo_modelo": tipo_mejor,
+        "mejores_parametros": {k: repr(v) for k, v in busqueda.best_params_.items() if k != "modelo"},
+        "auc_cv": round(float(busqueda.best_score_), 4),
+        "tiempo_busqueda_s": round(tiempo_total, 2),
+        "tiempo_reajuste_s": round(float(busqueda.refit_time_), 2),
+        "candidatos": len(res["params"]),
+    }
+    print(f"\n✅ Mejor modelo: {tipo_mejor} {resumen['mejores_parametros']} "
+          f"(AUC CV={resumen['auc_cv']:.4f}, búsqueda={tiempo_total:.1f}s, reajuste={resumen['tiempo_reajuste_s']:.1f}s)")
+    return mejor, X_test, y_test, resumen
 
 # --- 4. Evaluar Modelo ---
 def evaluar_modelo(modelo, X_test, y_test):
@@ -162,32 +320,100 @@ def evaluar_modelo(modelo, X_test, y_test):
         print("\n⚠️ AUC < 0.75 o no calculable. El modelo necesita mejorar o más datos.")
     return auc # Devolvemos el AUC para decidir si guardar
 
-# --- 5. Guardar Modelo ---
-def guardar_modelo(modelo, nombre_archivo):
-    """Guarda el modelo entrenado en un archivo."""
+# --- 5. Guardar Modelo (Pipeline versionado + manifiesto) ---
+def guardar_pipeline_versionado(pipeline, auc, tipo_modelo, n_filas, carpeta=CARPETA_MODELOS_NOSHOW, extra=None):
+    """
+    Guarda el Pipeline como un único artefacto versionado con su manifiesto
+    (hash, AUC, esquema de features) y publica la versión actualizando el
+    puntero 'actual.json'. La app detecta el cambio y lo carga sin reiniciar.
+    """
     try:
-        joblib.dump(modelo, nombre_archivo)
-        print(f"\n💾 Modelo entrenado guardado en {nombre_archivo}")
+        os.makedirs(carpeta, exist_ok=True)
+        version = datetime.now().strftime("v%Y%m%d%H%M%S")
+        archivo = f"noshow_{version}.joblib"
+        ruta = os.path.join(carpeta, archivo)
+
+        # Sin compresión: permite cargarlo con mmap_mode en el servidor
+        joblib.dump(pipeline, ruta)
+
+        categorias = pipeline.named_steps["preprocesador"].named_transformers_["cat"].categories_
+        manifiesto = {
+            "version": version,
+            "archivo": archivo,
+            "sha256": calcular_sha256(ruta),
+            "auc": None if pd.isna(auc) else round(float(auc), 4),
+            "tipo_modelo": tipo_modelo,
+            "filas_entrenamiento": int(n_filas),
+            "fecha": datetime.now().isoformat(timespec="seconds"),
+            "esquema_features": {
+                "categoricas": {col: [str(c) for c in cats] for col, cats in zip(COLUMNAS_CATEGORICAS, categorias)},
+                "numericas": COLUMNAS_NUMERICAS,
+            },
+        }
+        if extra:
+            manifiesto.update(extra)
+        escribir_json_atomico(os.path.join(carpeta, f"noshow_{version}.json"), manifiesto)
+        # El puntero se escribe al final: la versión solo se publica cuando el artefacto está completo
+        escribir_json_atomico(os.path.join(carpeta, ARCHIVO_PUNTERO), manifiesto)
+        print(f"\n💾 Pipeline No-Show {version} guardado en {ruta} y publicado.")
+
+        limpiar_versiones_antiguas(carpeta)
+        return manifiesto
     except Exception as e:
         print(f"❌ Error al guardar el modelo: {e}")
+        return None
+
+
+def limpiar_versiones_antiguas(carpeta=CARPETA_MODELOS_NOSHOW, conservar=VERSIONES_A_CONSERVAR):
+    """Borra artefactos antiguos, conservando las últimas 'conservar' versiones."""
+    versiones = sorted(f[:-len(".joblib")] for f in os.listdir(carpeta)
+                       if f.startswith("noshow_") and f.endswith(".joblib"))
+    for base in versiones[:-conservar]:
+        for ext in (".joblib", ".json"):
+            try:
+                os.remove(os.path.join(carpeta, base + ext))
+            except FileNotFoundError:
+                pass
 
 
 # --- Ejecución Principal ---
 if __name__ == "__main__":
-    df_entrenamiento = cargar_datos_gsheets()
+    parser = argparse.ArgumentParser(description="Entrena el modelo No-Show.")
+    parser.add_argument("--fuente", choices=["gsheets", "local"], default="gsheets",
+                        help="Origen del dataset (hoja 'Training_NoShow' o archivo CSV/Parquet).")
+    parser.add_argument("--ruta", default=ARCHIVO_TRAINING_LOCAL, help="Archivo local para --fuente local.")
+    parser.add_argument("--filas-bloque", type=int, default=FILAS_POR_BLOQUE)
+    parser.add_argument("--buscar", action="store_true",
+                        help="Búsqueda en paralelo de modelo e hiperparámetros con validación cruzada.")
+    parser.add_argument("--n-jobs", type=int, default=-1, help="Procesos para la búsqueda (-1 = todos los núcleos).")
+    args = parser.parse_args()
+
+    if args.fuente == "local":
+        df_entrenamiento = cargar_datos_locales(args.ruta, filas_por_bloque=args.filas_bloque)
+    else:
+        df_entrenamiento = cargar_datos_gsheets()
     if df_entrenamiento is not None:
-        X_procesado, y, preprocesador = preparar_datos(df_entrenamiento)
+        X, y, preprocesador = preparar_datos(df_entrenamiento)
 
-        if X_procesado is not None and y is not None:
+        if X is not None and y is not None:
              print("\n🚀 ¡Datos listos para entrenar el modelo!")
 
              # --- Llamadas a las nuevas funciones ---
-             modelo_entrenado, X_prueba, y_prueba = entrenar_modelo(X_procesado, y, tipo_modelo=MODELO_A_USAR)
+             resumen = {}
+             if args.buscar:
+                 modelo_entrenado, X_prueba, y_prueba, resumen = buscar_mejor_modelo(X, y, preprocesador, n_jobs=args.n_jobs)
+                 tipo_modelo = resumen["tipo_modelo"]
+             else:
+                 inicio = time.perf_counter()
+                 modelo_entrenado, X_prueba, y_prueba = entrenar_modelo(X, y, preprocesador, tipo_modelo=MODELO_A_USAR)
+                 tipo_modelo = MODELO_A_USAR
+                 resumen["tiempo_ajuste_s"] = round(time.perf_counter() - inicio, 2)
+                 print(f"⏱️ Tiempo de ajuste: {resumen['tiempo_ajuste_s']:.2f}s")
              auc_resultado = evaluar_modelo(modelo_entrenado, X_prueba, y_prueba)
 
              # Guardamos el modelo solo si la evaluación fue razonable (AUC calculable)
              if not pd.isna(auc_resultado):
-                 guardar_modelo(modelo_entrenado, ARCHIVO_MODELO_GUARDADO)
+                 guardar_pipeline_versionado(modelo_entrenado, auc_resultado, tipo_modelo, len(y), extra=resumen)
              # --- Fin de las nuevas llamadas ---
 
         else:
@@ -3,51 +3,110 @@ from google.oauth2.service_account import Credentials
 import csv
 import os 
 import json # ⭐️ Añadido para la lógica de HF
+from datetime import date
+from trazas import HojaTrazada, trazado, registrar
+from perfilador import perfilado
+from archivo_citas import ENCABEZADOS_CITAS, consultar_historial, max_id_archivado
+import directorio_medicos
 
 # ===== Constantes =====
 # Apuntan a los archivos CSV de backup
 PACIENTES_CSV = "data/Pacientes.csv"
 CITAS_CSV = "data/Citas.csv"
+DOCUMENTO_SHEETS = "Base de Datos Citas (Proyecto Voz y Chat)" # Sede principal (ver shards.py)
 
 # ===== Conexión a Google Sheets (Tarea S2-04) =====
-try:
-    alcances = [
-        "https://www.googleapis.com/auth/spreadsheets",
-        "https://www.googleapis.com/auth/drive"
-    ]
-
-    # --- ⭐️ LÓGICA FUSIONADA (Compatible con HF y Local) ---
-    google_creds_json = os.environ.get('GOOGLE_CREDENTIALS_JSON')
-    if not google_creds_json:
-        print("flujo_agendamiento: Secret no encontrado, usando credenciales.json local...")
-        cred = Credentials.from_service_account_file("credenciales.json", scopes=alcances)
-    else:
-        print("flujo_agendamiento: Cargando credenciales desde Secret...")
-        cred_dict = json.loads(google_creds_json)
-        cred = Credentials.from_service_account_info(cred_dict, scopes=alcances)
+# Con SHEETS_OFFLINE=1 no se conecta: se usan hojas en memoria (hoja_memoria.py)
+# sembradas desde los CSV, p. ej. para lanzar la app como objetivo de carga.py.
+# configurar_hojas() permite además inyectar otras hojas (benchmark.py).
+SHEETS_OFFLINE = os.environ.get("SHEETS_OFFLINE") == "1"
+SHEETS_OFFLINE_FILAS = int(os.environ.get("SHEETS_OFFLINE_FILAS", 1000))
+SHEETS_OFFLINE_LATENCIA_MS = float(os.environ.get("SHEETS_OFFLINE_LATENCIA_MS", 0))
+# El backup CSV relee las dos hojas completas en cada agendamiento
+# (desactivado en offline: sobrescribiría data/*.csv con datos sintéticos)
+BACKUP_CSV = os.environ.get("BACKUP_CSV", "0" if SHEETS_OFFLINE else "1") == "1"
+
+def migrar_encabezado_citas(hoja):
+    """
+    Añade al encabezado de Citas las columnas nuevas que falten (Fecha_Registro):
+    sin ellas, el espejo y consultar_citas recortan las filas al encabezado viejo.
+    """
+    encabezados = hoja.row_values(1)
+    faltan = [c for c in ENCABEZADOS_CITAS if c not in encabezados]
+    if encabezados and faltan and encabezados == ENCABEZADOS_CITAS[:len(encabezados)]:
+        for n, columna in enumerate(faltan, start=len(encabezados) + 1):
+            hoja.update_cell(1, n, columna)
+        registrar("encabezado_citas_migrado", modulo="flujo", columnas=faltan)
+    return faltan
+
+
+if SHEETS_OFFLINE:
+    from hoja_memoria import sembrar_hojas
+    _pacientes_memoria, _citas_memoria = sembrar_hojas(SHEETS_OFFLINE_FILAS,
+                                                       latencia_s=SHEETS_OFFLINE_LATENCIA_MS / 1000)
+    pacientes_sheet = HojaTrazada(_pacientes_memoria)
+    citas_sheet = HojaTrazada(_citas_memoria)
+    print(f"flujo_agendamiento: SHEETS_OFFLINE=1, hojas en memoria ({SHEETS_OFFLINE_FILAS} pacientes, "
+          f"{SHEETS_OFFLINE_LATENCIA_MS:.0f} ms por llamada).")
+else:
+    try:
+        alcances = [
+            "https://www.googleapis.com/auth/spreadsheets",
+            "https://www.googleapis.com/auth/drive"
+        ]
+
+        # --- ⭐️ LÓGICA FUSIONADA (Compatible con HF y Local) ---
+        google_creds_json = os.environ.get('GOOGLE_CREDENTIALS_JSON')
+        if not google_creds_json:
+            print("flujo_agendamiento: Secret no encontrado, usando credenciales.json local...")
+            cred = Credentials.from_service_account_file("credenciales.json", scopes=alcances)
+        else:
+            print("flujo_agendamiento: Cargando credenciales desde Secret...")
+            cred_dict = json.loads(google_creds_json)
+            cred = Credentials.from_service_account_info(cred_dict, scopes=alcances)
     
-    cliente = gspread.authorize(cred)
-    # --- Fin de Lógica Fusionada ---
+        cliente = gspread.authorize(cred)
+        # --- Fin de Lógica Fusionada ---
 
-    documento = cliente.open("Base de Datos Citas (Proyecto Voz y Chat)")
-    pacientes_sheet = documento.worksheet("Pacientes")
-    citas_sheet = documento.worksheet("Citas")
+        documento = cliente.open(DOCUMENTO_SHEETS)
+        # Cada llamada a la API queda medida como span 'gspread.<método>' (ver trazas.py)
+        pacientes_sheet = HojaTrazada(documento.worksheet("Pacientes"))
+        citas_sheet = HojaTrazada(documento.worksheet("Citas"))
 
-    print("✅ Conexión exitosa a Google Sheets.")
+        print("✅ Conexión exitosa a Google Sheets.")
+        migrar_encabezado_citas(citas_sheet)
     
-except Exception as e:
-    print(f"❌ Error conectando a Google Sheets: {e}")
-    print("Revisa 'credenciales.json' y los permisos de la hoja.")
-    # Si falla la conexión, creamos placeholders para que el test no falle
-    pacientes_sheet = None
-    citas_sheet = None
+    except Exception as e:
+        print(f"❌ Error conectando a Google Sheets: {e}")
+        print("Revisa 'credenciales.json' y los permisos de la hoja.")
+        # Si falla la conexión, creamos placeholders para que el test no falle
+        pacientes_sheet = None
+        citas_sheet = None
+
+
+def configurar_hojas(pacientes, citas, backup_csv=None):
+    """
+    Sustituye las hojas en uso (p. ej. por HojaMemoria para pruebas offline).
+    backup_csv=False desactiva la copia CSV tras cada agendamiento.
+    """
+    global pacientes_sheet, citas_sheet, BACKUP_CSV
+    pacientes_sheet = HojaTrazada(pacientes) if pacientes is not None else None
+    citas_sheet = HojaTrazada(citas) if citas is not None else None
+    if backup_csv is not None:
+        BACKUP_CSV = backup_csv
+
+
+def _hojas(hojas):
+    """(pacientes, citas) de otra sede si se pasan (shards.py); si no, las de este módulo."""
+    return hojas if hojas is not None else (pacientes_sheet, citas_sheet)
 
 
 # ===== Función para generar ID único (Modo Google Sheets) =====
-def generar_id(prefijo, hoja):
+def generar_id(prefijo, hoja, con_archivo=True):
     """
     Lee la columna 1 de una Google Sheet, encuentra el ID más alto
     y devuelve el siguiente ID formateado.
+    con_archivo=False para otras sedes: el archivo frío es solo de la principal.
     """
     if hoja is None:
         return f"{prefijo}000" # Error
@@ -56,40 +115,28 @@ def generar_id(prefijo, hoja):
         # Asumiendo que la columna 1 (A) es 'ID_Paciente' o 'ID_Cita'
         ids = hoja.col_values(1)[1:]  # Ignorar encabezado
     except gspread.exceptions.APIError as e:
-        print(f"Error leyendo la hoja para generar ID: {e}")
+        registrar("error_generar_id", nivel="error", modulo="flujo", prefijo=prefijo, error=str(e))
         return f"{prefijo}000"
 
-    if not ids:
-        return f"{prefijo}001"
-    
+    return f"{prefijo}{_max_id(ids, prefijo, con_archivo) + 1:03d}"
+
+
+def _max_id(ids, prefijo, con_archivo=True):
+    """Mayor número entre los IDs con ese prefijo, contando los ya archivados (0 si no hay)."""
     numeros = [int(id[len(prefijo):]) for id in ids if id.startswith(prefijo) and id[len(prefijo):].isdigit()]
-    max_num = max(numeros) if numeros else 0
-    return f"{prefijo}{max_num + 1:03d}"
+    return max(numeros + [max_id_archivado(prefijo) if con_archivo else 0])
 
 
-# ===== Lógica de negocio (Médicos) - Sin cambios =====
+# ===== Lógica de negocio (Médicos): catálogo en directorio_medicos.py (data/Medicos.csv) =====
 def asignar_especialidad(medico):
-    especialidades = {
-        "Dr.Vega": "Endodoncia",
-        "Dr.Perez": "Periodoncia",
-        "Dra.Morales": "Ortodoncia",
-        "Dr.Castro": "Protesis dental",
-        "Dra.Paredes": "Cirugia Oral"
-    }
-    return especialidades.get(medico, "General")
+    return directorio_medicos.especialidad(medico)
 
 def obtener_medicos():
-    especialidades = {
-        "Dr.Vega": "Endodoncia",
-        "Dr.Perez": "Periodoncia",
-        "Dra.Morales": "Ortodoncia",
-        "Dr.Castro": "Protesis dental",
-        "Dra.Paredes": "Cirugia Oral"
-    }
-    return list(especialidades.keys())
+    return directorio_medicos.medicos()
 
 
 # ===== Guardar datos en CSV (Función de Backup) =====
+@trazado("persistir_csv_backup")
 def persistir_csv_backup(hoja_gspread, nombre_archivo_csv):
     """
     Descarga TODOS los datos de una Google Sheet y los
@@ -107,36 +154,43 @@ def persistir_csv_backup(hoja_gspread, nombre_archivo_csv):
         with open(nombre_archivo_csv, mode="w", newline="", encoding="utf-8") as file:
             writer = csv.writer(file)
             writer.writerows(datos)
-        print(f"💾 Backup CSV guardado en {nombre_archivo_csv}")
+        registrar("backup_csv", modulo="flujo", archivo=nombre_archivo_csv, filas=len(datos))
     except Exception as e:
-        print(f"❌ Error al crear backup CSV: {e}")
+        registrar("error_backup_csv", nivel="error", modulo="flujo", archivo=nombre_archivo_csv, error=str(e))
+
+
+# ===== Validaciones =====
+def _validar_dni_telefono(dni, telefono):
+    """Devuelve (dni_limpio, dni_num, tel_num, None) o (None, None, None, mensaje de error)."""
+    dni_limpio = ''.join(filter(str.isdigit, str(dni)))
+    if len(dni_limpio) != 8:
+        registrar("validacion_fallida", nivel="warning", modulo="flujo", campo="DNI")
+        return None, None, None, f"Error: DNI debe tener 8 dígitos (recibido: {dni})."
+
+    tel_limpio = ''.join(filter(str.isdigit, str(telefono)))
+    if len(tel_limpio) != 9 or not tel_limpio.startswith("9"):
+        registrar("validacion_fallida", nivel="warning", modulo="flujo", campo="Telefono")
+        return None, None, None, f"Error: Teléfono debe tener 9 dígitos y empezar con 9 (recibido: {telefono})."
+    return dni_limpio, int(dni_limpio), int(tel_limpio), None
 
 
 # ===== Comando Agendar (CORREGIDO para evitar duplicados) =====
-def agendar(nombre, dni, telefono, email, fecha, hora, medico):
+@perfilado("agendar")
+@trazado("agendar")
+def agendar(nombre, dni, telefono, email, fecha, hora, medico, paciente=None, hojas=None):
     """
     Valida datos, busca si el paciente ya existe por DNI,
     lo crea si no existe, y luego agenda la cita en Google Sheets.
+    Si 'paciente' es el registro ya obtenido con buscar_paciente_por_dni
+    (p. ej. precargado por el chatbot), se omite la búsqueda en la hoja.
+    'hojas' = (pacientes, citas) de otra sede (shards.py).
     """
+    pacientes_sheet, citas_sheet = _hojas(hojas)
 
     # --- 1. Validaciones (igual que antes) ---
-    try:
-        dni_limpio = ''.join(filter(str.isdigit, str(dni)))
-        if len(dni_limpio) != 8:
-            raise ValueError(f"DNI debe tener 8 dígitos (dato: {dni})")
-        dni_num = int(dni_limpio)
-    except ValueError as e:
-        print(f"❌ Error de validación: {e}")
-        return f"Error: DNI debe tener 8 dígitos (recibido: {dni})."
-
-    try:
-        tel_limpio = ''.join(filter(str.isdigit, str(telefono)))
-        if len(tel_limpio) != 9 or not tel_limpio.startswith("9"):
-            raise ValueError(f"Teléfono debe tener 9 dígitos y empezar con 9 (dato: {telefono})")
-        tel_num = int(tel_limpio)
-    except ValueError as e:
-        print(f"❌ Error de validación: {e}")
-        return f"Error: Teléfono debe tener 9 dígitos y empezar con 9 (recibido: {telefono})."
+    dni_limpio, dni_num, tel_num, error = _validar_dni_telefono(dni, telefono)
+    if error:
+        return error
 
     # --- 2. Verificar Conexión ---
     if pacientes_sheet is None or citas_sheet is None:
@@ -144,49 +198,56 @@ def agendar(nombre, dni, telefono, email, fecha, hora, medico):
 
     try:
         # --- 3. Buscar Paciente por DNI ---
-        print(f"Buscando paciente con DNI: {dni_num}...")
-        celda_paciente = pacientes_sheet.find(str(dni_num), in_column=3) # Columna 3 es 'DNI'
-
-        if celda_paciente:
-            # --- Paciente ENCONTRADO ---
-            id_paciente = pacientes_sheet.cell(celda_paciente.row, 1).value # Columna 1 es 'ID_Paciente'
-            nombre_existente = pacientes_sheet.cell(celda_paciente.row, 2).value
-            print(f"✅ Paciente encontrado: {id_paciente} ({nombre_existente}). Usando ID existente.")
-            # (Opcional: Podrías actualizar el teléfono/email si son diferentes)
-            # pacientes_sheet.update_cell(celda_paciente.row, 4, tel_num)
-            # pacientes_sheet.update_cell(celda_paciente.row, 5, email)
-
+        if paciente and paciente.get("ID_Paciente") and str(paciente.get("DNI", "")).strip() == dni_limpio:
+            # --- Paciente ya precargado: no hace falta volver a buscarlo ---
+            id_paciente = paciente["ID_Paciente"]
+            registrar("paciente_existente", modulo="flujo", id_paciente=id_paciente, precargado=True)
         else:
-            # --- Paciente NO Encontrado: Crear uno nuevo ---
-            print(f"Paciente con DNI {dni_num} no encontrado. Creando nuevo paciente...")
-            id_paciente = generar_id("P", pacientes_sheet)
-            fila_paciente = [id_paciente, nombre, dni_num, tel_num, email]
-            pacientes_sheet.append_row(fila_paciente, value_input_option="USER_ENTERED")
-            print(f"✅ Nuevo Paciente creado en GSheets: {id_paciente}")
+            celda_paciente = pacientes_sheet.find(str(dni_num), in_column=3) # Columna 3 es 'DNI'
+
+            if celda_paciente:
+                # --- Paciente ENCONTRADO ---
+                id_paciente = pacientes_sheet.cell(celda_paciente.row, 1).value # Columna 1 es 'ID_Paciente'
+                registrar("paciente_existente", modulo="flujo", id_paciente=id_paciente, precargado=False)
+                # (Opcional: Podrías actualizar el teléfono/email si son diferentes)
+                # pacientes_sheet.update_cell(celda_paciente.row, 4, tel_num)
+                # pacientes_sheet.update_cell(celda_paciente.row, 5, email)
+
+            else:
+                # --- Paciente NO Encontrado: Crear uno nuevo ---
+                id_paciente = generar_id("P", pacientes_sheet, con_archivo=hojas is None)
+                fila_paciente = [id_paciente, nombre, dni_num, tel_num, email]
+                pacientes_sheet.append_row(fila_paciente, value_input_option="USER_ENTERED")
+                registrar("paciente_creado", modulo="flujo", id_paciente=id_paciente)
 
         # --- 4. Crear Cita (usando el ID_Paciente encontrado o creado) ---
-        id_cita = generar_id("C", citas_sheet)
+        id_cita = generar_id("C", citas_sheet, con_archivo=hojas is None)
         especialidad = asignar_especialidad(medico)
-        # Estado inicial siempre es "Pendiente" (con mayúscula inicial)
-        fila_cita = [id_cita, id_paciente, fecha, hora, medico, especialidad, "Pendiente"]
+        # Estado inicial siempre es "Pendiente" (con mayúscula inicial); Fecha_Registro da la anticipación (analitica.py)
+        fila_cita = [id_cita, id_paciente, fecha, hora, medico, especialidad, "Pendiente", date.today().isoformat()]
         citas_sheet.append_row(fila_cita, value_input_option="USER_ENTERED")
-        print(f"✅ Cita agendada en GSheets: {id_cita} para paciente {id_paciente}")
+        registrar("cita_agendada", modulo="flujo", id_cita=id_cita, id_paciente=id_paciente)
 
-        # --- 5. Guardar CSV (Backup) ---
-        persistir_csv_backup(pacientes_sheet, PACIENTES_CSV)
-        persistir_csv_backup(citas_sheet, CITAS_CSV)
+        # --- 5. Guardar CSV (Backup, solo de la sede principal) ---
+        if BACKUP_CSV and hojas is None:
+            persistir_csv_backup(pacientes_sheet, PACIENTES_CSV)
+            persistir_csv_backup(citas_sheet, CITAS_CSV)
 
         return f"¡Éxito! Cita {id_cita} agendada para el paciente {id_paciente} en Google Sheets."
 
     except Exception as e:
-        print(f"❌ Error durante el agendamiento: {e}")
+        registrar("error_agendar", nivel="error", modulo="flujo", error=str(e))
         return f"Error al procesar la cita en Google Sheets: {e}"
 
 # ===== Función "Leer" (Read) - (Tarea S2-04) =====
-def consultar_citas(dni):
+@perfilado("consultar_citas")
+@trazado("consultar_citas")
+def consultar_citas(dni, incluir_historial=False, hojas=None):
     """
     Busca citas en Google Sheets por DNI del paciente.
+    Con incluir_historial también devuelve las citas movidas al archivo frío.
     """
+    pacientes_sheet, citas_sheet = _hojas(hojas)
     if pacientes_sheet is None or citas_sheet is None:
         return "Error: No hay conexión a Google Sheets."
 
@@ -204,32 +265,43 @@ def consultar_citas(dni):
         # 2. Buscar todas las citas con ese ID de Paciente
         # Columna 2 es 'ID_Paciente'
         celdas_citas = citas_sheet.findall(id_paciente, in_column=2) 
-        
-        if not celdas_citas:
-            return f"Paciente {nombre_paciente} ({id_paciente}) no tiene citas programadas."
 
         # 3. Formatear los resultados
         citas_encontradas = []
-        encabezados = citas_sheet.row_values(1) # Obtener los títulos ('ID_Cita', 'Fecha', 'Estado')
+        if celdas_citas:
+            encabezados = citas_sheet.row_values(1) # Obtener los títulos ('ID_Cita', 'Fecha', 'Estado')
         
         for celda in celdas_citas:
             datos_cita = citas_sheet.row_values(celda.row)
             # Convertir a un diccionario legible usando los encabezados correctos
             cita_dict = dict(zip(encabezados, datos_cita))
             citas_encontradas.append(cita_dict)
+
+        # 4. Historial archivado (si una cita está en los dos sitios, manda la de la hoja).
+        # El archivo frío es solo de la sede principal: en otra sede el mismo ID_Paciente es otra persona
+        if incluir_historial and hojas is None:
+            en_hoja = {cita.get("ID_Cita") for cita in citas_encontradas}
+            archivadas = [c for c in consultar_historial(id_paciente) if c["ID_Cita"] not in en_hoja]
+            citas_encontradas = archivadas + citas_encontradas
+
+        if not citas_encontradas:
+            return f"Paciente {nombre_paciente} ({id_paciente}) no tiene citas programadas."
         
-        print(f"✅ Citas encontradas para {id_paciente}: {len(citas_encontradas)}")
+        registrar("citas_consultadas", modulo="flujo", id_paciente=id_paciente, n_citas=len(citas_encontradas))
         return citas_encontradas
 
     except Exception as e:
-        print(f"❌ Error durante la consulta de citas: {e}")
+        registrar("error_consultar", nivel="error", modulo="flujo", error=str(e))
         return f"Error al consultar citas: {e}"
 
 # ===== Función "Actualizar" (Cancel) - (Tarea S2-04) =====
-def cancelar_cita(dni, fecha):
+@perfilado("cancelar_cita")
+@trazado("cancelar_cita")
+def cancelar_cita(dni, fecha, hojas=None):
     """
     Busca una cita por DNI y fecha, y actualiza su estado a 'Cancelado'.
     """
+    pacientes_sheet, citas_sheet = _hojas(hojas)
     if pacientes_sheet is None or citas_sheet is None:
         return "Error: No hay conexión a Google Sheets."
 
@@ -258,38 +330,41 @@ def cancelar_cita(dni, fecha):
         if fila_a_cancelar:
             # 3. Actualizar la celda de Estado (Columna 7) a 'Cancelada'
             citas_sheet.update_cell(fila_a_cancelar, 7, "Cancelado") 
-            print(f"✅ Cita en fila {fila_a_cancelar} actualizada a 'Cancelado'.")
+            registrar("cita_cancelada", modulo="flujo", fila=fila_a_cancelar)
             return f"Éxito: La cita del {fecha} para el DNI {dni} ha sido cancelada."
         else:
             # Mensaje más claro si no se encuentra o ya está cancelada/confirmada
             return f"No se encontró una cita 'Pendiente' para el DNI {dni} en la fecha {fecha}."
 
     except Exception as e:
-        print(f"❌ Error durante la cancelación de cita: {e}")
+        registrar("error_cancelar", nivel="error", modulo="flujo", error=str(e))
         return f"Error al cancelar la cita: {e}"
 
 # ===== Función NUEVA: Buscar Paciente por DNI =====
-def buscar_paciente_por_dni(dni):
+@perfilado("buscar_paciente_por_dni")
+@trazado("buscar_paciente_por_dni")
+def buscar_paciente_por_dni(dni, hojas=None):
     """
     Busca un paciente en Google Sheets por DNI.
     Devuelve un diccionario con sus datos si lo encuentra, o None si no.
     """
+    pacientes_sheet, _ = _hojas(hojas)
     if pacientes_sheet is None:
-        print("❌ Error: Hoja de pacientes no disponible.")
+        registrar("hoja_no_disponible", nivel="error", modulo="flujo", hoja="Pacientes")
         return None
 
     try:
         dni_str = str(dni).strip() # Asegurarse de que sea string
-        print(f"Buscando paciente con DNI: {dni_str}...")
         celda_paciente = pacientes_sheet.find(dni_str, in_column=3) # Columna 3 es 'DNI'
 
         if celda_paciente:
-            # Paciente encontrado, devolver sus datos
-            id_paciente = pacientes_sheet.cell(celda_paciente.row, 1).value # Col 1: ID_Paciente
-            nombre = pacientes_sheet.cell(celda_paciente.row, 2).value      # Col 2: Nombre
-            telefono = pacientes_sheet.cell(celda_paciente.row, 4).value    # Col 4: Telefono
-            email = pacientes_sheet.cell(celda_paciente.row, 5).value       # Col 5: Email
-            print(f"✅ Paciente encontrado: {id_paciente} ({nombre})")
+            # Paciente encontrado: una sola lectura de la fila en vez de una por celda
+            fila = pacientes_sheet.row_values(celda_paciente.row) + [""] * 5
+            id_paciente = fila[0] # Col 1: ID_Paciente
+            nombre = fila[1]      # Col 2: Nombre
+            telefono = fila[3]    # Col 4: Telefono
+            email = fila[4]       # Col 5: Email
+            registrar("paciente_encontrado", modulo="flujo", id_paciente=id_paciente)
             return {
                 "ID_Paciente": id_paciente,
                 "Nombre": nombre,
@@ -298,12 +373,157 @@ def buscar_paciente_por_dni(dni):
                 "Email": email
             }
         else:
-            print(f"Paciente con DNI {dni_str} no encontrado.")
+            registrar("paciente_no_encontrado", modulo="flujo")
             return None
     except Exception as e:
-        print(f"❌ Error buscando paciente por DNI: {e}")
+        registrar("error_buscar_paciente", nivel="error", modulo="flujo", error=str(e))
         return None
 
+# ===== Operaciones por Lote (API JSON) =====
+# Leen cada hoja una sola vez y escriben con una sola llamada, en vez de
+# repetir find/cell/append_row por elemento.
+def _filas_por_dni(filas_pacientes):
+    """{DNI: fila} a partir de get_all_values() de Pacientes (sin encabezado)."""
+    return {fila[2].strip(): fila for fila in filas_pacientes[1:] if len(fila) > 2}
+
+
+@perfilado("agendar_lote")
+@trazado("agendar_lote")
+def agendar_lote(citas, hojas=None):
+    """
+    Agenda varias citas (dicts con nombre, dni, telefono, email, fecha, hora, medico).
+    Devuelve un mensaje por cita, en el mismo orden, como agendar().
+    'hojas' = (pacientes, citas) de otra sede (shards.agendar_lote reparte por médico).
+    """
+    resultados = [None] * len(citas)
+    validas = []
+    for i, cita in enumerate(citas):
+        dni_limpio, dni_num, tel_num, error = _validar_dni_telefono(cita.get("dni"), cita.get("telefono"))
+        if error:
+            resultados[i] = error
+        else:
+            validas.append((i, cita, dni_limpio, dni_num, tel_num))
+    if not validas:
+        return resultados
+    pacientes_sheet, citas_sheet = _hojas(hojas)
+    if pacientes_sheet is None or citas_sheet is None:
+        for i, *_ in validas:
+            resultados[i] = "Error: No hay conexión a Google Sheets. Revisa las credenciales."
+        return resultados
+
+    try:
+        filas_pacientes = pacientes_sheet.get_all_values()
+        id_por_dni = {dni: fila[0] for dni, fila in _filas_por_dni(filas_pacientes).items()}
+        siguiente_paciente = _max_id([fila[0] for fila in filas_pacientes[1:] if fila], "P", hojas is None) + 1
+        siguiente_cita = _max_id(citas_sheet.col_values(1)[1:], "C", hojas is None) + 1
+
+        nuevos_pacientes, nuevas_citas, mensajes = [], [], []
+        hoy = date.today().isoformat()
+        for i, cita, dni_limpio, dni_num, tel_num in validas:
+            # Como en agendar(), el DNI se guarda y se busca como número
+            id_paciente = id_por_dni.get(str(dni_num))
+            if id_paciente is None:
+                id_paciente = f"P{siguiente_paciente:03d}"
+                siguiente_paciente += 1
+                id_por_dni[str(dni_num)] = id_paciente # Por si el DNI se repite en el lote
+                nuevos_pacientes.append([id_paciente, cita.get("nombre"), dni_num, tel_num, cita.get("email")])
+            id_cita = f"C{siguiente_cita:03d}"
+            siguiente_cita += 1
+            medico = cita.get("medico")
+            nuevas_citas.append([id_cita, id_paciente, cita.get("fecha"), cita.get("hora"), medico,
+                                 asignar_especialidad(medico), "Pendiente", hoy])
+            mensajes.append((i, f"¡Éxito! Cita {id_cita} agendada para el paciente {id_paciente} en Google Sheets."))
+
+        if nuevos_pacientes:
+            pacientes_sheet.append_rows(nuevos_pacientes, value_input_option="USER_ENTERED")
+        citas_sheet.append_rows(nuevas_citas, value_input_option="USER_ENTERED")
+        for i, mensaje in mensajes:
+            resultados[i] = mensaje
+        registrar("citas_agendadas_lote", modulo="flujo", n_citas=len(nuevas_citas), n_pacientes_nuevos=len(nuevos_pacientes))
+
+        if BACKUP_CSV and hojas is None:
+            persistir_csv_backup(pacientes_sheet, PACIENTES_CSV)
+            persistir_csv_backup(citas_sheet, CITAS_CSV)
+    except Exception as e:
+        registrar("error_agendar_lote", nivel="error", modulo="flujo", error=str(e))
+        for i, *_ in validas:
+            resultados[i] = f"Error al procesar la cita en Google Sheets: {e}"
+    return resultados
+
+
+@perfilado("consultar_citas_lote")
+@trazado("consultar_citas_lote")
+def consultar_citas_lote(dnis, hojas=None):
+    """{DNI: resultado de consultar_citas} leyendo cada hoja una sola vez ('hojas' = otra sede)."""
+    pacientes_sheet, citas_sheet = _hojas(hojas)
+    if pacientes_sheet is None or citas_sheet is None:
+        return {dni: "Error: No hay conexión a Google Sheets." for dni in dnis}
+    try:
+        pacientes = _filas_por_dni(pacientes_sheet.get_all_values())
+        filas_citas = citas_sheet.get_all_values()
+    except Exception as e:
+        registrar("error_consultar_lote", nivel="error", modulo="flujo", error=str(e))
+        return {dni: f"Error al consultar citas: {e}" for dni in dnis}
+
+    encabezados = filas_citas[0] if filas_citas else []
+    citas_por_paciente = {}
+    for fila in filas_citas[1:]:
+        if len(fila) > 1:
+            citas_por_paciente.setdefault(fila[1], []).append(dict(zip(encabezados, fila)))
+
+    resultados = {}
+    for dni in dnis:
+        fila_paciente = pacientes.get(str(dni).strip())
+        if fila_paciente is None:
+            resultados[dni] = f"No se encontró ningún paciente con el DNI {dni}."
+            continue
+        id_paciente, nombre_paciente = fila_paciente[0], fila_paciente[1]
+        citas = citas_por_paciente.get(id_paciente, [])
+        resultados[dni] = citas if citas else f"Paciente {nombre_paciente} ({id_paciente}) no tiene citas programadas."
+    return resultados
+
+
+@perfilado("cancelar_citas_lote")
+@trazado("cancelar_citas_lote")
+def cancelar_citas_lote(pares, hojas=None):
+    """Cancela varias citas [(dni, fecha), ...] con una lectura por hoja y una sola escritura ('hojas' = otra sede)."""
+    pacientes_sheet, citas_sheet = _hojas(hojas)
+    if pacientes_sheet is None or citas_sheet is None:
+        return ["Error: No hay conexión a Google Sheets."] * len(pares)
+    try:
+        pacientes = _filas_por_dni(pacientes_sheet.get_all_values())
+        filas_citas = citas_sheet.get_all_values()
+    except Exception as e:
+        registrar("error_cancelar_lote", nivel="error", modulo="flujo", error=str(e))
+        return [f"Error al cancelar la cita: {e}"] * len(pares)
+
+    resultados, cambios = [], []
+    for dni, fecha in pares:
+        fila_paciente = pacientes.get(str(dni).strip())
+        if fila_paciente is None:
+            resultados.append(f"No se encontró ningún paciente con el DNI {dni}.")
+            continue
+        fila_a_cancelar = None
+        for n_fila, fila in enumerate(filas_citas[1:], start=2):
+            if len(fila) > 6 and fila[1] == fila_paciente[0] and fila[2] == fecha and fila[6].lower() == "pendiente":
+                fila_a_cancelar = n_fila
+                fila[6] = "Cancelado" # Para que otra entrada del lote no la vuelva a elegir
+                break
+        if fila_a_cancelar:
+            cambios.append({"range": f"G{fila_a_cancelar}", "values": [["Cancelado"]]})
+            resultados.append(f"Éxito: La cita del {fecha} para el DNI {dni} ha sido cancelada.")
+        else:
+            resultados.append(f"No se encontró una cita 'Pendiente' para el DNI {dni} en la fecha {fecha}.")
+
+    if cambios:
+        try:
+            citas_sheet.batch_update(cambios)
+            registrar("citas_canceladas_lote", modulo="flujo", n_citas=len(cambios))
+        except Exception as e:
+            registrar("error_cancelar_lote", nivel="error", modulo="flujo", error=str(e))
+            return [r if not r.startswith("Éxito") else f"Error al cancelar la cita: {e}" for r in resultados]
+    return resultados
+
 # ===== TEST AUTOMÁTICO (CRUD Completo S2-04) - Usa encabezados MAYÚSCULAS =====
 if __name__ == "__main__":
     """
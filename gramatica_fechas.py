@@ -0,0 +1,220 @@
+# ============================================================
+# 📅 Gramática de Fechas y Horas en Español
+# ============================================================
+# Entiende lo que dicen los pacientes sin dateparser: "hoy", "pasado mañana",
+# "el próximo martes", "el martes de la semana que viene", "dentro de 3 días",
+# "15 de noviembre", "el día 20", "15/11", "2026-11-15", "10:30", "4 pm",
+# "a las cuatro y media de la tarde", "a la una menos cuarto", "al mediodía".
+#
+# Todas las expresiones forman UNA sola regex precompilada (una alternativa
+# con nombre por tipo) que se recorre con finditer; los números se aceptan en
+# cifras o en palabras. El resultado se guarda en caché por (frase
+# normalizada, fecha de referencia): la misma frase el mismo día no se
+# vuelve a analizar. Las horas de 1 a 7 sin "de la mañana" se leen por la
+# tarde ("a las 3" = 15:00), que es lo que se pide en una clínica; "07:30"
+# (formato HH:MM, el que pide el bot) siempre es hora de 24 h.
+import functools
+import os
+import re
+import unicodedata
+from datetime import date, timedelta
+
+GRAMATICA_CACHE = int(os.environ.get("GRAMATICA_CACHE", 4096)) # Frases distintas recordadas
+# En una clínica "a las 3" son las 15:00: de 1 a esta hora, sin "de la mañana"/am, se leen por la tarde
+HORA_TARDE_SIN_PERIODO = int(os.environ.get("GRAMATICA_HORA_TARDE_HASTA", 7))
+
+_UNIDADES = ["cero", "una", "dos", "tres", "cuatro", "cinco", "seis", "siete", "ocho", "nueve", "diez", "once",
+             "doce", "trece", "catorce", "quince", "dieciseis", "diecisiete", "dieciocho", "diecinueve", "veinte",
+             "veintiuna", "veintidos", "veintitres", "veinticuatro", "veinticinco", "veintiseis", "veintisiete",
+             "veintiocho", "veintinueve", "treinta"]
+NUMEROS = {palabra: n for n, palabra in enumerate(_UNIDADES)}
+NUMEROS.update({"un": 1, "uno": 1, "primero": 1, "veintiuno": 21, "veintiun": 21, "treinta y uno": 31,
+                "treinta y una": 31, "cuarenta": 40, "cuarenta y cinco": 45, "cincuenta": 50})
+DIAS_SEMANA = ["lunes", "martes", "miercoles", "jueves", "viernes", "sabado", "domingo"]
+MESES = {m: i + 1 for i, m in enumerate(["enero", "febrero", "marzo", "abril", "mayo", "junio", "julio", "agosto",
+                                         "septiembre", "octubre", "noviembre", "diciembre"])}
+MESES["setiembre"] = 9
+
+
+# --- Gramática (una sola regex) ---
+_N = r"(?:\d{1,2}|" + "|".join(sorted(NUMEROS, key=len, reverse=True)) + r")"
+_DIA = "|".join(DIAS_SEMANA)
+_MES = "|".join(MESES)
+_AMPM = r"(?:a\.?\s?m|p\.?\s?m)\b\.?"
+_PERIODO = r"(?:\s+(?:de|por|en)\s+la|\s+del)\s+(?P<{0}>manana|tarde|noche|madrugada|mediodia)\b"
+
+_GRAMATICA = re.compile("|".join([
+    rf"(?P<iso>\b(?P<iso_a>\d{{4}})-(?P<iso_m>\d{{1,2}})-(?P<iso_d>\d{{1,2}})\b)",
+    rf"(?P<numerica>\b(?P<num_d>\d{{1,2}})[/-](?P<num_m>\d{{1,2}})(?:[/-](?P<num_a>\d{{4}}|\d{{2}}))?\b)",
+    rf"(?P<dia_mes>\b(?:el\s+)?(?:dia\s+)?(?P<dm_d>{_N})\s+de\s+(?P<dm_m>{_MES})\b(?:\s+(?:de|del)\s+(?P<dm_a>\d{{4}})\b)?)",
+    # "a las cuatro y media de la tarde", "las 10:30", "a la una menos cuarto"
+    rf"(?P<hora>\b(?P<h_a>a\s+)?las?\s+(?P<h_h>{_N})(?:\s*[:.h]\s*(?P<h_m>\d{{2}})\b)?"
+    rf"(?:\s+(?P<h_frac>y\s+media|y\s+cuarto|menos\s+cuarto|y\s+(?P<h_y>{_N})|menos\s+(?P<h_menos>{_N}))\b)?"
+    rf"(?:\s*(?P<h_ampm>{_AMPM}))?(?:{_PERIODO.format('h_periodo')})?(?:\s+en\s+punto)?)",
+    # "10:30", "4 pm", "2 de la tarde" (un número suelto no es una hora: se descarta al resolver)
+    rf"(?P<reloj>\b(?P<r_h>\d{{1,2}})(?:\s*:\s*(?P<r_m>\d{{2}})\b(?:\s*(?P<r_ampm>{_AMPM}))?|\s*(?P<r_ampm2>{_AMPM}))?"
+    rf"(?:{_PERIODO.format('r_periodo')})?)",
+    r"(?P<mediodia>\b(?:al|a|del)\s+mediodia\b)",
+    r"(?P<relativa>\b(?P<rel>pasado\s+manana|(?<!la )(?<!el )manana|hoy)\b)",
+    rf"(?P<dentro>\b(?:dentro\s+de|en)\s+(?P<dn_n>{_N})\s+(?P<dn_u>dias?|semanas?)\b)",
+    rf"(?P<semana>\b(?:(?:el|para\s+el)\s+)?(?:(?P<ds_pre>proximo|este)\s+)?(?P<ds_d>{_DIA})\b"
+    r"(?P<ds_sig>\s+(?:que\s+viene|de\s+la\s+(?:proxima|siguiente)\s+semana|de\s+la\s+semana\s+que\s+viene))?)",
+    rf"(?P<dia>\bel\s+dia\s+(?P<d_d>{_N})\b)",
+]))
+# Si en la frase hay varias fechas, manda la más explícita
+_PRIORIDAD_FECHA = {"iso": 0, "numerica": 0, "dia_mes": 0, "dia": 1, "semana": 2, "dentro": 2, "relativa": 3}
+
+
+@functools.lru_cache(maxsize=GRAMATICA_CACHE)
+def normalizar(texto):
+    """Minúsculas, sin tildes y con espacios simples (conserva ':', '/', '-' y '.')."""
+    texto = unicodedata.normalize("NFKD", str(texto).lower())
+    texto = "".join(c for c in texto if not unicodedata.combining(c))
+    return re.sub(r"\s+", " ", texto).strip()
+
+
+def _numero(texto):
+    if texto is None:
+        return None
+    return int(texto) if texto.isdigit() else NUMEROS.get(re.sub(r"\s+", " ", texto))
+
+
+# --- Resolución de cada tipo ---
+def _fecha_segura(anio, mes, dia):
+    try:
+        return date(anio, mes, dia)
+    except (TypeError, ValueError):
+        return None
+
+
+def _fecha(tipo, m, hoy):
+    if tipo == "iso":
+        return _fecha_segura(int(m["iso_a"]), int(m["iso_m"]), int(m["iso_d"]))
+    if tipo in ("numerica", "dia_mes"):
+        dia = _numero(m["num_d"] if tipo == "numerica" else m["dm_d"])
+        mes = int(m["num_m"]) if tipo == "numerica" else MESES[m["dm_m"]]
+        anio = m["num_a"] if tipo == "numerica" else m["dm_a"]
+        if anio:
+            return _fecha_segura(int(anio) + (2000 if len(anio) == 2 else 0), mes, dia)
+        # Sin año: la próxima vez que llegue ese día ("15 de enero" dicho en diciembre)
+        fecha = _fecha_segura(hoy.year, mes, dia)
+        return fecha if fecha is None or fecha >= hoy else _fecha_segura(hoy.year + 1, mes, dia)
+    if tipo == "dia":
+        dia = _numero(m["d_d"])
+        fecha = _fecha_segura(hoy.year, hoy.month, dia)
+        if fecha is None or fecha < hoy:
+            anio, mes = (hoy.year + 1, 1) if hoy.month == 12 else (hoy.year, hoy.month + 1)
+            fecha = _fecha_segura(anio, mes, dia)
+        return fecha
+    if tipo == "relativa":
+        return hoy + timedelta(days={"hoy": 0, "manana": 1}.get(m["rel"], 2))
+    if tipo == "dentro":
+        n = _numero(m["dn_n"])
+        return None if n is None else hoy + timedelta(days=n * (7 if m["dn_u"].startswith("semana") else 1))
+    if tipo == "semana":
+        dia = DIAS_SEMANA.index(m["ds_d"])
+        if m["ds_sig"]:
+            # "El martes de la semana que viene": ese día dentro de la semana siguiente (lunes a domingo)
+            return hoy + timedelta(days=7 - hoy.weekday() + dia)
+        adelante = (dia - hoy.weekday()) % 7
+        if adelante == 0 and m["ds_pre"] != "este":
+            adelante = 7 # "El martes" dicho un martes es el de la semana próxima
+        return hoy + timedelta(days=adelante)
+    return None
+
+
+def ajustar_periodo(hora, ampm=None, periodo=None, veinticuatro=False):
+    """
+    Hora 0-23 según am/pm o "de la tarde/noche/mañana". Sin nada, 1-7 se toman
+    como de la tarde, salvo escrita en formato 24 h ('veinticuatro': "07:30", "07").
+    """
+    if ampm:
+        if ampm.startswith("p") and hora < 12:
+            hora += 12
+        elif ampm.startswith("a") and hora == 12:
+            hora = 0
+    elif periodo == "noche" and hora == 12:
+        hora = 0
+    elif periodo in ("tarde", "noche") and hora < 12:
+        hora += 12
+    elif periodo in ("manana", "madrugada") and hora == 12:
+        hora = 0
+    elif periodo == "mediodia" and hora < 4:
+        hora += 12 # "La una del mediodía"
+    elif not periodo and not veinticuatro and 1 <= hora <= HORA_TARDE_SIN_PERIODO:
+        hora += 12
+    return hora
+
+
+def es_24h(texto_hora, texto_minutos=None):
+    """HH:MM o una hora con cero delante ("07") se leen siempre en formato 24 h."""
+    return bool(texto_minutos) or (texto_hora or "").startswith("0")
+
+
+def _hora(tipo, m):
+    if tipo == "mediodia":
+        return 12, 0
+    if tipo == "reloj":
+        if not (m["r_m"] or m["r_ampm"] or m["r_ampm2"] or m["r_periodo"]):
+            return None
+        hora, minutos = int(m["r_h"]), int(m["r_m"] or 0)
+        return ajustar_periodo(hora, m["r_ampm"] or m["r_ampm2"], m["r_periodo"], veinticuatro=es_24h(m["r_h"], m["r_m"])), minutos
+    hora = _numero(m["h_h"])
+    frac = m["h_frac"] or ""
+    # "las dos citas" no es una hora: sin "a las" hace falta algo más que el número
+    if hora is None or not (m["h_a"] or m["h_m"] or frac or m["h_ampm"] or m["h_periodo"]):
+        return None
+    minutos = int(m["h_m"] or 0)
+    # El periodo va con la hora dicha: "la una menos cuarto" es 12:45, no 00:45
+    hora = ajustar_periodo(hora, m["h_ampm"], m["h_periodo"], veinticuatro=es_24h(m["h_h"], m["h_m"]))
+    if frac.endswith("media"):
+        minutos = 30
+    elif frac == "y cuarto":
+        minutos = 15
+    elif frac.startswith("menos"):
+        menos = 15 if frac.endswith("cuarto") else _numero(m["h_menos"])
+        if menos is None or not 0 < menos < 60:
+            return None
+        hora, minutos = (hora - 1) % 24, 60 - menos
+    elif m["h_y"]:
+        minutos = _numero(m["h_y"])
+    return hora, minutos
+
+
+# --- API ---
+@functools.lru_cache(maxsize=GRAMATICA_CACHE)
+def _resolver(texto_norm, hoy, completo=False):
+    """completo=True: solo si TODA la frase es una fecha u hora (respuestas a una pregunta pendiente)."""
+    mejor_fecha, prioridad, hora = None, None, None
+    coincidencias = [m for m in [_GRAMATICA.fullmatch(texto_norm)] if m] if completo else _GRAMATICA.finditer(texto_norm)
+    for m in coincidencias:
+        tipo = m.lastgroup
+        if tipo in _PRIORIDAD_FECHA:
+            if prioridad is not None and _PRIORIDAD_FECHA[tipo] >= prioridad:
+                continue
+            fecha = _fecha(tipo, m, hoy)
+            if fecha is not None:
+                mejor_fecha, prioridad = fecha, _PRIORIDAD_FECHA[tipo]
+        elif hora is None:
+            resultado = _hora(tipo, m)
+            if resultado and 0 <= resultado[0] <= 23 and resultado[1] is not None and 0 <= resultado[1] <= 59:
+                hora = "%02d:%02d" % resultado
+    return (mejor_fecha.isoformat() if mejor_fecha else None), hora
+
+
+def resolver(texto, hoy=None):
+    """{"Fecha": "AAAA-MM-DD", "Hora": "HH:MM"} con lo que se encuentre en 'texto' (relativo a 'hoy')."""
+    fecha, hora = _resolver(normalizar(str(texto)), hoy or date.today())
+    return {clave: valor for clave, valor in (("Fecha", fecha), ("Hora", hora)) if valor}
+
+
+def fecha(texto, hoy=None, completo=False):
+    return _resolver(normalizar(str(texto)), hoy or date.today(), completo)[0]
+
+
+def hora(texto, completo=False):
+    return _resolver(normalizar(str(texto)), date.today(), completo)[1]
+
+
+def estadisticas_cache():
+    return _resolver.cache_info()._asdict()
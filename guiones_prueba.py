@@ -0,0 +1,74 @@
+# ============================================================
+# 📜 Guiones de Prueba (compartidos por benchmark.py y carga.py)
+# ============================================================
+# Diálogos sintéticos de agendar/consultar/cancelar y estadísticas de latencia.
+# No importa la lógica del chatbot: carga.py lo usa también contra la app remota.
+import re
+
+DNI_BASE = 70000000     # hoja_memoria.sembrar_hojas asigna DNI_BASE + i al paciente i
+DNI_NUEVOS = 80000000   # DNI que no están sembrados (el agendamiento crea el paciente)
+MAX_TURNOS_DIALOGO = 12
+
+# (frase inicial, respuesta a cada campo que pregunte el chatbot). Los valores
+# usan {dni} y {fecha}; el orden de las preguntas lo decide el chatbot.
+DIALOGOS = {
+    "agendar": ("quiero agendar una cita", {
+        "DNI": "{dni}", "Nombre": "Paciente Prueba", "Telefono": "987654321",
+        "Email": "prueba@correo.com", "Medico": "Dr. Vega", "Fecha": "{fecha}", "Hora": "10:30",
+    }),
+    "consultar": ("quiero consultar mis citas", {"DNI": "{dni}"}),
+    "cancelar": ("quiero cancelar una cita", {"DNI": "{dni}", "Fecha": "{fecha}"}),
+}
+
+_MARCAS_EXITO = {"agendar": "¡Éxito!", "consultar": "He encontrado", "cancelar": "Éxito:"}
+
+# Campo pedido según el texto de la pregunta (para clientes que no ven el estado, p. ej. HTTP)
+_PREGUNTAS = [
+    ("DNI", re.compile(r"\bDNI\b")),
+    ("Nombre", re.compile(r"nombre completo", re.I)),
+    ("Telefono", re.compile(r"tel[eé]fono", re.I)),
+    ("Email", re.compile(r"\bemail\b", re.I)),
+    ("Medico", re.compile(r"m[eé]dico", re.I)),
+    ("Fecha", re.compile(r"\bfecha\b", re.I)),
+    ("Hora", re.compile(r"\bhora\b", re.I)),
+]
+
+
+def guion(tipo, dni, fecha):
+    frase, respuestas = DIALOGOS[tipo]
+    return frase, {campo: valor.format(dni=dni, fecha=fecha) for campo, valor in respuestas.items()}
+
+
+def dialogo_exitoso(tipo, respuesta):
+    return _MARCAS_EXITO[tipo] in str(respuesta)
+
+
+def campo_en_pregunta(respuesta):
+    """Campo que pide la respuesta del chatbot, o None si no es una pregunta."""
+    texto = str(respuesta)
+    if "?" not in texto and "Necesito" not in texto:
+        return None
+    for campo, patron in _PREGUNTAS:
+        if patron.search(texto):
+            return campo
+    return None
+
+
+# --- Estadísticas ---
+def percentil(valores, p):
+    ordenados = sorted(valores)
+    return ordenados[min(len(ordenados) - 1, int(round(p / 100 * (len(ordenados) - 1))))]
+
+
+def resumir(latencias):
+    if not latencias:
+        return {"n": 0}
+    return {
+        "n": len(latencias),
+        "media_ms": round(1000 * sum(latencias) / len(latencias), 3),
+        "p50_ms": round(1000 * percentil(latencias, 50), 3),
+        "p95_ms": round(1000 * percentil(latencias, 95), 3),
+        "p99_ms": round(1000 * percentil(latencias, 99), 3),
+        "min_ms": round(1000 * min(latencias), 3),
+        "max_ms": round(1000 * max(latencias), 3),
+    }
@@ -0,0 +1,230 @@
+# ============================================================
+# 🧪 Hoja en Memoria (sustituto offline de Google Sheets)
+# ============================================================
+# Implementa los métodos de gspread.Worksheet que usa flujo_agendamiento con
+# la misma semántica (filas y columnas desde 1, valores como texto) y una
+# latencia artificial por llamada para simular la red. Sirve para medir
+# (benchmark.py, carga.py) sin tocar la hoja real.
+import csv
+import os
+import random
+import re
+import threading
+import time
+from datetime import date, timedelta
+
+LATENCIA_SHEETS_S = 0.0 # Por llamada; ~0.3-0.8 s es lo habitual contra la API real
+_RANGO_A1 = re.compile(r"^([A-Za-z]+)(\d*)(?::([A-Za-z]+)(\d*))?$")
+
+
+def _columna(letras):
+    col = 0
+    for letra in letras.upper():
+        col = col * 26 + ord(letra) - ord("A") + 1
+    return col
+
+
+def rango_a1(rango):
+    """'G5' -> (5, 7, 5, 7); 'A2:G' -> (2, 1, None, 7); 'A:A' -> (1, 1, None, 1). Filas y columnas desde 1."""
+    m = _RANGO_A1.match(rango.split("!")[-1])
+    if not m:
+        raise ValueError(f"Rango A1 no soportado: {rango}")
+    col_ini, fila_ini, col_fin, fila_fin = m.groups()
+    if col_fin is None:
+        col_fin, fila_fin = col_ini, fila_ini
+    return (int(fila_ini) if fila_ini else 1, _columna(col_ini),
+            int(fila_fin) if fila_fin else None, _columna(col_fin))
+
+
+class Celda:
+    """Equivalente mínimo de gspread.Cell."""
+    __slots__ = ("row", "col", "value")
+
+    def __init__(self, row, col, value):
+        self.row = row
+        self.col = col
+        self.value = value
+
+    def __repr__(self):
+        return f"<Celda R{self.row}C{self.col} {self.value!r}>"
+
+
+class HojaMemoria:
+    """Worksheet en memoria con latencia inyectada y contador de llamadas por método."""
+
+    def __init__(self, filas, titulo="Hoja", latencia_s=LATENCIA_SHEETS_S, variacion_s=0.0, semilla=None):
+        self.title = titulo
+        self._filas = [[str(v) for v in fila] for fila in filas]
+        self.latencia_s = latencia_s
+        self.variacion_s = variacion_s
+        self.llamadas = {}
+        self.version = 0 # Sube con cada escritura (hace de "última modificación" del documento)
+        self._azar = random.Random(semilla)
+        self._lock = threading.Lock()
+        if hasattr(os, "register_at_fork"):
+            os.register_at_fork(after_in_child=self._tras_fork)
+
+    def _tras_fork(self):
+        self._lock = threading.Lock()
+
+    @classmethod
+    def desde_csv(cls, ruta, titulo=None, **kwargs):
+        with open(ruta, newline="", encoding="utf-8") as f:
+            filas = [fila for fila in csv.reader(f) if fila]
+        return cls(filas, titulo=titulo or ruta, **kwargs)
+
+    # --- Simulación de la API ---
+    def _llamada(self, metodo):
+        with self._lock:
+            self.llamadas[metodo] = self.llamadas.get(metodo, 0) + 1
+            espera = self.latencia_s + (self._azar.uniform(0, self.variacion_s) if self.variacion_s else 0.0)
+        if espera > 0:
+            time.sleep(espera)
+
+    def reiniciar_contadores(self):
+        with self._lock:
+            self.llamadas = {}
+
+    def __len__(self):
+        return len(self._filas)
+
+    # --- Lectura ---
+    def _buscar(self, query, in_row=None, in_column=None, primera=False):
+        query = str(query)
+        encontradas = []
+        with self._lock:
+            for i, fila in enumerate(self._filas, start=1):
+                if in_row is not None and i != in_row:
+                    continue
+                for j, valor in enumerate(fila, start=1):
+                    if in_column is not None and j != in_column:
+                        continue
+                    if valor == query:
+                        encontradas.append(Celda(i, j, valor))
+                        if primera:
+                            return encontradas
+        return encontradas
+
+    def find(self, query, in_row=None, in_column=None, case_sensitive=True):
+        self._llamada("find")
+        encontradas = self._buscar(query, in_row, in_column, primera=True)
+        return encontradas[0] if encontradas else None
+
+    def findall(self, query, in_row=None, in_column=None, case_sensitive=True):
+        self._llamada("findall")
+        return self._buscar(query, in_row, in_column)
+
+    def cell(self, row, col, value_render_option=None):
+        self._llamada("cell")
+        with self._lock:
+            fila = self._filas[row - 1] if 0 < row <= len(self._filas) else []
+            return Celda(row, col, fila[col - 1] if col <= len(fila) else "")
+
+    def row_values(self, row, value_render_option=None):
+        self._llamada("row_values")
+        with self._lock:
+            return list(self._filas[row - 1]) if 0 < row <= len(self._filas) else []
+
+    def col_values(self, col, value_render_option=None):
+        self._llamada("col_values")
+        with self._lock:
+            valores = [fila[col - 1] if col <= len(fila) else "" for fila in self._filas]
+        while valores and valores[-1] == "":
+            valores.pop()
+        return valores
+
+    def get_all_values(self):
+        self._llamada("get_all_values")
+        with self._lock:
+            return [list(fila) for fila in self._filas]
+
+    def batch_get(self, ranges, **kwargs):
+        """Varios rangos A1 en una sola llamada (una lista de filas por rango)."""
+        self._llamada("batch_get")
+        resultado = []
+        with self._lock:
+            for rango in ranges:
+                fila_ini, col_ini, fila_fin, col_fin = rango_a1(rango)
+                filas = [fila[col_ini - 1:col_fin] for fila in self._filas[fila_ini - 1:fila_fin]]
+                while filas and not any(filas[-1]):
+                    filas.pop()
+                resultado.append(filas)
+        return resultado
+
+    # --- Escritura ---
+    def append_row(self, values, value_input_option=None, **kwargs):
+        self._llamada("append_row")
+        with self._lock:
+            self._filas.append([str(v) for v in values])
+            self.version += 1
+
+    def append_rows(self, values, value_input_option=None, **kwargs):
+        self._llamada("append_rows")
+        with self._lock:
+            self._filas.extend([str(v) for v in fila] for fila in values)
+            self.version += 1
+
+    def update_cell(self, row, col, value):
+        self._llamada("update_cell")
+        with self._lock:
+            self.version += 1
+            while len(self._filas) < row:
+                self._filas.append([])
+            fila = self._filas[row - 1]
+            fila.extend([""] * (col - len(fila)))
+            fila[col - 1] = str(value)
+
+    def batch_update(self, data, **kwargs):
+        """Solo rangos de una celda en notación A1 (p. ej. {"range": "G5", "values": [["Cancelado"]]})."""
+        self._llamada("batch_update")
+        for cambio in data:
+            row, col, _, _ = rango_a1(cambio["range"])
+            with self._lock:
+                self.version += 1
+                while len(self._filas) < row:
+                    self._filas.append([])
+                fila = self._filas[row - 1]
+                fila.extend([""] * (col - len(fila)))
+                fila[col - 1] = str(cambio["values"][0][0])
+
+    def delete_rows(self, start_index, end_index=None):
+        self._llamada("delete_rows")
+        with self._lock:
+            self.version += 1
+            del self._filas[start_index - 1:(end_index or start_index)]
+
+
+# --- Datos sintéticos ---
+def sembrar_hojas(n_pacientes, ruta_pacientes="data/Pacientes.csv", ruta_citas="data/Citas.csv",
+                  semilla=42, **kwargs_hoja):
+    """
+    Crea las hojas Pacientes y Citas a partir de los CSV de backup, escaladas a
+    'n_pacientes' (misma proporción de citas por paciente). Los DNI sintéticos
+    son 70000000 + i, así los scripts de prueba saben qué DNI existen.
+    Devuelve (hoja_pacientes, hoja_citas).
+    """
+    azar = random.Random(semilla)
+    base_pacientes = HojaMemoria.desde_csv(ruta_pacientes)._filas
+    base_citas = HojaMemoria.desde_csv(ruta_citas)._filas
+    encabezado_pacientes, modelos_pacientes = base_pacientes[0], base_pacientes[1:]
+    encabezado_citas, modelos_citas = base_citas[0], base_citas[1:]
+
+    pacientes = [encabezado_pacientes]
+    for i in range(n_pacientes):
+        _, nombre, _, telefono, email = (modelos_pacientes[i % len(modelos_pacientes)] + [""] * 5)[:5]
+        pacientes.append([f"P{i + 1:03d}", nombre, str(70000000 + i), telefono, email])
+
+    # Fecha_Registro (columna que añade agendar) entre 0 y 30 días antes de la cita
+    citas = [encabezado_citas[:7] + ["Fecha_Registro"]]
+    n_citas = round(n_pacientes * len(modelos_citas) / max(len(modelos_pacientes), 1))
+    for i in range(n_citas):
+        _, _, fecha, hora, medico, especialidad, estado = (modelos_citas[i % len(modelos_citas)] + [""] * 7)[:7]
+        id_paciente = f"P{azar.randrange(n_pacientes) + 1:03d}"
+        try:
+            registro = (date.fromisoformat(fecha) - timedelta(days=azar.randrange(31))).isoformat()
+        except ValueError:
+            registro = ""
+        citas.append([f"C{i + 1:03d}", id_paciente, fecha, hora, medico, especialidad, estado, registro])
+
+    return (HojaMemoria(pacientes, "Pacientes", semilla=semilla, **kwargs_hoja),
+            HojaMemoria(citas, "Citas", semilla=semilla + 1, **kwargs_hoja))
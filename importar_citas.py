@@ -0,0 +1,169 @@
+# ============================================================
+# 📥 Importación Masiva de Citas (migración de agendas antiguas)
+# ============================================================
+# Carga un CSV grande (nombre, dni, telefono, email, fecha, hora, medico y,
+# opcionalmente, estado y fecha_registro) sin pasar fila a fila por agendar():
+# lee el CSV por bloques, valida DNI/teléfono con operaciones de texto
+# vectorizadas (mismas reglas que _validar_dni_telefono), deduplica pacientes
+# por DNI con un índice en memoria, reserva IDs por bloques y escribe con
+# append_rows en lotes grandes. Las filas inválidas van a un CSV de rechazos
+# con el motivo. El backup CSV se hace una sola vez, al final.
+#
+#   python importar_citas.py agenda_antigua.csv --simular   # Solo validar y contar
+#   python importar_citas.py agenda_antigua.csv             # Importar a la sede principal
+#
+# Pensado para ventanas de mantenimiento: los IDs se reservan al empezar, así que
+# no debe haber otros agendamientos en paralelo. Con un índice DNI en SQLite
+# (shards.py), reconstruirlo después con: python shards.py --reconstruir-indice
+import argparse
+import os
+import time
+from datetime import date
+
+import pandas as pd
+
+import flujo_agendamiento as flujo
+from flujo_agendamiento import _filas_por_dni, _hojas, _max_id, asignar_especialidad
+from trazas import registrar, span
+
+FILAS_POR_BLOQUE = int(os.environ.get("IMPORTAR_FILAS_BLOQUE", 20000)) # Filas del CSV en memoria a la vez
+FILAS_POR_ESCRITURA = int(os.environ.get("IMPORTAR_FILAS_ESCRITURA", 5000)) # Filas por append_rows
+PAUSA_ESCRITURA_S = float(os.environ.get("IMPORTAR_PAUSA_S", 1.0)) # Cuota de Sheets: ~60 escrituras/min
+COLUMNAS_OBLIGATORIAS = ["nombre", "dni", "telefono", "email", "fecha", "hora", "medico"]
+
+
+# --- Validación vectorizada ---
+def validar_bloque(bloque):
+    """
+    Añade 'dni_num', 'tel_num' y 'motivo' (vacío si la fila es válida) a un bloque
+    del CSV leído como texto. Mismas reglas que _validar_dni_telefono.
+    """
+    dni = bloque["dni"].str.replace(r"\D", "", regex=True)
+    tel = bloque["telefono"].str.replace(r"\D", "", regex=True)
+    fecha = pd.to_datetime(bloque["fecha"].str.strip(), format="%Y-%m-%d", errors="coerce")
+
+    motivo = pd.Series("", index=bloque.index)
+    motivo = motivo.mask(bloque["medico"].str.strip() == "", "Falta el médico")
+    motivo = motivo.mask(bloque["hora"].str.strip() == "", "Falta la hora")
+    motivo = motivo.mask(fecha.isna(), "Fecha no válida (AAAA-MM-DD)")
+    motivo = motivo.mask((tel.str.len() != 9) | ~tel.str.startswith("9"), "Teléfono debe tener 9 dígitos y empezar con 9")
+    motivo = motivo.mask(dni.str.len() != 8, "DNI debe tener 8 dígitos")
+
+    bloque = bloque.assign(motivo=motivo)
+    validas = motivo == ""
+    # Como en agendar(), DNI y teléfono se guardan como número
+    bloque["dni_num"] = pd.to_numeric(dni.where(validas), errors="coerce").astype("Int64")
+    bloque["tel_num"] = pd.to_numeric(tel.where(validas), errors="coerce").astype("Int64")
+    bloque["fecha"] = fecha.dt.strftime("%Y-%m-%d").where(validas, bloque["fecha"])
+    return bloque
+
+
+# --- Escritura ---
+def _escribir_en_lotes(hoja, filas):
+    for inicio in range(0, len(filas), FILAS_POR_ESCRITURA):
+        with span("importar.append_rows"):
+            hoja.append_rows(filas[inicio:inicio + FILAS_POR_ESCRITURA], value_input_option="USER_ENTERED")
+        if PAUSA_ESCRITURA_S > 0:
+            time.sleep(PAUSA_ESCRITURA_S)
+
+
+def _guardar_rechazos(rechazadas, ruta, primera_vez):
+    columnas = [c for c in rechazadas.columns if c not in ("dni_num", "tel_num")]
+    rechazadas[["linea"] + [c for c in columnas if c != "linea"]].to_csv(
+        ruta, mode="w" if primera_vez else "a", header=primera_vez, index=False, encoding="utf-8")
+
+
+def importar(ruta_csv, ruta_rechazos=None, simular=False, hojas=None):
+    """
+    Importa las citas de 'ruta_csv' en Pacientes/Citas ('hojas' = otra sede, como en flujo).
+    Devuelve un informe con filas leídas, citas importadas, pacientes nuevos y rechazos.
+    """
+    pacientes_sheet, citas_sheet = _hojas(hojas)
+    ruta_rechazos = ruta_rechazos or os.path.splitext(ruta_csv)[0] + ".rechazos.csv"
+    informe = {"leidas": 0, "importadas": 0, "pacientes_nuevos": 0, "rechazadas": 0, "rechazos": ruta_rechazos}
+    if pacientes_sheet is None or citas_sheet is None:
+        informe["error"] = "No hay conexión a Google Sheets. Revisa las credenciales."
+        return informe
+
+    if os.path.exists(ruta_rechazos):
+        os.remove(ruta_rechazos) # Los rechazos son solo de esta importación
+
+    # --- Estado inicial: una lectura de cada hoja ---
+    filas_pacientes = pacientes_sheet.get_all_values()
+    id_por_dni = {dni: fila[0] for dni, fila in _filas_por_dni(filas_pacientes).items()}
+    siguiente_paciente = _max_id([fila[0] for fila in filas_pacientes[1:] if fila], "P", hojas is None) + 1
+    siguiente_cita = _max_id(citas_sheet.col_values(1)[1:], "C", hojas is None) + 1
+    hoy = date.today().isoformat()
+
+    lector = pd.read_csv(ruta_csv, dtype=str, keep_default_na=False, chunksize=FILAS_POR_BLOQUE,
+                         skipinitialspace=True, encoding="utf-8")
+    for n_bloque, bloque in enumerate(lector):
+        bloque.columns = [c.strip().lower() for c in bloque.columns]
+        faltan = [c for c in COLUMNAS_OBLIGATORIAS if c not in bloque.columns]
+        if faltan:
+            informe["error"] = f"Faltan columnas en el CSV: {', '.join(faltan)}"
+            return informe
+        bloque.insert(0, "linea", bloque.index + 2) # Línea del CSV (1 = encabezado)
+
+        with span("importar.bloque"):
+            bloque = validar_bloque(bloque)
+            validas = bloque[bloque["motivo"] == ""]
+            rechazadas = bloque[bloque["motivo"] != ""]
+
+            # --- Pacientes nuevos: DNIs no indexados, una vez cada uno (reserva de IDs en bloque) ---
+            dnis = validas["dni_num"].astype(str)
+            nuevos = validas[dnis.map(id_por_dni).isna()].drop_duplicates("dni_num")
+            ids_nuevos = [f"P{n:03d}" for n in range(siguiente_paciente, siguiente_paciente + len(nuevos))]
+            siguiente_paciente += len(nuevos)
+            id_por_dni.update(zip(nuevos["dni_num"].astype(str), ids_nuevos))
+            filas_nuevos = [[id_p, nombre, int(dni), int(tel), email] for id_p, nombre, dni, tel, email in
+                            zip(ids_nuevos, nuevos["nombre"], nuevos["dni_num"], nuevos["tel_num"], nuevos["email"])]
+
+            # --- Citas: IDs consecutivos, especialidad por médico (una vez por médico distinto) ---
+            ids_citas = [f"C{n:03d}" for n in range(siguiente_cita, siguiente_cita + len(validas))]
+            siguiente_cita += len(validas)
+            especialidad = validas["medico"].map({m: asignar_especialidad(m) for m in validas["medico"].unique()})
+            estado = validas["estado"].where(validas["estado"] != "", "Pendiente") if "estado" in validas \
+                else pd.Series("Pendiente", index=validas.index)
+            registro = validas["fecha_registro"].where(validas["fecha_registro"] != "", hoy) \
+                if "fecha_registro" in validas else pd.Series(hoy, index=validas.index)
+            filas_citas = [list(fila) for fila in zip(ids_citas, dnis.map(id_por_dni), validas["fecha"],
+                                                      validas["hora"], validas["medico"], especialidad, estado, registro)]
+
+        if not simular:
+            # Pacientes antes que sus citas: si algo falla, no quedan citas huérfanas
+            _escribir_en_lotes(pacientes_sheet, filas_nuevos)
+            _escribir_en_lotes(citas_sheet, filas_citas)
+        if len(rechazadas):
+            _guardar_rechazos(rechazadas, ruta_rechazos, primera_vez=informe["rechazadas"] == 0)
+
+        informe["leidas"] += len(bloque)
+        informe["importadas"] += len(filas_citas)
+        informe["pacientes_nuevos"] += len(filas_nuevos)
+        informe["rechazadas"] += len(rechazadas)
+        registrar("importar_bloque", modulo="importar", bloque=n_bloque, simular=simular,
+                  citas=len(filas_citas), pacientes_nuevos=len(filas_nuevos), rechazadas=len(rechazadas))
+
+    # --- Backup CSV: una vez por importación, no por fila ---
+    if not simular and flujo.BACKUP_CSV and hojas is None and informe["importadas"]:
+        flujo.persistir_csv_backup(pacientes_sheet, flujo.PACIENTES_CSV)
+        flujo.persistir_csv_backup(citas_sheet, flujo.CITAS_CSV)
+    registrar("importacion_completada", modulo="importar", **{k: v for k, v in informe.items() if k != "rechazos"})
+    return informe
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Importa en bloque un CSV de citas a Google Sheets.")
+    parser.add_argument("csv", help="CSV con nombre, dni, telefono, email, fecha, hora, medico [, estado, fecha_registro].")
+    parser.add_argument("--rechazos", help="CSV de filas rechazadas (por defecto <csv>.rechazos.csv).")
+    parser.add_argument("--simular", action="store_true", help="Validar y contar sin escribir en las hojas.")
+    args = parser.parse_args()
+
+    inicio = time.time()
+    informe = importar(args.csv, ruta_rechazos=args.rechazos, simular=args.simular)
+    print(f"{'🔎 Simulación' if args.simular else '📥 Importación'}: {informe['importadas']} de {informe['leidas']} citas "
+          f"({informe['pacientes_nuevos']} pacientes nuevos) en {time.time() - inicio:.1f} s")
+    if informe["rechazadas"]:
+        print(f"⚠️ {informe['rechazadas']} filas rechazadas -> {informe['rechazos']}")
+    if informe.get("error"):
+        print(f"❌ {informe['error']}")
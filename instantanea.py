@@ -0,0 +1,175 @@
+# ============================================================
+# 💾 Instantánea del Espejo Local (arranque en caliente)
+# ============================================================
+# Guarda las tablas de los espejos (sincronizacion.py) en un archivo binario
+# versionado que se abre con mmap: al reiniciar no hay que volver a pedir las
+# hojas completas a Google, solo lo cambiado desde la instantánea.
+#
+# Formato (little-endian, secciones alineadas a 8 bytes):
+#   cabecera "<8sHHQQ": MAGIA, VERSION_FORMATO, 0, posición y longitud de los metadatos
+#   por tabla: hash de cada fila (8 bytes), offsets uint32 del inicio de cada
+#              celda (filas * columnas + 1) y las celdas en UTF-8 separadas por
+#              SEPARADOR (acceso a una celda por offset; carga completa con un split)
+#   metadatos JSON al final: {"creado", "tablas": {nombre: {"encabezados", "marca",
+#              "ultima_completa", "filas", "columnas", "separable", "off_hashes",
+#              "off_offsets", "off_datos"}}}
+import json
+import mmap
+import os
+import struct
+import sys
+import time
+from array import array
+
+MAGIA = b"CITASESP"
+VERSION_FORMATO = 1
+_CABECERA = struct.Struct("<8sHHQQ")
+_TAM_HASH = 8
+SEPARADOR = "\x1f" # Separador de unidades ASCII: no aparece en texto escrito a mano
+
+
+def _alinear(n):
+    return (n + 7) & ~7
+
+
+def _escribir_alineado(f, bloque):
+    f.write(b"\0" * (_alinear(f.tell()) - f.tell()))
+    posicion = f.tell()
+    f.write(bloque)
+    return posicion
+
+
+def guardar(ruta, tablas):
+    """
+    Escribe la instantánea de forma atómica. 'tablas' = {nombre: dict con
+    "encabezados", "filas", "hashes", "marca", "ultima_completa"}.
+    Devuelve el tamaño del archivo en bytes.
+    """
+    directorio = os.path.dirname(ruta)
+    if directorio:
+        os.makedirs(directorio, exist_ok=True)
+    metadatos = {"creado": time.time(), "tablas": {}}
+    temporal = f"{ruta}.{os.getpid()}.tmp"
+    with open(temporal, "wb") as f:
+        f.write(_CABECERA.pack(MAGIA, VERSION_FORMATO, 0, 0, 0)) # Se reescribe al final
+        for nombre, tabla in tablas.items():
+            columnas = len(tabla["encabezados"])
+            offsets = array("I", [0])
+            celdas = []
+            separable = True
+            for fila in tabla["filas"]:
+                for celda in fila[:columnas] + [""] * (columnas - len(fila)):
+                    codificada = celda.encode("utf-8")
+                    separable = separable and SEPARADOR not in celda
+                    celdas.append(codificada)
+                    offsets.append(offsets[-1] + len(codificada) + 1)
+            datos = SEPARADOR.encode().join(celdas)
+            if sys.byteorder != "little":
+                offsets.byteswap()
+            metadatos["tablas"][nombre] = {
+                "encabezados": tabla["encabezados"], "marca": tabla["marca"],
+                "ultima_completa": tabla["ultima_completa"], "filas": len(tabla["filas"]), "columnas": columnas,
+                "separable": separable,
+                "off_hashes": _escribir_alineado(f, b"".join(tabla["hashes"])),
+                "off_offsets": _escribir_alineado(f, offsets.tobytes()),
+                "off_datos": _escribir_alineado(f, bytes(datos)),
+            }
+        texto_meta = json.dumps(metadatos, ensure_ascii=False, default=str).encode("utf-8")
+        posicion_meta = _escribir_alineado(f, texto_meta)
+        f.seek(0)
+        f.write(_CABECERA.pack(MAGIA, VERSION_FORMATO, 0, posicion_meta, len(texto_meta)))
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(temporal, ruta)
+    return os.path.getsize(ruta)
+
+
+class TablaMapeada:
+    """Vista de solo lectura de una tabla de la instantánea; las celdas se decodifican al pedirlas."""
+
+    def __init__(self, vista, info):
+        self.encabezados = info["encabezados"]
+        self.marca = info["marca"]
+        self.ultima_completa = info["ultima_completa"]
+        self.n_filas = info["filas"]
+        self.n_columnas = info["columnas"]
+        self._separable = info["separable"]
+        n_celdas = self.n_filas * self.n_columnas
+        self._hashes = vista[info["off_hashes"]:info["off_hashes"] + self.n_filas * _TAM_HASH]
+        self._offsets = vista[info["off_offsets"]:info["off_offsets"] + (n_celdas + 1) * 4].cast("I")
+        self._datos = vista[info["off_datos"]:info["off_datos"] + max(self._offsets[n_celdas] - 1, 0)]
+
+    def __len__(self):
+        return self.n_filas
+
+    def celda(self, fila, columna):
+        k = fila * self.n_columnas + columna
+        return str(self._datos[self._offsets[k]:self._offsets[k + 1] - 1], "utf-8")
+
+    def fila(self, i):
+        return [self.celda(i, j) for j in range(self.n_columnas)]
+
+    def hash(self, i):
+        return bytes(self._hashes[i * _TAM_HASH:(i + 1) * _TAM_HASH])
+
+    def filas(self):
+        """Todas las filas (listas de texto); sin separador en los datos, con un solo decode + split."""
+        if not self._separable or not self.n_filas or not self.n_columnas:
+            return [self.fila(i) for i in range(self.n_filas)]
+        celdas = str(self._datos, "utf-8").split(SEPARADOR)
+        c = self.n_columnas
+        return [celdas[i:i + c] for i in range(0, len(celdas), c)]
+
+    def hashes(self):
+        datos = bytes(self._hashes)
+        return [datos[i:i + _TAM_HASH] for i in range(0, len(datos), _TAM_HASH)]
+
+    def liberar(self):
+        for vista in (self._hashes, self._offsets, self._datos):
+            vista.release()
+
+
+class Instantanea:
+    """Instantánea abierta con mmap. Lanza ValueError si el archivo no es válido o es de otra versión."""
+
+    def __init__(self, ruta):
+        self.ruta = ruta
+        with open(ruta, "rb") as f:
+            self._mapa = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            magia, version, _, posicion_meta, longitud = _CABECERA.unpack_from(self._mapa, 0)
+            if magia != MAGIA:
+                raise ValueError(f"{ruta} no es una instantánea del espejo.")
+            if version != VERSION_FORMATO:
+                raise ValueError(f"{ruta} tiene formato v{version} (se espera v{VERSION_FORMATO}).")
+            self.metadatos = json.loads(bytes(self._mapa[posicion_meta:posicion_meta + longitud]))
+            self._vista = memoryview(self._mapa)
+        except (struct.error, json.JSONDecodeError) as e:
+            self._mapa.close()
+            raise ValueError(f"{ruta} está dañada: {e}")
+        except ValueError:
+            self._mapa.close()
+            raise
+        self.creado = self.metadatos["creado"]
+        self._tablas = {}
+
+    def __contains__(self, nombre):
+        return nombre in self.metadatos["tablas"]
+
+    def tabla(self, nombre):
+        if nombre not in self._tablas:
+            self._tablas[nombre] = TablaMapeada(self._vista, self.metadatos["tablas"][nombre])
+        return self._tablas[nombre]
+
+    def cerrar(self):
+        for tabla in self._tablas.values():
+            tabla.liberar()
+        self._tablas = {}
+        self._vista.release()
+        self._mapa.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.cerrar()
@@ -0,0 +1,345 @@
+# ============================================================
+# 🔥 Perfilador por Muestreo (capturas bajo demanda y de peticiones lentas)
+# ============================================================
+# Las funciones decoradas con @perfilado (turnos de chat y voz, CRUD) pueden
+# capturarse de tres formas:
+#   - PERFILAR=1: todas las llamadas.
+#   - activar(segundos) / desactivar(): interruptor de administración
+#     (API /api/perfilador y pestaña Datos).
+#   - Vigilante: si una llamada pasa de PERFILAR_UMBRAL_S, se empieza a
+#     muestrear en ese momento hasta que termine (captura "lenta").
+# Durante una captura un hilo toma sys._current_frames() cada
+# PERFILAR_INTERVALO_MS y cuenta las pilas de todos los hilos (los pools de
+# ejecutores.py incluidos). Al terminar se escriben en PERFILES_DIR:
+#   <id>.folded  pilas plegadas ("hilo;func (archivo:línea);... N"), listas para flamegraph.pl / speedscope
+#   <id>.json    función, disparador, duración, muestras y entradas (DNI, teléfono y email enmascarados)
+# Se conservan los PERFILES_MAX más recientes. Apagado cuesta un if (y, con el
+# vigilante, anotar inicio y fin de la llamada en un dict).
+import contextvars
+import functools
+import inspect
+import itertools
+import json
+import os
+import re
+import sys
+import threading
+import time
+from collections import Counter
+
+from trazas import id_peticion_actual, registrar
+
+PERFILAR = os.environ.get("PERFILAR") == "1"
+PERFILAR_UMBRAL_S = float(os.environ.get("PERFILAR_UMBRAL_S", 10)) # 0 = sin vigilante
+PERFILAR_INTERVALO_MS = float(os.environ.get("PERFILAR_INTERVALO_MS", 5))
+PERFILES_DIR = os.environ.get("PERFILES_DIR", "data/perfiles")
+PERFILES_MAX = int(os.environ.get("PERFILES_MAX", 50))
+PROFUNDIDAD_MAX = 80
+# Hilos parados en una espera (pool sin trabajo, cola, select) no aportan nada al perfil
+_ARCHIVOS_ESPERA = ("threading.py", "selectors.py", "queue.py")
+
+_captura_actual = contextvars.ContextVar("captura_perfil", default=None)
+_lock = threading.Lock()
+_activo_hasta = float("inf") if PERFILAR else 0.0
+_capturas = set() # Capturas en curso (las alimenta el hilo de muestreo)
+_en_curso = {} # token -> [nombre, inicio, id_peticion, captura] (para el vigilante)
+_tokens = itertools.count()
+_hilo_muestreo = None
+_hilo_vigilante = None
+
+
+# --- Enmascarado de datos personales ---
+_PATRON_EMAIL = re.compile(r"\b([\w.+\-])[\w.+\-]*@([\w\-]+(?:\.[\w\-]+)+)")
+_PATRON_TELEFONO = re.compile(r"(?<!\d)9\d{6}(\d{2})(?!\d)")
+_PATRON_DNI = re.compile(r"(?<!\d)\d{6}(\d{2})(?!\d)")
+_PARAMETROS_PERSONALES = {"nombre", "email", "dni", "telefono"}
+
+
+def enmascarar(valor, parametro=None, profundidad=0):
+    """Versión serializable de una entrada sin DNI/teléfono/email completos; arrays y listas largas se resumen."""
+    if parametro in _PARAMETROS_PERSONALES and valor is not None:
+        texto = str(valor)
+        return f"<{parametro}: {len(texto)} caracteres>" if parametro == "nombre" else enmascarar(texto)
+    if isinstance(valor, str):
+        texto = _PATRON_EMAIL.sub(r"\1***@\2", valor)
+        texto = _PATRON_TELEFONO.sub(r"9******\1", texto)
+        return _PATRON_DNI.sub(r"******\1", texto)
+    if isinstance(valor, int) and not isinstance(valor, bool) and len(str(abs(valor))) in (8, 9):
+        return enmascarar(str(valor)) # DNI o teléfono guardados como número
+    if valor is None or isinstance(valor, (bool, int, float)):
+        return valor
+    if hasattr(valor, "shape") and hasattr(valor, "dtype"):
+        return f"<array {getattr(valor.dtype, 'name', valor.dtype)} {tuple(valor.shape)}>"
+    if isinstance(valor, dict) and profundidad < 3:
+        return {str(k): enmascarar(v, str(k).lower(), profundidad + 1) for k, v in list(valor.items())[:20]}
+    if isinstance(valor, (list, tuple)) and profundidad < 3:
+        if len(valor) > 10:
+            return f"<{type(valor).__name__} de {len(valor)} elementos>"
+        return [enmascarar(v, None, profundidad + 1) for v in valor]
+    return f"<{type(valor).__name__}>"
+
+
+def _entradas(funcion, args, kwargs):
+    try:
+        argumentos = inspect.signature(funcion).bind_partial(*args, **kwargs).arguments
+    except (TypeError, ValueError):
+        argumentos = {f"arg{i}": v for i, v in enumerate(args)} | kwargs
+    return {nombre: enmascarar(valor, nombre.lower()) for nombre, valor in argumentos.items()}
+
+
+# --- Muestreo ---
+class Captura:
+    def __init__(self, nombre, disparador, id_peticion=None):
+        self.nombre = nombre
+        self.disparador = disparador
+        self.inicio = time.time()
+        self.pilas = Counter()
+        self.muestras = 0
+        self.id_peticion = id_peticion or id_peticion_actual()
+
+    def __repr__(self):
+        return f"Captura({self.nombre}, {self.disparador}, {self.muestras} muestras)"
+
+
+def _plegar(frame, nombre_hilo):
+    """Pila de un hilo como 'hilo;raíz;...;hoja', o None si el hilo está esperando."""
+    if os.path.basename(frame.f_code.co_filename) in _ARCHIVOS_ESPERA:
+        return None
+    marcos = []
+    while frame is not None and len(marcos) < PROFUNDIDAD_MAX:
+        codigo = frame.f_code
+        marcos.append(f"{codigo.co_name} ({os.path.basename(codigo.co_filename)}:{codigo.co_firstlineno})")
+        frame = frame.f_back
+    return ";".join([nombre_hilo] + marcos[::-1])
+
+
+def _muestrear():
+    global _hilo_muestreo
+    propio = threading.get_ident() # Ni este hilo ni el vigilante entran en el perfil
+    intervalo = PERFILAR_INTERVALO_MS / 1000
+    while True:
+        with _lock:
+            capturas = list(_capturas)
+            if not capturas:
+                _hilo_muestreo = None
+                return
+        nombres = {h.ident: h.name for h in threading.enumerate()}
+        pilas = [_plegar(frame, nombres.get(ident, str(ident))) for ident, frame in sys._current_frames().items()
+                 if ident != propio and not nombres.get(ident, "").startswith("perfilador")]
+        pilas = [p for p in pilas if p]
+        for captura in capturas:
+            captura.pilas.update(pilas)
+            captura.muestras += 1
+        time.sleep(intervalo)
+
+
+def _empezar(nombre, disparador, id_peticion=None):
+    global _hilo_muestreo
+    captura = Captura(nombre, disparador, id_peticion)
+    with _lock:
+        _capturas.add(captura)
+        if _hilo_muestreo is None:
+            _hilo_muestreo = threading.Thread(target=_muestrear, name="perfilador", daemon=True)
+            _hilo_muestreo.start()
+    return captura
+
+
+def _terminar(captura, funcion, args, kwargs, duracion, error):
+    with _lock:
+        _capturas.discard(captura)
+    try:
+        _guardar(captura, _entradas(funcion, args, kwargs), duracion, error)
+    except OSError as e:
+        registrar("error_perfil", nivel="error", modulo="perfilador", error=str(e))
+
+
+# --- Volcado ---
+def _guardar(captura, entradas, duracion, error):
+    os.makedirs(PERFILES_DIR, exist_ok=True)
+    # La marca de tiempo abre el nombre: el orden alfabético es el cronológico (rotación)
+    marca = time.strftime("%Y%m%d-%H%M%S", time.localtime(captura.inicio)) + f".{int(captura.inicio * 1000) % 1000:03d}"
+    base = os.path.join(PERFILES_DIR, f"{marca}_{captura.nombre}_{captura.disparador}_{os.getpid()}_{id(captura):x}")
+    with open(base + ".folded", "w", encoding="utf-8") as f:
+        f.writelines(f"{pila} {n}\n" for pila, n in captura.pilas.most_common())
+    metadatos = {
+        "funcion": captura.nombre, "disparador": captura.disparador, "id_peticion": captura.id_peticion,
+        "inicio": captura.inicio, "duracion_s": round(duracion, 4), "muestras": captura.muestras,
+        "intervalo_ms": PERFILAR_INTERVALO_MS, "error": error, "entradas": entradas,
+    }
+    with open(base + ".json", "w", encoding="utf-8") as f:
+        json.dump(metadatos, f, ensure_ascii=False, indent=1, default=str)
+    registrar("perfil_guardado", modulo="perfilador", funcion=captura.nombre, disparador=captura.disparador,
+              muestras=captura.muestras, duracion_s=round(duracion, 3), archivo=base + ".folded")
+    _rotar()
+
+
+def _rotar():
+    try:
+        perfiles = sorted(a[:-len(".json")] for a in os.listdir(PERFILES_DIR) if a.endswith(".json"))
+    except FileNotFoundError:
+        return
+    for base in perfiles[:max(len(perfiles) - PERFILES_MAX, 0)]:
+        for extension in (".folded", ".json"):
+            try:
+                os.remove(os.path.join(PERFILES_DIR, base + extension))
+            except FileNotFoundError:
+                pass
+
+
+def perfiles_recientes(n=10):
+    """Metadatos de los últimos 'n' perfiles guardados (más reciente primero)."""
+    try:
+        archivos = sorted((a for a in os.listdir(PERFILES_DIR) if a.endswith(".json")), reverse=True)[:n]
+    except FileNotFoundError:
+        return []
+    recientes = []
+    for archivo in archivos:
+        try:
+            with open(os.path.join(PERFILES_DIR, archivo), encoding="utf-8") as f:
+                datos = json.load(f)
+        except (OSError, json.JSONDecodeError):
+            continue
+        recientes.append({"archivo": archivo[:-len(".json")] + ".folded", "funcion": datos["funcion"],
+                          "disparador": datos["disparador"], "duracion_s": datos["duracion_s"],
+                          "muestras": datos["muestras"]})
+    return recientes
+
+
+# --- Vigilante de peticiones lentas ---
+def _vigilar():
+    while True:
+        time.sleep(min(PERFILAR_UMBRAL_S / 4, 1.0))
+        limite = time.time() - PERFILAR_UMBRAL_S
+        with _lock:
+            lentas = [(token, registro) for token, registro in _en_curso.items()
+                      if registro[3] is None and registro[1] < limite]
+        for token, registro in lentas:
+            captura = _empezar(registro[0], "lenta", registro[2])
+            # Comprobar y asignar bajo el lock: si salir() ya se llevó el token, nadie pararía esta captura
+            with _lock:
+                vigente = _en_curso.get(token) is registro and registro[3] is None
+                if vigente:
+                    registro[3] = captura
+                else:
+                    _capturas.discard(captura)
+            if vigente:
+                registrar("perfil_peticion_lenta", nivel="warning", modulo="perfilador", funcion=registro[0],
+                          transcurrido_s=round(time.time() - registro[1], 2))
+
+
+def _asegurar_vigilante():
+    global _hilo_vigilante
+    if _hilo_vigilante is None or not _hilo_vigilante.is_alive():
+        with _lock:
+            if _hilo_vigilante is None or not _hilo_vigilante.is_alive():
+                _hilo_vigilante = threading.Thread(target=_vigilar, name="perfilador-vigilante", daemon=True)
+                _hilo_vigilante.start()
+
+
+def _despues_de_fork():
+    # Los hilos no sobreviven al fork (servidor.py): se vuelven a crear al primer uso
+    global _lock, _hilo_muestreo, _hilo_vigilante
+    _lock = threading.Lock()
+    _capturas.clear()
+    _en_curso.clear()
+    _hilo_muestreo = _hilo_vigilante = None
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_despues_de_fork)
+
+
+# --- Activación ---
+def activar(segundos=300):
+    """Captura todas las llamadas perfiladas durante 'segundos' (None = hasta desactivar())."""
+    global _activo_hasta
+    _activo_hasta = float("inf") if segundos is None else time.time() + segundos
+    registrar("perfilador_activado", modulo="perfilador", segundos=segundos)
+
+
+def desactivar():
+    global _activo_hasta
+    _activo_hasta = 0.0
+    registrar("perfilador_desactivado", modulo="perfilador")
+
+
+def activo():
+    return time.time() < _activo_hasta
+
+
+def estado():
+    restante = _activo_hasta - time.time()
+    return {
+        "activo": restante > 0,
+        "restante_s": None if restante == float("inf") else max(round(restante), 0),
+        "umbral_lenta_s": PERFILAR_UMBRAL_S or None,
+        "capturas_en_curso": len(_capturas),
+        "directorio": PERFILES_DIR,
+        "recientes": perfiles_recientes(),
+    }
+
+
+# --- Decorador ---
+def perfilado(nombre=None):
+    """
+    Hace perfilable la función (sync o async). Las llamadas anidadas dentro de
+    una captura (el CRUD dentro de un turno de chat) quedan en la captura externa.
+    """
+    def decorador(funcion):
+        nombre_perfil = nombre or funcion.__name__
+
+        def entrar(args, kwargs):
+            if _captura_actual.get() is not None:
+                return None, None
+            if time.time() < _activo_hasta:
+                return _empezar(nombre_perfil, "activo"), None
+            if PERFILAR_UMBRAL_S > 0:
+                _asegurar_vigilante()
+                token = next(_tokens)
+                with _lock:
+                    _en_curso[token] = [nombre_perfil, time.time(), id_peticion_actual(), None]
+                return None, token
+            return None, None
+
+        def salir(captura, token, args, kwargs, inicio, error):
+            if token is not None:
+                with _lock:
+                    captura = _en_curso.pop(token)[3]
+            if captura is not None:
+                _terminar(captura, funcion, args, kwargs, time.time() - inicio, error)
+
+        if inspect.iscoroutinefunction(funcion):
+            @functools.wraps(funcion)
+            async def envoltura_async(*args, **kwargs):
+                captura, token = entrar(args, kwargs)
+                if captura is None and token is None:
+                    return await funcion(*args, **kwargs)
+                inicio, error = time.time(), None
+                marca = _captura_actual.set(captura or token)
+                try:
+                    return await funcion(*args, **kwargs)
+                except BaseException as e:
+                    error = repr(e)
+                    raise
+                finally:
+                    _captura_actual.reset(marca)
+                    salir(captura, token, args, kwargs, inicio, error)
+            return envoltura_async
+
+        @functools.wraps(funcion)
+        def envoltura(*args, **kwargs):
+            captura, token = entrar(args, kwargs)
+            if captura is None and token is None:
+                return funcion(*args, **kwargs)
+            inicio, error = time.time(), None
+            marca = _captura_actual.set(captura or token)
+            try:
+                return funcion(*args, **kwargs)
+            except BaseException as e:
+                error = repr(e)
+                raise
+            finally:
+                _captura_actual.reset(marca)
+                salir(captura, token, args, kwargs, inicio, error)
+        return envoltura
+    return decorador
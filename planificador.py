@@ -0,0 +1,196 @@
+# ============================================================
+# 🚦 Planificador de Eventos (pools por tipo de trabajo)
+# ============================================================
+# Cada evento de la interfaz se asigna a un pool con su propio límite de
+# concurrencia y su propia cola máxima, así una síntesis de voz de varios
+# segundos no retrasa un "Consultar". Sobre los pools hay un límite global:
+# cuando se alcanza, los huecos libres van primero a los pools de más
+# prioridad (el chat antes que la pestaña de datos). Si la cola de un pool
+# está llena, o la espera supera su máximo, la petición se rechaza al
+# momento (503) en vez de quedarse esperando.
+import asyncio
+import functools
+import heapq
+import inspect
+import itertools
+import os
+import time
+
+from trazas import incrementar, observar, registrar
+
+try:
+    import gradio as gr
+except ImportError:
+    gr = None
+
+
+def _config_pool(nombre, limite, max_cola, prioridad, espera_max_s):
+    clave = f"POOL_{nombre.upper()}"
+    return {
+        "limite": int(os.environ.get(f"{clave}_LIMITE", limite)),
+        "max_cola": int(os.environ.get(f"{clave}_COLA", max_cola)),
+        "prioridad": prioridad, # Menor = más prioritario
+        "espera_max_s": float(os.environ.get(f"{clave}_ESPERA_S", espera_max_s)),
+    }
+
+
+# --- Pools (sobrescribibles con POOL_<NOMBRE>_LIMITE / _COLA / _ESPERA_S) ---
+POOLS = {
+    "voz": _config_pool("voz", limite=8, max_cola=16, prioridad=0, espera_max_s=20),     # STT en lotes / TTS (CPU, segundos)
+    "nlp": _config_pool("nlp", limite=16, max_cola=128, prioridad=0, espera_max_s=10),   # Turnos de chat de texto
+    "io": _config_pool("io", limite=16, max_cola=64, prioridad=1, espera_max_s=10),      # CRUD directo contra Sheets
+    "admin": _config_pool("admin", limite=1, max_cola=4, prioridad=5, espera_max_s=30),  # Tablas, sesiones, carga masiva
+}
+MAX_TOTAL = int(os.environ.get("POOL_MAX_TOTAL", 24)) # Eventos en ejecución entre todos los pools
+
+
+class ColaLlena(Exception):
+    """El pool no admite más peticiones en espera (equivale a un 503)."""
+
+    def __init__(self, pool, motivo):
+        super().__init__(f"Pool '{pool}' saturado: {motivo}")
+        self.pool = pool
+        self.motivo = motivo
+
+
+class _Pool:
+    __slots__ = ("nombre", "limite", "max_cola", "prioridad", "espera_max_s", "activos", "en_cola")
+
+    def __init__(self, nombre, limite, max_cola, prioridad, espera_max_s):
+        self.nombre = nombre
+        self.limite = limite
+        self.max_cola = max_cola
+        self.prioridad = prioridad
+        self.espera_max_s = espera_max_s
+        self.activos = 0
+        self.en_cola = 0
+
+
+class Planificador:
+    """
+    Admisión de eventos por pool. Todo ocurre en el bucle de eventos del
+    servidor (los handlers envueltos son async), así que no hacen falta locks.
+    """
+
+    def __init__(self, pools=POOLS, max_total=MAX_TOTAL):
+        self.pools = {nombre: _Pool(nombre, **config) for nombre, config in pools.items()}
+        self.max_total = max_total
+        self.activos_total = 0
+        self._esperando = [] # heap de (prioridad, orden, pool, future)
+        self._orden = itertools.count()
+
+    def _hay_hueco(self, pool):
+        return pool.activos < pool.limite and self.activos_total < self.max_total
+
+    def _ocupar(self, pool):
+        pool.activos += 1
+        self.activos_total += 1
+
+    def _despachar(self):
+        """Da los huecos libres a los que esperan, por prioridad y orden de llegada."""
+        restantes = []
+        while self._esperando and self.activos_total < self.max_total:
+            entrada = heapq.heappop(self._esperando)
+            _, _, pool, futuro = entrada
+            if futuro.done(): # Cancelado o caducado
+                continue
+            if pool.activos < pool.limite:
+                pool.en_cola -= 1
+                self._ocupar(pool)
+                futuro.set_result(None)
+            else:
+                restantes.append(entrada)
+        for entrada in restantes:
+            heapq.heappush(self._esperando, entrada)
+
+    def _espera_mas_prioritario(self, prioridad):
+        """Hay alguien esperando (de cualquier pool) con más prioridad que 'prioridad'."""
+        return any(p < prioridad and not futuro.done() for p, _, _, futuro in self._esperando)
+
+    async def adquirir(self, nombre_pool, prioridad=None):
+        pool = self.pools[nombre_pool]
+        prioridad = pool.prioridad if prioridad is None else prioridad
+        if self._hay_hueco(pool) and not pool.en_cola and not self._espera_mas_prioritario(prioridad):
+            self._ocupar(pool)
+            return 0.0
+        if pool.en_cola >= pool.max_cola:
+            incrementar("rechazos_cola", pool=pool.nombre, motivo="cola_llena")
+            raise ColaLlena(pool.nombre, f"{pool.en_cola} peticiones en cola")
+
+        inicio = time.perf_counter()
+        futuro = asyncio.get_running_loop().create_future()
+        pool.en_cola += 1
+        heapq.heappush(self._esperando, (prioridad, next(self._orden), pool, futuro))
+        self._despachar() # Si hay hueco, por orden de prioridad (puede tocarle a esta misma)
+        try:
+            await asyncio.wait_for(asyncio.shield(futuro), pool.espera_max_s)
+        except (asyncio.TimeoutError, asyncio.CancelledError) as e:
+            if futuro.done() and not futuro.cancelled():
+                self.liberar(nombre_pool) # Se le asignó hueco justo al caducar: devolverlo
+            else:
+                futuro.cancel()
+                pool.en_cola -= 1
+            if isinstance(e, asyncio.CancelledError):
+                raise
+            incrementar("rechazos_cola", pool=pool.nombre, motivo="espera_maxima")
+            raise ColaLlena(pool.nombre, f"más de {pool.espera_max_s:.0f}s en cola") from None
+        espera = time.perf_counter() - inicio
+        observar(f"cola.{pool.nombre}", espera)
+        return espera
+
+    def liberar(self, nombre_pool):
+        pool = self.pools[nombre_pool]
+        pool.activos -= 1
+        self.activos_total -= 1
+        self._despachar()
+
+    def estado(self):
+        """Ocupación de cada pool (para la pestaña de datos o depuración)."""
+        return {nombre: {"activos": p.activos, "limite": p.limite, "en_cola": p.en_cola, "max_cola": p.max_cola}
+                for nombre, p in self.pools.items()}
+
+    # --- Envolver handlers de Gradio ---
+    def _rechazo(self, error):
+        registrar("rechazo_cola", nivel="warning", modulo="planificador", pool=error.pool, motivo=error.motivo)
+        if gr is not None:
+            return gr.Error("⏳ El servicio está ocupado en este momento (503). Inténtalo de nuevo en unos segundos.")
+        return error
+
+    def en_pool(self, nombre_pool, prioridad=None):
+        """
+        Decorador: el handler (sync, async o generador async) solo se ejecuta
+        cuando su pool tiene hueco. Los sync se pasan a un hilo para no
+        bloquear el bucle mientras trabajan.
+        """
+        def decorador(funcion):
+            if inspect.isasyncgenfunction(funcion):
+                @functools.wraps(funcion)
+                async def envoltura_gen(*args, **kwargs):
+                    try:
+                        await self.adquirir(nombre_pool, prioridad)
+                    except ColaLlena as e:
+                        raise self._rechazo(e) from None
+                    try:
+                        async for parcial in funcion(*args, **kwargs):
+                            yield parcial
+                    finally:
+                        self.liberar(nombre_pool)
+                return envoltura_gen
+
+            @functools.wraps(funcion)
+            async def envoltura(*args, **kwargs):
+                try:
+                    await self.adquirir(nombre_pool, prioridad)
+                except ColaLlena as e:
+                    raise self._rechazo(e) from None
+                try:
+                    if inspect.iscoroutinefunction(funcion):
+                        return await funcion(*args, **kwargs)
+                    return await asyncio.to_thread(funcion, *args, **kwargs)
+                finally:
+                    self.liberar(nombre_pool)
+            return envoltura
+        return decorador
+
+
+planificador = Planificador()
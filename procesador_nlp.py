@@ -1,6 +1,8 @@
 import spacy
 import re
-from datetime import datetime, timedelta
+from trazas import trazado, registrar
+from directorio_medicos import en_texto as medico_en_texto
+from gramatica_fechas import resolver as resolver_fecha_hora
 
 # --- Cargar Modelo Entrenado (Tarea S2-02 REAL) ---
 MODELO_INTENT_PATH = "modelo_intent_spacy" # Carpeta donde guardó entrenar_nlp.py
@@ -20,95 +22,57 @@ except Exception as e:
     modelo_cargado = False
 
 
-# --- Cargar Modelo Base (Para Entidades - S2-03) ---
-# Necesario para extraer entidades como PER
-try:
-    # Usamos el modelo base 'es_core_news_sm'
-    nlp_base = spacy.load("es_core_news_sm")
-    print("✅ Modelo base spaCy 'es_core_news_sm' (para entidades) cargado.")
-except IOError:
-    print("❌ Error: Modelo base 'es_core_news_sm' no encontrado.")
-    print("   Asegúrate de que 'setup.sh' descargó el modelo.")
-    nlp_base = None # No podremos extraer entidades si falla
-
-
 # --- Detección de Intenciones (Usando Modelo) ---
+@trazado("detectar_intencion_modelo")
 def detectar_intencion_modelo(texto):
     """
     Usa el modelo spaCy textcat entrenado para predecir la intención.
     """
     if not modelo_cargado or not nlp_intent:
-        print("Advertencia: Modelo de intenciones no cargado. Usando fallback 'desconocido'.")
+        registrar("modelo_intencion_no_cargado", nivel="warning", modulo="nlp")
         return "desconocido" # Fallback si el modelo no cargó
 
+    # Predecir con el modelo cargado
+    return _intencion_de_doc(nlp_intent(_limpiar_texto(texto)))
+
+
+def _limpiar_texto(texto):
     # Preprocesar texto (igual que en el entrenamiento)
     texto_limpio = str(texto).lower().strip()
-    texto_limpio = re.sub(r"\s+", " ", texto_limpio)
+    return re.sub(r"\s+", " ", texto_limpio)
 
-    # Predecir con el modelo cargado
-    doc = nlp_intent(texto_limpio)
+
+def _intencion_de_doc(doc):
     intencion_predicha = max(doc.cats, key=doc.cats.get)
     score = doc.cats[intencion_predicha]
-    print(f"  Predicción de Intención: {intencion_predicha} (Score: {score:.2f})")
-
+    registrar("intencion_predicha", modulo="nlp", intencion=intencion_predicha, score=round(score, 3))
     return intencion_predicha
 
 
 # --- Extractor de Entidades (CORREGIDO: Nomenclatura Mayúscula) ---
+@trazado("extraer_entidades")
 def extraer_entidades(texto):
     """
     Extrae entidades como DNI, Fecha, Hora y Medico.
     Se asegura que las claves de las entidades sigan la convención (ej. 'Fecha', 'Hora') 
     para ser usadas en el flujo de chatbot.
+    Son reglas y el directorio de médicos: no hace falta un pase de spaCy.
     """
-    if not nlp_base:
-        print("Advertencia: Modelo base no cargado. No se pueden extraer entidades.")
-        return {} # No se puede procesar si spaCy base no cargó
-
-    doc = nlp_base(texto) # Usa el modelo base pre-entrenado
     entidades = {}
 
-    # 1. Extraer Médico (NER Persona)
-    for ent in doc.ents:
-        if ent.label_ == "PER":
-            # Verificamos si la persona es un médico conocido
-            if any(medico in ent.text for medico in ["Vega", "Perez", "Morales", "Castro", "Paredes"]):
-                entidades["Medico"] = ent.text 
-                break
+    # 1. Extraer Médico (directorio: acepta tildes y errores de transcripción, devuelve el nombre canónico)
+    medico = medico_en_texto(texto)
+    if medico:
+        entidades["Medico"] = medico
 
     # 2. Extracer DNI (Regex)
     match_dni = re.search(r'\b(\d{8})\b', texto)
     if match_dni:
         entidades["DNI"] = match_dni.group(1) 
 
-    # 3. Extraer Fecha (Reglas simples)
-    texto_lower = texto.lower()
-    if "mañana" in texto_lower:
-        entidades["Fecha"] = (datetime.now() + timedelta(days=1)).strftime("%Y-%m-%d")
-    elif "hoy" in texto_lower:
-        entidades["Fecha"] = datetime.now().strftime("%Y-%m-%d")
-    else:
-        # Regex simple para AAAA-MM-DD
-        match_fecha_iso = re.search(r'(\d{4}-\d{2}-\d{2})', texto)
-        if match_fecha_iso:
-             entidades["Fecha"] = match_fecha_iso.group(1)
-
-    # 4. Extraer Hora (Reglas simples)
-    match_hora = re.search(r'(\d{1,2}:\d{2})\s*(am|pm)?', texto_lower)
-    if match_hora:
-        hora_str = match_hora.group(1)
-        partes = hora_str.split(':')
-        if len(partes) == 2:
-             entidades["Hora"] = f"{int(partes[0]):02d}:{int(partes[1]):02d}"
-    elif " a las " in texto_lower:
-        partes = texto_lower.split(" a las ")
-        if len(partes) > 1:
-            hora_potencial = partes[1].split()[0].replace(':','').replace('h','') 
-            if hora_potencial.isdigit():
-                 hora_num = int(hora_potencial)
-                 if 0 <= hora_num <= 23: 
-                      entidades["Hora"] = f"{hora_num:02d}:00"
-
+    # 3-4. Extraer Fecha y Hora (gramática de gramatica_fechas.py: "el próximo martes",
+    # "15 de noviembre", "a las cuatro y media de la tarde"...; en caché por frase y día)
+    entidades.update(resolver_fecha_hora(texto))
 
     return entidades
 
@@ -121,3 +85,19 @@ def procesar_texto(texto):
     entidades = extraer_entidades(texto)
 
     return intencion, entidades
+
+
+# --- Procesamiento por Lote (API JSON) ---
+TAMANO_LOTE_NLP = 64
+
+@trazado("procesar_textos")
+def procesar_textos(textos):
+    """Como procesar_texto para una lista, con nlp.pipe (un pase por lote en cada modelo)."""
+    textos = [str(t) for t in textos]
+    if modelo_cargado and nlp_intent:
+        intenciones = [_intencion_de_doc(doc) for doc in
+                       nlp_intent.pipe((_limpiar_texto(t) for t in textos), batch_size=TAMANO_LOTE_NLP)]
+    else:
+        intenciones = [detectar_intencion_modelo(t) for t in textos]
+    entidades = [extraer_entidades(t) for t in textos]
+    return list(zip(intenciones, entidades))
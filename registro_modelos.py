@@ -0,0 +1,155 @@
+# ============================================================
+# 📦 Registro del Modelo No-Show (artefacto versionado + recarga en caliente)
+# ============================================================
+import hashlib
+import json
+import os
+import threading
+import time
+
+import joblib
+
+# --- Configuración ---
+CARPETA_MODELOS_NOSHOW = "modelos_noshow"
+ARCHIVO_PUNTERO = "actual.json"  # Manifiesto de la versión en servicio
+INTERVALO_VIGILANCIA_S = 5.0
+# Artefactos antiguos (dos archivos) como respaldo si aún no hay Pipeline
+ARCHIVO_MODELO_LEGACY = "modelo_noshow.joblib"
+ARCHIVO_PREPROCESADOR_LEGACY = "preprocesador_noshow.joblib"
+
+
+def calcular_sha256(ruta, tam_bloque=1 << 20):
+    """Hash SHA-256 de un archivo, leído por bloques."""
+    h = hashlib.sha256()
+    with open(ruta, "rb") as f:
+        for bloque in iter(lambda: f.read(tam_bloque), b""):
+            h.update(bloque)
+    return h.hexdigest()
+
+
+def escribir_json_atomico(ruta, datos):
+    """Escribe un JSON en un temporal y lo renombra (os.replace es atómico)."""
+    tmp = f"{ruta}.tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(datos, f, ensure_ascii=False, indent=2)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, ruta)
+
+
+class RegistroModeloNoShow:
+    """
+    Mantiene el Pipeline No-Show en servicio y lo reemplaza en caliente
+    cuando 'entrenar_noshow.py' publica una versión nueva.
+
+    El cambio es atómico: 'obtener()' devuelve una tupla (pipeline, manifiesto)
+    y una petición en curso sigue usando la versión que leyó, aunque entretanto
+    se publique otra. No hace falta reiniciar la app (TTS, Whisper...).
+    """
+
+    def __init__(self, carpeta=CARPETA_MODELOS_NOSHOW, intervalo=INTERVALO_VIGILANCIA_S):
+        self.carpeta = carpeta
+        self.ruta_puntero = os.path.join(carpeta, ARCHIVO_PUNTERO)
+        self.intervalo = intervalo
+        self._lock = threading.Lock()
+        self._actual = (None, None)  # (pipeline, manifiesto)
+        self._mtime_puntero = None
+        self._pid_vigilante = None
+        if hasattr(os, "register_at_fork"):
+            os.register_at_fork(after_in_child=self._tras_fork)
+
+    def _tras_fork(self):
+        self._lock = threading.Lock()
+
+    # --- Carga ---
+    def _leer_puntero(self):
+        try:
+            mtime = os.path.getmtime(self.ruta_puntero)
+            with open(self.ruta_puntero, encoding="utf-8") as f:
+                return json.load(f), mtime
+        except (FileNotFoundError, json.JSONDecodeError):
+            return None, None
+
+    def _cargar_version(self, manifiesto):
+        """Verifica el hash del artefacto y lo carga con mmap (sin copiar arrays a RAM)."""
+        ruta = os.path.join(self.carpeta, manifiesto["archivo"])
+        sha = calcular_sha256(ruta)
+        if sha != manifiesto.get("sha256"):
+            raise ValueError(f"Hash no coincide para {ruta} (esperado {manifiesto.get('sha256')}, obtenido {sha})")
+        return joblib.load(ruta, mmap_mode="r")
+
+    def _cargar_legacy(self):
+        """Envuelve los dos joblib antiguos en un Pipeline ya ajustado."""
+        from sklearn.pipeline import Pipeline
+        preprocesador = joblib.load(ARCHIVO_PREPROCESADOR_LEGACY)
+        modelo = joblib.load(ARCHIVO_MODELO_LEGACY)
+        pipeline = Pipeline([("preprocesador", preprocesador), ("modelo", modelo)])
+        return pipeline, {"version": "legacy", "archivo": ARCHIVO_MODELO_LEGACY}
+
+    def cargar(self):
+        """Carga la versión publicada (o la legacy). Devuelve True si hay modelo."""
+        manifiesto, mtime = self._leer_puntero()
+        try:
+            if manifiesto is not None:
+                pipeline = self._cargar_version(manifiesto)
+                print(f"✅ registro_modelos: Pipeline No-Show {manifiesto['version']} cargado (AUC={manifiesto.get('auc')}).")
+            else:
+                pipeline, manifiesto = self._cargar_legacy()
+                print("✅ registro_modelos: Modelo No-Show legacy (modelo + preprocesador) cargado.")
+        except FileNotFoundError:
+            print("❌ ADVERTENCIA: No se encontró ningún artefacto del modelo No-Show.")
+            return False
+        except Exception as e:
+            print(f"❌ registro_modelos: Error al cargar modelo No-Show: {e}")
+            return False
+
+        with self._lock:
+            self._actual = (pipeline, manifiesto)
+            self._mtime_puntero = mtime
+        return True
+
+    def recargar_si_cambio(self):
+        """Si el puntero cambió, carga la nueva versión y la intercambia. Devuelve True si cambió."""
+        manifiesto, mtime = self._leer_puntero()
+        if manifiesto is None or mtime == self._mtime_puntero:
+            return False
+        if manifiesto.get("version") == (self._actual[1] or {}).get("version"):
+            self._mtime_puntero = mtime
+            return False
+        try:
+            pipeline = self._cargar_version(manifiesto)
+        except Exception as e:
+            # Se mantiene la versión en servicio; se reintentará en el siguiente ciclo
+            print(f"❌ registro_modelos: Versión {manifiesto.get('version')} inválida, se mantiene la actual: {e}")
+            return False
+        with self._lock:
+            self._actual = (pipeline, manifiesto)
+            self._mtime_puntero = mtime
+        print(f"🔄 registro_modelos: Modelo No-Show actualizado a {manifiesto['version']} (AUC={manifiesto.get('auc')}).")
+        return True
+
+    # --- Vigilancia ---
+    def _vigilar(self):
+        while True:
+            time.sleep(self.intervalo)
+            try:
+                self.recargar_si_cambio()
+            except Exception as e:
+                print(f"❌ registro_modelos: Error vigilando nuevas versiones: {e}")
+
+    def _asegurar_vigilante(self):
+        # Se arranca por proceso: un hilo no sobrevive a un fork
+        pid = os.getpid()
+        if self._pid_vigilante == pid:
+            return
+        with self._lock:
+            if self._pid_vigilante == pid:
+                return
+            hilo = threading.Thread(target=self._vigilar, name="vigilante-noshow", daemon=True)
+            hilo.start()
+            self._pid_vigilante = pid
+
+    def obtener(self):
+        """Devuelve (pipeline, manifiesto) de la versión en servicio."""
+        self._asegurar_vigilante()
+        return self._actual
@@ -0,0 +1,186 @@
+# ============================================================
+# 🍴 Servidor Multi-Worker (precarga + fork)
+# ============================================================
+# El proceso maestro importa app.py una sola vez (TTS, Whisper, los dos
+# pipelines spaCy y el Pipeline No-Show), congela el GC y hace fork de N
+# workers que atienden el mismo puerto. Las páginas de los modelos se
+# comparten copy-on-write: cada worker añadido solo cuesta su memoria privada.
+#
+#   python servidor.py --workers 4
+#   python servidor.py --workers 4 --puertos-separados   # 7860, 7861, ...
+#
+# ⚠️ La cola y el estado de Gradio viven en cada proceso: la interfaz necesita
+# que todas las peticiones de un navegador lleguen al mismo worker. Con un solo
+# puerto el kernel reparte conexiones, lo que sirve para /metrics y la API
+# JSON; para la interfaz usar --puertos-separados detrás de un proxy con
+# sesiones pegajosas (p. ej. nginx ip_hash). El estado de las conversaciones
+# se comparte entre workers con SESIONES_SQLITE.
+import argparse
+import gc
+import os
+import signal
+import socket
+import sys
+import time
+
+# Sin GC durante la carga: los objetos de los modelos se congelan de una vez
+gc.disable()
+
+INTERVALO_REINICIO_S = 1.0
+
+
+def leer_memoria(pid):
+    """Rss, Pss y memoria privada (MB) de /proc/<pid>/smaps_rollup (Linux)."""
+    campos = {}
+    try:
+        with open(f"/proc/{pid}/smaps_rollup") as f:
+            for linea in f:
+                partes = linea.split()
+                if len(partes) >= 2 and partes[0].endswith(":") and partes[1].isdigit():
+                    campos[partes[0][:-1]] = int(partes[1]) / 1024 # kB -> MB
+    except OSError:
+        return None
+    return {
+        "rss_mb": round(campos.get("Rss", 0), 1),
+        "pss_mb": round(campos.get("Pss", 0), 1),
+        "privada_mb": round(campos.get("Private_Clean", 0) + campos.get("Private_Dirty", 0), 1),
+        "compartida_mb": round(campos.get("Shared_Clean", 0) + campos.get("Shared_Dirty", 0), 1),
+    }
+
+
+def informe_memoria(pid_maestro, workers):
+    """Imprime la memoria del maestro y de cada worker, y el coste medio de un worker añadido."""
+    print(f"\n🧠 Memoria ({len(workers)} workers)")
+    print(f"{'proceso':<16}{'RSS':>10}{'PSS':>10}{'privada':>10}{'compartida':>12}  (MB)")
+    filas = [("maestro", pid_maestro)] + [(f"worker {i}", pid) for i, pid in sorted(workers.items())]
+    privadas, pss_total = [], 0.0
+    for nombre, pid in filas:
+        m = leer_memoria(pid)
+        if m is None:
+            continue
+        pss_total += m["pss_mb"]
+        if nombre != "maestro":
+            privadas.append(m["privada_mb"])
+        print(f"{nombre + f' ({pid})':<16}{m['rss_mb']:>10.1f}{m['pss_mb']:>10.1f}{m['privada_mb']:>10.1f}{m['compartida_mb']:>12.1f}")
+    if privadas:
+        print(f"➕ Por worker añadido ≈ {sum(privadas) / len(privadas):.1f} MB privados · PSS total {pss_total:.1f} MB")
+
+
+def crear_socket(host, puerto):
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind((host, puerto))
+    sock.listen(2048)
+    sock.set_inheritable(True)
+    return sock
+
+
+def ejecutar_worker(asgi, sock, indice):
+    """Proceso hijo: uvicorn sobre el socket heredado."""
+    import uvicorn
+    gc.enable()
+    # Los handlers del maestro no aplican aquí: uvicorn instala los suyos
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+    signal.signal(signal.SIGINT, signal.SIG_DFL)
+    signal.signal(signal.SIGUSR1, signal.SIG_DFL)
+    os.environ["WORKER_INDICE"] = str(indice)
+    # Hilos de fondo solo en los workers: el maestro no sondea Sheets (N+1 sondeos) ni hace fork con hilos vivos
+    sincronizacion = sys.modules.get("sincronizacion")
+    if sincronizacion is not None:
+        sincronizacion.iniciar_sondeo()
+    servidor = uvicorn.Server(uvicorn.Config(asgi, log_level="warning", timeout_keep_alive=30))
+    servidor.run(sockets=[sock])
+    # El worker sale con os._exit (sin atexit): la instantánea del espejo se guarda aquí
+    if sincronizacion is not None:
+        sincronizacion.guardar_instantanea()
+
+
+def lanzar_worker(asgi, sockets, indice):
+    pid = os.fork()
+    if pid == 0:
+        codigo = 0
+        try:
+            ejecutar_worker(asgi, sockets[indice % len(sockets)], indice)
+        except Exception as e:
+            print(f"❌ servidor: worker {indice} terminó con error: {e}")
+            codigo = 1
+        finally:
+            os._exit(codigo)
+    return pid
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Sirve la app con N workers que comparten los modelos (fork).")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 2)
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--puerto", type=int, default=7860)
+    parser.add_argument("--puertos-separados", action="store_true",
+                        help="Un puerto por worker (puerto, puerto+1, ...) para un proxy con sesiones pegajosas.")
+    parser.add_argument("--informe-s", type=float, default=30.0,
+                        help="Segundos tras el arranque para imprimir la memoria (también con SIGUSR1).")
+    args = parser.parse_args()
+
+    # 1. Precarga: todo lo que se importa aquí queda compartido
+    inicio = time.perf_counter()
+    os.environ["SERVIDOR_PRECARGA"] = "1" # app.py carga el espejo sin arrancar su sondeo (ver ejecutar_worker)
+    import app
+    asgi = app.crear_servidor()
+    gc.collect()
+    gc.freeze() # Objetos actuales fuera del GC: recorrerlos no ensucia sus páginas en los hijos
+    pid_maestro = os.getpid()
+    print(f"✅ servidor: modelos cargados en {time.perf_counter() - inicio:.1f}s "
+          f"({gc.get_freeze_count()} objetos congelados)")
+    informe_memoria(pid_maestro, {})
+
+    # 2. Socket(s) creados antes del fork
+    if args.puertos_separados:
+        sockets = [crear_socket(args.host, args.puerto + i) for i in range(args.workers)]
+    else:
+        sockets = [crear_socket(args.host, args.puerto)]
+    puertos = sorted({s.getsockname()[1] for s in sockets})
+    print(f"🍴 servidor: {args.workers} workers en {args.host}:{','.join(map(str, puertos))}")
+
+    # 3. Workers
+    workers = {i: lanzar_worker(asgi, sockets, i) for i in range(args.workers)}
+    terminando = False
+
+    def detener(signum, frame):
+        nonlocal terminando
+        terminando = True
+        for pid in workers.values():
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+    signal.signal(signal.SIGTERM, detener)
+    signal.signal(signal.SIGINT, detener)
+    signal.signal(signal.SIGUSR1, lambda signum, frame: informe_memoria(pid_maestro, workers))
+    if args.informe_s > 0:
+        signal.signal(signal.SIGALRM, lambda signum, frame: informe_memoria(pid_maestro, workers))
+        signal.setitimer(signal.ITIMER_REAL, args.informe_s)
+
+    # 4. Supervisión: reinicia los workers que mueran (se vuelve a hacer fork del maestro precargado)
+    while workers:
+        try:
+            pid, estado = os.wait()
+        except ChildProcessError:
+            break
+        except InterruptedError:
+            continue
+        indice = next((i for i, p in workers.items() if p == pid), None)
+        if indice is None:
+            continue
+        if terminando:
+            del workers[indice]
+            continue
+        print(f"⚠️ servidor: worker {indice} (pid {pid}) terminó con estado {estado}; reiniciando...")
+        time.sleep(INTERVALO_REINICIO_S)
+        workers[indice] = lanzar_worker(asgi, sockets, indice)
+
+    print("👋 servidor: workers detenidos.")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
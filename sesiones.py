@@ -0,0 +1,212 @@
+# ============================================================
+# 🗂️ Almacén de Sesiones de Conversación (servidor)
+# ============================================================
+# El estado de cada conversación vive en el servidor, indexado por un id de
+# sesión. Gradio solo guarda ese id en gr.State. Las sesiones caducan por
+# inactividad (TTL deslizante), hay un máximo en memoria (LRU) y, opcionalmente,
+# se persisten en SQLite para sobrevivir reinicios.
+import json
+import os
+import secrets
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+# --- Configuración (sobrescribible por variables de entorno) ---
+TTL_SESION_S = int(os.environ.get("SESIONES_TTL_S", 30 * 60))
+MAX_SESIONES = int(os.environ.get("SESIONES_MAX", 10_000))
+RUTA_SQLITE_SESIONES = os.environ.get("SESIONES_SQLITE")  # Ej: "data/sesiones.db" (None = solo memoria)
+PURGA_SQLITE_S = int(os.environ.get("SESIONES_PURGA_S", 60))  # Cada cuánto se borran de SQLite las caducadas
+
+_CLAVES_CONTROL = ("intent", "campo_preguntado")
+
+
+class EstadoConversacion:
+    """Estado compacto de una conversación: intención, slots llenos, campo pendiente y tiempos."""
+    __slots__ = ("intent", "slots", "campo_preguntado", "creado", "actualizado")
+
+    def __init__(self, intent=None, slots=(), campo_preguntado=None, creado=None, actualizado=None):
+        ahora = time.time()
+        self.intent = intent
+        self.slots = tuple(slots)  # ((campo, valor), ...) ocupa menos que un dict
+        self.campo_preguntado = campo_preguntado
+        self.creado = creado or ahora
+        self.actualizado = actualizado or ahora
+
+    @classmethod
+    def desde_dict(cls, estado, creado=None):
+        """Construye el estado desde el dict que usa responder_chatbot."""
+        estado = estado or {}
+        slots = tuple((k, v) for k, v in estado.items() if k not in _CLAVES_CONTROL and v is not None)
+        return cls(estado.get("intent"), slots, estado.get("campo_preguntado"), creado=creado)
+
+    def a_dict(self):
+        """Dict mutable para responder_chatbot (que lo modifica libremente)."""
+        estado = dict(self.slots)
+        if self.intent:
+            estado["intent"] = self.intent
+        if self.campo_preguntado:
+            estado["campo_preguntado"] = self.campo_preguntado
+        return estado
+
+    def resumen(self):
+        """Descripción sin datos personales (solo nombres de campos)."""
+        return {
+            "intent": self.intent,
+            "campo_preguntado": self.campo_preguntado,
+            "slots": [k for k, _ in self.slots],
+            "creado": self.creado,
+            "actualizado": self.actualizado,
+        }
+
+    def __repr__(self):
+        campos = ",".join(k for k, _ in self.slots)
+        return f"EstadoConversacion(intent={self.intent}, pendiente={self.campo_preguntado}, slots=[{campos}])"
+
+
+class AlmacenSesiones:
+    """
+    Sesiones por id con TTL deslizante y límite LRU. Con SQLite, cada cambio se
+    escribe en disco y las sesiones desalojadas por el límite se recuperan de
+    allí al volver a usarse (en vez de perderse).
+    """
+
+    def __init__(self, ttl_s=TTL_SESION_S, max_sesiones=MAX_SESIONES, ruta_sqlite=RUTA_SQLITE_SESIONES):
+        self.ttl_s = ttl_s
+        self.max_sesiones = max_sesiones
+        self._sesiones = OrderedDict()  # id -> EstadoConversacion, de menos a más reciente
+        self._lock = threading.Lock()
+        self._ruta_sqlite = ruta_sqlite
+        self._db = None
+        self._ultima_purga_db = 0.0
+        if ruta_sqlite:
+            directorio = os.path.dirname(ruta_sqlite)
+            if directorio:
+                os.makedirs(directorio, exist_ok=True)
+            self._db = self._conectar()
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS sesiones (id TEXT PRIMARY KEY, datos TEXT NOT NULL, actualizado REAL NOT NULL)"
+            )
+            self._db.execute("CREATE INDEX IF NOT EXISTS sesiones_actualizado ON sesiones (actualizado)")
+            self._db.commit()
+            print(f"✅ sesiones: Persistencia SQLite activa en {ruta_sqlite}")
+        # Con servidor.py (preload + fork) la conexión SQLite y el lock no pueden
+        # heredarse: cada worker abre los suyos y comparte las sesiones vía el archivo
+        if hasattr(os, "register_at_fork"):
+            os.register_at_fork(after_in_child=self._tras_fork)
+
+    # --- SQLite ---
+    def _conectar(self):
+        db = sqlite3.connect(self._ruta_sqlite, check_same_thread=False, timeout=10)
+        db.execute("PRAGMA journal_mode=WAL")
+        return db
+
+    def _tras_fork(self):
+        self._lock = threading.Lock()
+        if self._ruta_sqlite:
+            self._db = self._conectar()
+
+    def _db_guardar(self, id_sesion, estado):
+        datos = json.dumps([estado.intent, estado.slots, estado.campo_preguntado, estado.creado], ensure_ascii=False)
+        self._db.execute(
+            "INSERT OR REPLACE INTO sesiones (id, datos, actualizado) VALUES (?, ?, ?)",
+            (id_sesion, datos, estado.actualizado),
+        )
+        self._db.commit()
+
+    def _db_cargar(self, id_sesion):
+        fila = self._db.execute("SELECT datos, actualizado FROM sesiones WHERE id = ?", (id_sesion,)).fetchone()
+        if fila is None:
+            return None
+        intent, slots, campo, creado = json.loads(fila[0])
+        return EstadoConversacion(intent, (tuple(par) for par in slots), campo, creado, fila[1])
+
+    def _db_eliminar(self, id_sesion):
+        self._db.execute("DELETE FROM sesiones WHERE id = ?", (id_sesion,))
+        self._db.commit()
+
+    def _db_purgar(self, ahora):
+        """Borra las caducadas que ya no están en memoria (desalojadas por el LRU o de antes de un reinicio)."""
+        self._ultima_purga_db = ahora
+        caducadas = self._db.execute("SELECT id FROM sesiones WHERE actualizado < ?", (ahora - self.ttl_s,)).fetchall()
+        # En memoria el TTL se renueva al leer sin escribir en disco: esas siguen vivas
+        borrar = [(id_sesion,) for (id_sesion,) in caducadas if id_sesion not in self._sesiones]
+        if borrar:
+            self._db.executemany("DELETE FROM sesiones WHERE id = ?", borrar)
+            self._db.commit()
+
+    # --- Mantenimiento (con el lock tomado) ---
+    def _expirada(self, estado, ahora):
+        return ahora - estado.actualizado > self.ttl_s
+
+    def _purgar(self, ahora):
+        # El OrderedDict está ordenado por último uso: basta con mirar el principio
+        while self._sesiones:
+            id_sesion, estado = next(iter(self._sesiones.items()))
+            if not self._expirada(estado, ahora):
+                break
+            del self._sesiones[id_sesion]
+            if self._db is not None:
+                self._db_eliminar(id_sesion)
+        while len(self._sesiones) > self.max_sesiones:
+            self._sesiones.popitem(last=False)  # Con SQLite sigue en disco
+        if self._db is not None and ahora - self._ultima_purga_db >= PURGA_SQLITE_S:
+            self._db_purgar(ahora)
+
+    # --- API ---
+    def nueva_sesion(self):
+        return secrets.token_urlsafe(12)
+
+    def obtener(self, id_sesion):
+        """Dict de estado de la sesión ({} si no existe o caducó). Renueva su TTL."""
+        if not id_sesion:
+            return {}
+        ahora = time.time()
+        with self._lock:
+            self._purgar(ahora)
+            estado = self._sesiones.get(id_sesion)
+            if estado is None and self._db is not None:
+                estado = self._db_cargar(id_sesion)
+                if estado is not None and self._expirada(estado, ahora):
+                    self._db_eliminar(id_sesion)
+                    estado = None
+            if estado is None:
+                return {}
+            estado.actualizado = ahora
+            self._sesiones[id_sesion] = estado
+            self._sesiones.move_to_end(id_sesion)
+            return estado.a_dict()
+
+    def guardar(self, id_sesion, estado_dict):
+        """Guarda el estado devuelto por responder_chatbot. Un estado vacío cierra la sesión."""
+        if not id_sesion:
+            return
+        ahora = time.time()
+        with self._lock:
+            anterior = self._sesiones.pop(id_sesion, None)
+            if not estado_dict:
+                if self._db is not None:
+                    self._db_eliminar(id_sesion)
+                return
+            estado = EstadoConversacion.desde_dict(estado_dict, creado=anterior.creado if anterior else None)
+            estado.actualizado = ahora
+            self._sesiones[id_sesion] = estado
+            if self._db is not None:
+                self._db_guardar(id_sesion, estado)
+            self._purgar(ahora)
+
+    def eliminar(self, id_sesion):
+        with self._lock:
+            self._sesiones.pop(id_sesion, None)
+            if self._db is not None:
+                self._db_eliminar(id_sesion)
+
+    def listar(self):
+        """Resumen de las sesiones en memoria (sin valores de los slots)."""
+        with self._lock:
+            self._purgar(time.time())
+            return [{"id": id_sesion, **estado.resumen()} for id_sesion, estado in reversed(self._sesiones.items())]
+
+    def __len__(self):
+        return len(self._sesiones)
@@ -0,0 +1,401 @@
+# ============================================================
+# 🏥 Sedes (shards): un documento de Google Sheets por sede
+# ============================================================
+# Cada sede tiene su propio documento (Pacientes + Citas), así ninguna llega
+# al límite de celdas ni a la cuota de una sola hoja. Las escrituras van a una
+# única sede, elegida por el médico (o por la sede indicada). Un índice global
+# DNI -> sedes evita buscar al paciente en todas; las consultas que cruzan
+# sedes ("todas las citas de este DNI") se lanzan en paralelo y se unen.
+#
+# Sin data/sedes.json hay una sola sede ("principal", las hojas de
+# flujo_agendamiento) y todo se delega directamente, como antes. Ejemplo:
+#   {"por_defecto": "principal",
+#    "sedes": {"principal": {"medicos": ["Dr.Vega", "Dr.Perez", "Dra.Morales"]},
+#              "norte": {"documento": "Citas Sede Norte", "medicos": ["Dr.Castro", "Dra.Paredes"]}}}
+#
+#   python shards.py --reconstruir-indice   # Relee los Pacientes de todas las sedes
+import argparse
+import contextvars
+import json
+import os
+import re
+import sqlite3
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import directorio_medicos
+import flujo_agendamiento as flujo
+from archivo_citas import ENCABEZADOS_CITAS
+from trazas import HojaTrazada, registrar, trazado
+
+RUTA_CONFIG_SEDES = os.environ.get("SEDES_CONFIG", "data/sedes.json")
+RUTA_SQLITE_INDICE = os.environ.get("INDICE_DNI_SQLITE") # Ej: "data/indice_dni.db" (None = solo memoria)
+HILOS_SEDES = int(os.environ.get("HILOS_SEDES", 8))
+SEDE_PRINCIPAL = "principal"
+ENCABEZADOS_PACIENTES = ["ID_Paciente", "Nombre", "DNI", "Telefono", "Email"]
+
+# Pool propio: las consultas por sede se lanzan desde hilos de EJECUTOR_IO y
+# esperarlas en ese mismo pool podría agotarlo
+_EJECUTOR_SEDES = ThreadPoolExecutor(max_workers=HILOS_SEDES, thread_name_prefix="sede")
+_ID_PACIENTE_MENSAJE = re.compile(r"para el paciente (\w+)")
+
+
+class Sede:
+    """Una sede: sus hojas (None = las de flujo_agendamiento) y sus médicos."""
+
+    def __init__(self, nombre, medicos=(), hojas=None):
+        self.nombre = nombre
+        self.medicos = set(medicos)
+        self.hojas = hojas
+
+    @property
+    def pacientes(self):
+        return flujo._hojas(self.hojas)[0]
+
+    def __repr__(self):
+        return f"Sede({self.nombre}, {len(self.medicos)} médicos)"
+
+
+# --- Índice global de DNI ---
+class IndiceDNI:
+    """
+    DNI -> {sede: ID_Paciente}. En memoria o, con INDICE_DNI_SQLITE, en un
+    archivo compartido por los workers de servidor.py.
+    """
+
+    def __init__(self, ruta_sqlite=RUTA_SQLITE_INDICE):
+        self._dnis = {}
+        self._lock = threading.Lock()
+        self._ruta_sqlite = ruta_sqlite
+        self._db = None
+        if ruta_sqlite:
+            directorio = os.path.dirname(ruta_sqlite)
+            if directorio:
+                os.makedirs(directorio, exist_ok=True)
+            self._db = self._conectar()
+            self._db.execute("CREATE TABLE IF NOT EXISTS indice_dni "
+                             "(dni TEXT NOT NULL, sede TEXT NOT NULL, id_paciente TEXT NOT NULL, PRIMARY KEY (dni, sede))")
+            self._db.commit()
+        if hasattr(os, "register_at_fork"):
+            os.register_at_fork(after_in_child=self._tras_fork)
+
+    def _conectar(self):
+        db = sqlite3.connect(self._ruta_sqlite, check_same_thread=False, timeout=10)
+        db.execute("PRAGMA journal_mode=WAL")
+        return db
+
+    def _tras_fork(self):
+        self._lock = threading.Lock()
+        if self._ruta_sqlite:
+            self._db = self._conectar()
+
+    def vacio(self):
+        with self._lock:
+            if self._db is not None:
+                return self._db.execute("SELECT 1 FROM indice_dni LIMIT 1").fetchone() is None
+            return not self._dnis
+
+    def sedes(self, dni):
+        """{sede: ID_Paciente} del DNI ({} si no está en ninguna)."""
+        dni = str(dni).strip()
+        with self._lock:
+            if self._db is not None:
+                return dict(self._db.execute("SELECT sede, id_paciente FROM indice_dni WHERE dni = ?", (dni,)))
+            return dict(self._dnis.get(dni, {}))
+
+    def anotar(self, dni, sede, id_paciente):
+        dni = str(dni).strip()
+        with self._lock:
+            if self._db is not None:
+                self._db.execute("INSERT OR REPLACE INTO indice_dni (dni, sede, id_paciente) VALUES (?, ?, ?)",
+                                 (dni, sede, id_paciente))
+                self._db.commit()
+            else:
+                self._dnis.setdefault(dni, {})[sede] = id_paciente
+
+    def reemplazar(self, entradas):
+        """Sustituye el índice por [(dni, sede, id_paciente), ...]."""
+        with self._lock:
+            if self._db is not None:
+                with self._db:
+                    self._db.execute("DELETE FROM indice_dni")
+                    self._db.executemany("INSERT OR REPLACE INTO indice_dni (dni, sede, id_paciente) VALUES (?, ?, ?)",
+                                         entradas)
+            else:
+                self._dnis = {}
+                for dni, sede, id_paciente in entradas:
+                    self._dnis.setdefault(dni, {})[sede] = id_paciente
+
+
+# --- Mapa de sedes ---
+class MapaSedes:
+    def __init__(self, sedes, por_defecto=SEDE_PRINCIPAL, indice=None):
+        self.sedes = {sede.nombre: sede for sede in sedes}
+        self.por_defecto = por_defecto
+        self.indice = indice or IndiceDNI()
+        self._sede_de_medico = {medico: sede.nombre for sede in sedes for medico in sede.medicos}
+        self._indice_listo = threading.Event()
+        self._lock_indice = threading.Lock()
+
+    @property
+    def una_sola(self):
+        return len(self.sedes) == 1
+
+    def sede(self, nombre=None, medico=None):
+        """Sede indicada, la del médico o la por defecto."""
+        if nombre:
+            if nombre not in self.sedes:
+                raise KeyError(f"Sede desconocida: {nombre}")
+            return self.sedes[nombre]
+        # El médico puede llegar sin normalizar ("Dr. Perez"): se resuelve con el directorio
+        sede = self._sede_de_medico.get(medico) or self._sede_de_medico.get(directorio_medicos.buscar(medico or ""))
+        return self.sedes[sede or self.por_defecto]
+
+    # --- Índice ---
+    def reconstruir_indice(self):
+        """Lee los Pacientes de todas las sedes en paralelo (una lectura por sede) y rehace el índice."""
+        filas_por_sede = _en_paralelo({nombre: (lambda s=sede: s.pacientes.get_all_values() if s.pacientes else [])
+                                       for nombre, sede in self.sedes.items()})
+        entradas = []
+        for nombre, filas in filas_por_sede.items():
+            if isinstance(filas, Exception):
+                raise filas
+            entradas.extend((str(f[2]).strip(), nombre, f[0]) for f in filas[1:] if len(f) > 2 and f[0] and f[2])
+        self.indice.reemplazar(entradas)
+        self._indice_listo.set()
+        registrar("indice_dni_reconstruido", modulo="shards", sedes=len(self.sedes), entradas=len(entradas))
+        return len(entradas)
+
+    def sedes_de_dni(self, dni):
+        """
+        {sede: ID_Paciente}; la primera vez construye el índice si aún no existe.
+        Un DNI fuera del índice (p. ej. dado de alta fuera de la app) se busca
+        solo en la sede por defecto, nunca en todas.
+        """
+        if not self._indice_listo.is_set():
+            with self._lock_indice:
+                if not self._indice_listo.is_set():
+                    if self.indice.vacio():
+                        self.reconstruir_indice()
+                    self._indice_listo.set()
+        return self.indice.sedes(dni) or {self.por_defecto: None}
+
+
+def _abrir_sede(nombre, config):
+    """Hojas de una sede adicional: su documento en Google Sheets, u hojas vacías en memoria en offline."""
+    if flujo.SHEETS_OFFLINE:
+        from hoja_memoria import HojaMemoria
+        return (HojaTrazada(HojaMemoria([ENCABEZADOS_PACIENTES], "Pacientes")),
+                HojaTrazada(HojaMemoria([ENCABEZADOS_CITAS], "Citas")))
+    cliente = getattr(flujo, "cliente", None)
+    if cliente is None:
+        registrar("sede_sin_conexion", nivel="error", modulo="shards", sede=nombre)
+        return (None, None)
+    documento = cliente.open(config["documento"])
+    citas = HojaTrazada(documento.worksheet("Citas"))
+    flujo.migrar_encabezado_citas(citas)
+    return (HojaTrazada(documento.worksheet("Pacientes")), citas)
+
+
+def cargar_mapa(ruta=RUTA_CONFIG_SEDES):
+    """MapaSedes desde el JSON de configuración (o una sola sede si no existe)."""
+    try:
+        with open(ruta, encoding="utf-8") as f:
+            config = json.load(f)
+    except FileNotFoundError:
+        return MapaSedes([Sede(SEDE_PRINCIPAL, flujo.obtener_medicos())])
+    por_defecto = config.get("por_defecto", SEDE_PRINCIPAL)
+    sedes = []
+    for nombre, datos in config["sedes"].items():
+        # La sede sin documento (o con el de flujo_agendamiento) usa la conexión ya abierta
+        principal = datos.get("documento") in (None, flujo.DOCUMENTO_SHEETS)
+        sedes.append(Sede(nombre, datos.get("medicos", ()), None if principal else _abrir_sede(nombre, datos)))
+    print(f"✅ shards: {len(sedes)} sedes ({', '.join(s.nombre for s in sedes)}), por defecto '{por_defecto}'.")
+    return MapaSedes(sedes, por_defecto)
+
+
+def _en_paralelo(tareas):
+    """{clave: resultado o excepción} ejecutando las funciones sin argumentos de 'tareas' a la vez."""
+    futuros = {clave: _EJECUTOR_SEDES.submit(contextvars.copy_context().run, funcion)
+               for clave, funcion in tareas.items()}
+    resultados = {}
+    for clave, futuro in futuros.items():
+        try:
+            resultados[clave] = futuro.result()
+        except Exception as e:
+            resultados[clave] = e
+    return resultados
+
+
+mapa = cargar_mapa()
+
+
+# --- Operaciones (mismas firmas que flujo_agendamiento) ---
+@trazado("sede.buscar_paciente_por_dni")
+def buscar_paciente_por_dni(dni, sede=None):
+    """Como flujo_agendamiento.buscar_paciente_por_dni, en la sede indicada o en la primera del índice."""
+    if mapa.una_sola:
+        return flujo.buscar_paciente_por_dni(dni)
+    if sede is None:
+        sedes = mapa.sedes_de_dni(dni)
+        sede = mapa.por_defecto if mapa.por_defecto in sedes else sorted(sedes)[0]
+    paciente = flujo.buscar_paciente_por_dni(dni, hojas=mapa.sede(sede).hojas)
+    if paciente:
+        paciente["Sede"] = sede
+    return paciente
+
+
+@trazado("sede.agendar")
+def agendar(nombre, dni, telefono, email, fecha, hora, medico, paciente=None, sede=None):
+    """Agenda en una sola sede: la indicada o la del médico."""
+    if mapa.una_sola:
+        return flujo.agendar(nombre, dni, telefono, email, fecha, hora, medico, paciente=paciente)
+    destino = mapa.sede(sede, medico)
+    dni_limpio = ''.join(filter(str.isdigit, str(dni)))
+    # El paciente precargado solo sirve si es de esta sede; si no, se usa el índice
+    if not paciente or paciente.get("Sede", mapa.por_defecto) != destino.nombre:
+        id_paciente = mapa.sedes_de_dni(dni_limpio).get(destino.nombre)
+        paciente = {"ID_Paciente": id_paciente, "DNI": dni_limpio} if id_paciente else None
+    mensaje = flujo.agendar(nombre, dni, telefono, email, fecha, hora, medico, paciente=paciente,
+                            hojas=destino.hojas)
+    creado = _ID_PACIENTE_MENSAJE.search(str(mensaje))
+    if creado and str(mensaje).startswith("¡Éxito!"):
+        mapa.indice.anotar(dni_limpio, destino.nombre, creado.group(1))
+    registrar("cita_enrutada", modulo="shards", sede=destino.nombre)
+    return mensaje
+
+
+@trazado("sede.consultar_citas")
+def consultar_citas(dni, incluir_historial=False):
+    """Citas del DNI en todas sus sedes (consultadas en paralelo), cada una con su 'Sede'."""
+    if mapa.una_sola:
+        return flujo.consultar_citas(dni, incluir_historial)
+    sedes = mapa.sedes_de_dni(dni)
+    resultados = _en_paralelo({
+        nombre: (lambda n=nombre: flujo.consultar_citas(dni, incluir_historial, hojas=mapa.sede(n).hojas))
+        for nombre in sedes})
+    citas, mensajes = [], []
+    for nombre, resultado in sorted(resultados.items()):
+        if isinstance(resultado, list):
+            citas.extend({**cita, "Sede": nombre} for cita in resultado)
+        else:
+            mensajes.append(f"Error al consultar citas: {resultado}" if isinstance(resultado, Exception) else resultado)
+    if citas:
+        return sorted(citas, key=lambda c: (c.get("Fecha", ""), c.get("Hora", "")))
+    return mensajes[0]
+
+
+@trazado("sede.cancelar_cita")
+def cancelar_cita(dni, fecha, medico=None, sede=None):
+    """
+    Cancela en una sola sede. Sin sede ni médico, busca (en paralelo, solo
+    lectura) en qué sede del paciente está la cita pendiente de esa fecha.
+    """
+    if mapa.una_sola:
+        return flujo.cancelar_cita(dni, fecha)
+    if sede or medico:
+        return flujo.cancelar_cita(dni, fecha, hojas=mapa.sede(sede, medico).hojas)
+    sedes = mapa.sedes_de_dni(dni)
+    if len(sedes) > 1:
+        citas = consultar_citas(dni)
+        for cita in citas if isinstance(citas, list) else []:
+            if cita.get("Fecha") == fecha and str(cita.get("Estado", "")).lower() == "pendiente":
+                sedes = {cita["Sede"]: None}
+                break
+    return flujo.cancelar_cita(dni, fecha, hojas=mapa.sede(next(iter(sorted(sedes)))).hojas)
+
+
+# --- Operaciones por lote (API JSON): una llamada por sede, en paralelo ---
+def _resultado_sede(resultado, n, mensaje_error):
+    """Resultados de una sede, o el mismo error repetido si la llamada lanzó una excepción."""
+    return [f"{mensaje_error}: {resultado}"] * n if isinstance(resultado, Exception) else resultado
+
+
+@trazado("sede.agendar_lote")
+def agendar_lote(citas):
+    """Como flujo_agendamiento.agendar_lote, repartiendo las citas por la sede de su médico."""
+    if mapa.una_sola:
+        return flujo.agendar_lote(citas)
+    grupos = {}
+    for i, cita in enumerate(citas):
+        grupos.setdefault(mapa.sede(medico=cita.get("medico")).nombre, []).append(i)
+    por_sede = _en_paralelo({
+        nombre: (lambda n=nombre, idx=indices: flujo.agendar_lote([citas[i] for i in idx], hojas=mapa.sede(n).hojas))
+        for nombre, indices in grupos.items()})
+    resultados = [None] * len(citas)
+    for nombre, indices in grupos.items():
+        mensajes = _resultado_sede(por_sede[nombre], len(indices), "Error al procesar la cita en Google Sheets")
+        for i, mensaje in zip(indices, mensajes):
+            resultados[i] = mensaje
+            creado = _ID_PACIENTE_MENSAJE.search(str(mensaje))
+            if creado and str(mensaje).startswith("¡Éxito!"):
+                dni_limpio = ''.join(filter(str.isdigit, str(citas[i].get("dni"))))
+                mapa.indice.anotar(dni_limpio, nombre, creado.group(1))
+        registrar("citas_enrutadas_lote", modulo="shards", sede=nombre, n_citas=len(indices))
+    return resultados
+
+
+@trazado("sede.consultar_citas_lote")
+def consultar_citas_lote(dnis):
+    """{DNI: citas de todas sus sedes (con 'Sede') o mensaje}, una lectura por sede."""
+    if mapa.una_sola:
+        return flujo.consultar_citas_lote(dnis)
+    grupos = {}
+    for dni in dnis:
+        for nombre in mapa.sedes_de_dni(dni):
+            grupos.setdefault(nombre, []).append(dni)
+    por_sede = _en_paralelo({
+        nombre: (lambda n=nombre, d=lista: flujo.consultar_citas_lote(d, hojas=mapa.sede(n).hojas))
+        for nombre, lista in grupos.items()})
+    citas, mensajes = {}, {}
+    for nombre in sorted(grupos):
+        resultado = por_sede[nombre]
+        for dni in grupos[nombre]:
+            r = f"Error al consultar citas: {resultado}" if isinstance(resultado, Exception) else resultado[dni]
+            if isinstance(r, list):
+                citas.setdefault(dni, []).extend({**cita, "Sede": nombre} for cita in r)
+            else:
+                mensajes.setdefault(dni, r)
+    return {dni: sorted(citas[dni], key=lambda c: (c.get("Fecha", ""), c.get("Hora", ""))) if dni in citas
+            else mensajes[dni] for dni in dnis}
+
+
+@trazado("sede.cancelar_citas_lote")
+def cancelar_citas_lote(pares):
+    """
+    Como flujo_agendamiento.cancelar_citas_lote, en la sede de cada paciente. Si
+    el DNI está en varias, se elige la que tiene la cita pendiente de esa fecha.
+    """
+    if mapa.una_sola:
+        return flujo.cancelar_citas_lote(pares)
+    sedes = {dni: mapa.sedes_de_dni(dni) for dni, _ in pares}
+    varias = [dni for dni, s in sedes.items() if len(s) > 1]
+    pendientes = {}
+    for dni, resultado in (consultar_citas_lote(varias) if varias else {}).items():
+        for cita in resultado if isinstance(resultado, list) else []:
+            if str(cita.get("Estado", "")).lower() == "pendiente":
+                pendientes.setdefault((dni, cita.get("Fecha")), cita["Sede"])
+    grupos = {}
+    for i, (dni, fecha) in enumerate(pares):
+        nombre = pendientes.get((dni, fecha)) or sorted(sedes[dni])[0]
+        grupos.setdefault(nombre, []).append(i)
+    por_sede = _en_paralelo({
+        nombre: (lambda n=nombre, idx=indices: flujo.cancelar_citas_lote([pares[i] for i in idx],
+                                                                          hojas=mapa.sede(n).hojas))
+        for nombre, indices in grupos.items()})
+    resultados = [None] * len(pares)
+    for nombre, indices in grupos.items():
+        for i, mensaje in zip(indices, _resultado_sede(por_sede[nombre], len(indices), "Error al cancelar la cita")):
+            resultados[i] = mensaje
+    return resultados
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Sedes (shards) de la base de citas.")
+    parser.add_argument("--reconstruir-indice", action="store_true", help="Rehace el índice global DNI -> sedes.")
+    args = parser.parse_args()
+    for sede in mapa.sedes.values():
+        print(f"🏥 {sede.nombre}{' (por defecto)' if sede.nombre == mapa.por_defecto else ''}: "
+              f"{', '.join(sorted(sede.medicos)) or '-'}")
+    if args.reconstruir_indice:
+        print(f"🗂️ Índice DNI: {mapa.reconstruir_indice()} entradas.")
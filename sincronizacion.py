@@ -0,0 +1,442 @@
+# ============================================================
+# 🔄 Sincronización Incremental Sheets -> Espejo Local
+# ============================================================
+# El personal edita la hoja Citas a mano (confirma, reprograma, marca
+# ausencias), así que cualquier copia local envejece. Volver a descargar todo
+# cada pocos segundos es justo el coste a evitar. EspejoHoja:
+#   1. Sondea la última modificación del documento (una llamada de metadatos).
+#   2. Si cambió, pide en un solo batch_get la "ventana activa" (citas
+#      recientes y futuras, más las filas nuevas al final).
+#   3. Compara fila a fila por hash con la copia local, aplica los cambios a
+#      los índices en memoria y avisa a los suscriptores (alta/cambio/baja).
+#   4. Cada ESPEJO_RECONCILIAR_S hace una descarga completa, que recoge las
+#      ediciones fuera de la ventana y los borrados (p. ej. archivo_citas.py).
+# Con ESPEJO_INSTANTANEA los espejos se guardan periódicamente y al salir en
+# una instantánea (instantanea.py); al arrancar se cargan de ella y solo se
+# pide a Google lo cambiado desde entonces.
+import atexit
+import hashlib
+import os
+import random
+import threading
+import time
+from collections import namedtuple
+from datetime import date, timedelta
+
+import instantanea
+from trazas import incrementar, registrar, span
+
+# --- Configuración (sobrescribible por variables de entorno) ---
+ESPEJO_INTERVALO_S = float(os.environ.get("ESPEJO_INTERVALO_S", 5))     # Sondeo de la marca de modificación
+ESPEJO_RECONCILIAR_S = float(os.environ.get("ESPEJO_RECONCILIAR_S", 600)) # Descarga completa periódica
+ESPEJO_DIAS_VENTANA = int(os.environ.get("ESPEJO_DIAS_VENTANA", 7))     # Citas desde hoy - N días = activas
+ESPEJO_INSTANTANEA = os.environ.get("ESPEJO_INSTANTANEA") # Ej: "data/espejo.snap" (None = sin instantánea)
+ESPEJO_INSTANTANEA_S = float(os.environ.get("ESPEJO_INSTANTANEA_S", 300)) # Cada cuánto se reescribe
+
+Cambio = namedtuple("Cambio", "tipo id anterior nueva") # tipo: "alta" | "cambio" | "baja"
+
+
+def _hash_fila(fila):
+    return hashlib.blake2b("\x1f".join(fila).encode("utf-8"), digest_size=8).digest()
+
+
+def _normalizar(fila, ancho):
+    """Misma forma que get_all_values (batch_get omite las celdas vacías del final)."""
+    fila = [str(v) for v in fila[:ancho]]
+    return fila + [""] * (ancho - len(fila))
+
+
+def _letra_columna(n):
+    letras = ""
+    while n:
+        n, resto = divmod(n - 1, 26)
+        letras = chr(ord("A") + resto) + letras
+    return letras
+
+
+def marca_remota(hoja):
+    """
+    Última modificación del documento de la hoja (gspread >= 6, API de Drive) o,
+    con HojaMemoria, su contador de versión. None si no se puede saber barato.
+    """
+    documento = getattr(hoja, "spreadsheet", None)
+    if documento is not None and hasattr(documento, "get_lastUpdateTime"):
+        return documento.get_lastUpdateTime()
+    return getattr(hoja, "version", None)
+
+
+class EspejoHoja:
+    """
+    Copia local de una hoja (filas como listas de texto, la columna 1 es el ID)
+    con índice por ID y por las columnas pedidas, mantenida por sincronizar().
+    """
+
+    def __init__(self, hoja, columnas_indice=(), es_activa=None, reconciliar_s=ESPEJO_RECONCILIAR_S):
+        self.hoja = hoja
+        self.titulo = getattr(hoja, "title", "?")
+        self.columnas_indice = tuple(columnas_indice)
+        self.es_activa = es_activa # fila -> bool; None = toda la hoja es ventana
+        self.reconciliar_s = reconciliar_s
+        self.encabezados = []
+        self._filas = []
+        self._hashes = []
+        self._por_id = {}  # ID -> posición en _filas
+        self._indices = {}  # columna -> {valor: set(IDs)}
+        self._posiciones = {}  # columna indexada -> posición en la fila
+        self._marca = None
+        self.version = 0  # Sube cada vez que cambia el contenido (cachés derivadas, p. ej. analitica.py)
+        self._ultima_completa = 0.0  # time.monotonic() de la última descarga completa
+        self._ultima_completa_ts = 0.0  # La misma, en time.time() (para la instantánea)
+        self._oyentes = []
+        self._lock = threading.RLock()
+        self._hilo = None
+        self._parar = threading.Event()
+        self.estadisticas = {"sondeos": 0, "sin_cambios": 0, "incrementales": 0, "completas": 0,
+                             "celdas_descargadas": 0, "cambios": 0}
+        if hasattr(os, "register_at_fork"):
+            os.register_at_fork(after_in_child=self._tras_fork)
+
+    # --- Lectura ---
+    def __len__(self):
+        return len(self._filas)
+
+    def filas(self, con_encabezado=False):
+        with self._lock:
+            filas = [list(f) for f in self._filas]
+            return [list(self.encabezados)] + filas if con_encabezado else filas
+
+    def obtener(self, id_fila):
+        with self._lock:
+            posicion = self._por_id.get(id_fila)
+            return None if posicion is None else dict(zip(self.encabezados, self._filas[posicion]))
+
+    def buscar(self, columna, valor):
+        """Filas (dicts) cuya 'columna' vale 'valor', por el índice en memoria."""
+        with self._lock:
+            ids = self._indices.get(columna, {}).get(valor, ())
+            return [dict(zip(self.encabezados, self._filas[self._por_id[i]])) for i in sorted(ids)]
+
+    # --- Suscriptores ---
+    def suscribir(self, oyente):
+        """oyente(lista de Cambio) tras cada sincronización con cambios."""
+        self._oyentes.append(oyente)
+
+    def _avisar(self, cambios):
+        for oyente in list(self._oyentes):
+            try:
+                oyente(cambios)
+            except Exception as e:
+                registrar("error_oyente_espejo", nivel="error", modulo="sincronizacion", hoja=self.titulo, error=str(e))
+
+    # --- Índices (con el lock tomado) ---
+    def _reindexar(self, hashes=None):
+        self._hashes = hashes if hashes is not None else [_hash_fila(f) for f in self._filas]
+        self._por_id = {f[0]: i for i, f in enumerate(self._filas) if f and f[0]}
+        self._indices = {col: {} for col in self.columnas_indice}
+        self._posiciones = {col: self.encabezados.index(col) for col in self.columnas_indice if col in self.encabezados}
+        for fila in self._filas:
+            self._indexar(fila, 1)
+
+    def _indexar(self, fila, signo):
+        if not fila or not fila[0]:
+            return
+        for columna, posicion in self._posiciones.items():
+            if posicion >= len(fila):
+                continue
+            ids = self._indices[columna].setdefault(fila[posicion], set())
+            if signo > 0:
+                ids.add(fila[0])
+            else:
+                ids.discard(fila[0])
+                if not ids:
+                    del self._indices[columna][fila[posicion]]
+
+    def _inicio_ventana(self):
+        """Posición (en _filas) de la primera fila activa; todo lo anterior no se vuelve a pedir."""
+        if self.es_activa is None:
+            return 0
+        for i, fila in enumerate(self._filas):
+            if self.es_activa(fila):
+                return i
+        return len(self._filas)
+
+    def _diferencias(self, inicio, nuevas):
+        """Cambio por ID entre _filas[inicio:] y 'nuevas'."""
+        anteriores = {f[0]: f for f in self._filas[inicio:] if f and f[0]}
+        hashes = {f[0]: h for f, h in zip(self._filas[inicio:], self._hashes[inicio:]) if f and f[0]}
+        cambios = []
+        vistos = set()
+        for fila in nuevas:
+            if not fila or not fila[0]:
+                continue
+            vistos.add(fila[0])
+            anterior = anteriores.get(fila[0])
+            if anterior is None:
+                cambios.append(Cambio("alta", fila[0], None, fila))
+            elif hashes[fila[0]] != _hash_fila(fila):
+                cambios.append(Cambio("cambio", fila[0], anterior, fila))
+        cambios.extend(Cambio("baja", id_fila, fila, None) for id_fila, fila in anteriores.items() if id_fila not in vistos)
+        return cambios
+
+    def _aplicar(self, inicio, nuevas, cambios):
+        for cambio in cambios:
+            if cambio.anterior is not None:
+                self._indexar(cambio.anterior, -1)
+        self._filas[inicio:] = nuevas
+        self._hashes[inicio:] = [_hash_fila(f) for f in nuevas]
+        for i in range(inicio, len(self._filas)):
+            fila = self._filas[i]
+            if fila and fila[0]:
+                self._por_id[fila[0]] = i
+        for cambio in cambios:
+            if cambio.tipo == "baja":
+                self._por_id.pop(cambio.id, None)
+            if cambio.nueva is not None:
+                self._indexar(cambio.nueva, 1)
+
+    # --- Sincronización ---
+    def cargar(self):
+        """Descarga completa sin eventos (arranque)."""
+        with span("espejo.cargar", hoja=self.titulo):
+            marca = marca_remota(self.hoja)
+            valores = self.hoja.get_all_values()
+        with self._lock:
+            self.encabezados = valores[0] if valores else []
+            self._filas = [_normalizar(f, len(self.encabezados)) for f in valores[1:]]
+            self._reindexar()
+            self._marca = marca
+            self._ultima_completa = time.monotonic()
+            self._ultima_completa_ts = time.time()
+            self.version += 1
+            self.estadisticas["celdas_descargadas"] += sum(map(len, valores))
+        return self
+
+    def a_tabla(self):
+        """Contenido para instantanea.guardar()."""
+        with self._lock:
+            return {"encabezados": list(self.encabezados), "filas": [list(f) for f in self._filas],
+                    "hashes": list(self._hashes), "marca": self._marca, "ultima_completa": self._ultima_completa_ts}
+
+    def desde_tabla(self, tabla):
+        """
+        Carga el espejo desde una TablaMapeada (sin llamadas a la API). La
+        siguiente sincronizar() solo pedirá lo cambiado desde la instantánea; la
+        descarga completa pendiente se reparte al azar dentro de reconciliar_s
+        para que varios workers reiniciados a la vez no la hagan juntos.
+        """
+        with span("espejo.desde_instantanea", hoja=self.titulo):
+            filas = tabla.filas()
+            hashes = tabla.hashes()
+        with self._lock:
+            self.encabezados = list(tabla.encabezados)
+            self._filas = filas
+            self._reindexar(hashes)
+            self.version += 1
+            self._marca = tabla.marca
+            edad = max(time.time() - tabla.ultima_completa, 0.0)
+            self._ultima_completa = time.monotonic() - min(edad, random.uniform(0, self.reconciliar_s))
+            self._ultima_completa_ts = tabla.ultima_completa
+        return self
+
+    def _completa(self, marca):
+        valores = self.hoja.get_all_values()
+        with self._lock:
+            self.encabezados = valores[0] if valores else []
+            nuevas = [_normalizar(f, len(self.encabezados)) for f in valores[1:]]
+            cambios = self._diferencias(0, nuevas)
+            self._filas = nuevas
+            self._reindexar()
+            self._marca = marca
+            self._ultima_completa = time.monotonic()
+            self._ultima_completa_ts = time.time()
+            self.estadisticas["completas"] += 1
+            self.estadisticas["celdas_descargadas"] += sum(map(len, valores))
+        return cambios
+
+    def _incremental(self, marca):
+        """
+        Ventana activa en un batch_get, junto con el ID de la fila anterior a la
+        ventana como testigo: si cambió, se borraron o insertaron filas antes
+        (p. ej. archivo_citas.py) y devuelve None para hacer la descarga completa.
+        """
+        with self._lock:
+            inicio = self._inicio_ventana()
+            ancho = _letra_columna(max(len(self.encabezados), 1))
+            testigo = self._filas[inicio - 1][0] if inicio else None
+        rangos = ([f"A{inicio + 1}"] if inicio else []) + [f"A{inicio + 2}:{ancho}"]
+        respuesta = self.hoja.batch_get(rangos)
+        ventana = respuesta[-1]
+        if inicio and (respuesta[0][:1] or [[""]])[0][:1] != [testigo]:
+            return None
+        nuevas = [_normalizar(f, len(self.encabezados)) for f in ventana]
+        with self._lock:
+            cambios = self._diferencias(inicio, nuevas)
+            self._aplicar(inicio, nuevas, cambios)
+            self._marca = marca
+            self.estadisticas["incrementales"] += 1
+            self.estadisticas["celdas_descargadas"] += len(rangos) - 1 + sum(map(len, ventana))
+        return cambios
+
+    def sincronizar(self, forzar_completa=False):
+        """Un ciclo de sondeo; devuelve la lista de Cambio aplicados."""
+        self.estadisticas["sondeos"] += 1
+        with span("espejo.sincronizar", hoja=self.titulo):
+            # La marca se lee antes de los datos: lo editado durante la descarga se verá en el siguiente ciclo
+            marca = marca_remota(self.hoja)
+            toca_completa = forzar_completa or time.monotonic() - self._ultima_completa >= self.reconciliar_s
+            if not toca_completa and marca is not None and marca == self._marca:
+                self.estadisticas["sin_cambios"] += 1
+                incrementar("espejo_sondeos", hoja=self.titulo, resultado="sin_cambios")
+                return []
+            cambios = None if toca_completa else self._incremental(marca)
+            tipo = "incremental"
+            if cambios is None:
+                cambios = self._completa(marca)
+                tipo = "completa"
+        incrementar("espejo_sondeos", hoja=self.titulo, resultado=tipo)
+        if cambios:
+            self.version += 1
+            self.estadisticas["cambios"] += len(cambios)
+            incrementar("espejo_cambios", len(cambios), hoja=self.titulo)
+            registrar("espejo_cambios", modulo="sincronizacion", hoja=self.titulo, tipo=tipo,
+                      altas=sum(c.tipo == "alta" for c in cambios), cambios=sum(c.tipo == "cambio" for c in cambios),
+                      bajas=sum(c.tipo == "baja" for c in cambios))
+            self._avisar(cambios)
+        return cambios
+
+    # --- Hilo de sondeo ---
+    def iniciar(self, intervalo_s=ESPEJO_INTERVALO_S):
+        if self._hilo is not None and self._hilo.is_alive():
+            return self
+        self._intervalo_s = intervalo_s
+        self._parar.clear()
+        self._hilo = threading.Thread(target=self._bucle, name=f"espejo-{self.titulo}", daemon=True)
+        self._hilo.start()
+        return self
+
+    def detener(self):
+        self._parar.set()
+
+    def _bucle(self):
+        while not self._parar.wait(self._intervalo_s):
+            try:
+                self.sincronizar()
+            except Exception as e:
+                registrar("error_sincronizar", nivel="warning", modulo="sincronizacion", hoja=self.titulo, error=str(e))
+
+    def _tras_fork(self):
+        # Los hilos no sobreviven al fork (servidor.py): cada worker relanza el suyo
+        self._lock = threading.RLock()
+        if self._hilo is not None and not self._parar.is_set():
+            self._hilo = None
+            self.iniciar(self._intervalo_s)
+
+
+# --- Espejos de las hojas de flujo_agendamiento ---
+def cita_activa(fila, dias_ventana=ESPEJO_DIAS_VENTANA):
+    """Citas desde hace 'dias_ventana' días en adelante (las que el personal aún toca)."""
+    desde = (date.today() - timedelta(days=dias_ventana)).isoformat()
+    return len(fila) > 2 and fila[2] >= desde
+
+
+_espejos = {}
+_lock_espejos = threading.Lock()
+
+
+def _cargar(nuevo, nombre):
+    """Arranque en caliente desde la instantánea si la hay (y es válida); si no, descarga completa."""
+    if ESPEJO_INSTANTANEA and os.path.exists(ESPEJO_INSTANTANEA):
+        try:
+            with instantanea.Instantanea(ESPEJO_INSTANTANEA) as inst:
+                if nombre in inst:
+                    nuevo.desde_tabla(inst.tabla(nombre))
+                    registrar("espejo_desde_instantanea", modulo="sincronizacion", hoja=nombre,
+                              filas=len(nuevo), edad_s=round(time.time() - inst.creado, 1))
+                    nuevo.sincronizar() # Solo el delta desde la instantánea
+                    return nuevo
+        except (OSError, ValueError, KeyError) as e:
+            registrar("instantanea_invalida", nivel="warning", modulo="sincronizacion", error=str(e))
+    return nuevo.cargar()
+
+
+def guardar_instantanea(ruta=None):
+    """Escribe todos los espejos cargados en la instantánea (atómico)."""
+    ruta = ruta or ESPEJO_INSTANTANEA
+    with _lock_espejos:
+        espejos = dict(_espejos)
+    if not ruta or not espejos:
+        return None
+    with span("espejo.guardar_instantanea"):
+        tamano = instantanea.guardar(ruta, {nombre: e.a_tabla() for nombre, e in espejos.items()})
+    registrar("instantanea_guardada", modulo="sincronizacion", ruta=ruta, bytes=tamano)
+    return tamano
+
+
+def _bucle_instantanea():
+    while not _parar_instantanea.wait(ESPEJO_INSTANTANEA_S):
+        try:
+            guardar_instantanea()
+        except Exception as e:
+            registrar("error_instantanea", nivel="warning", modulo="sincronizacion", error=str(e))
+
+
+_parar_instantanea = threading.Event()
+_hilo_instantanea = None
+
+
+def _iniciar_guardado():
+    global _hilo_instantanea
+    if not ESPEJO_INSTANTANEA or ESPEJO_INSTANTANEA_S <= 0:
+        return
+    if _hilo_instantanea is None or not _hilo_instantanea.is_alive():
+        _hilo_instantanea = threading.Thread(target=_bucle_instantanea, name="espejo-instantanea", daemon=True)
+        _hilo_instantanea.start()
+
+
+def _tras_fork():
+    global _lock_espejos, _hilo_instantanea
+    _lock_espejos = threading.Lock()
+    if _hilo_instantanea is not None:
+        _hilo_instantanea = None
+        _iniciar_guardado()
+
+
+if ESPEJO_INSTANTANEA:
+    atexit.register(guardar_instantanea)
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_tras_fork)
+
+
+def iniciar_sondeo():
+    """Arranca el sondeo de los espejos ya cargados y el guardado de la instantánea (workers de servidor.py)."""
+    with _lock_espejos:
+        espejos = list(_espejos.values())
+    for e in espejos:
+        if ESPEJO_INTERVALO_S > 0:
+            e.iniciar()
+    if espejos:
+        _iniciar_guardado()
+
+
+def espejo_cargado(nombre):
+    """El espejo de esa hoja si ya existe (sin crearlo), o None."""
+    return _espejos.get(nombre)
+
+
+def espejo(nombre, iniciar=True):
+    """Espejo (cargado y, si 'iniciar', sondeando) de la hoja "Pacientes" o "Citas" de flujo_agendamiento."""
+    with _lock_espejos:
+        if nombre not in _espejos:
+            import flujo_agendamiento as flujo
+            if nombre == "Pacientes":
+                nuevo = EspejoHoja(flujo.pacientes_sheet, columnas_indice=("DNI",))
+            elif nombre == "Citas":
+                nuevo = EspejoHoja(flujo.citas_sheet, columnas_indice=("ID_Paciente", "Estado"), es_activa=cita_activa)
+            else:
+                raise KeyError(f"Hoja desconocida: {nombre}")
+            _espejos[nombre] = _cargar(nuevo, nombre)
+            if iniciar and ESPEJO_INTERVALO_S > 0:
+                nuevo.iniciar()
+            if iniciar:
+                _iniciar_guardado()
+        return _espejos[nombre]
@@ -0,0 +1,143 @@
+# ============================================================
+# ⚡ Parsers de Slots (respuestas a una pregunta pendiente)
+# ============================================================
+# Cuando el bot acaba de preguntar un campo (estado["campo_preguntado"]),
+# la respuesta suele ser solo ese dato: "Ana Torres", "987654321", "mañana"...
+# Estos parsers la validan con reglas baratas, sin spaCy. Si la respuesta
+# no encaja con el campo esperado devuelven None y se usa el pipeline NLP.
+import re
+import unicodedata
+
+from directorio_medicos import buscar as buscar_medico
+from gramatica_fechas import ajustar_periodo, es_24h, fecha as fecha_en_texto, hora as hora_en_texto
+
+
+def normalizar(texto):
+    """Minúsculas, sin tildes y con espacios simples."""
+    texto = unicodedata.normalize("NFKD", str(texto).lower())
+    texto = "".join(c for c in texto if not unicodedata.combining(c))
+    return re.sub(r"\s+", " ", texto).strip(" .,;:!¡?¿")
+
+
+# Frases con las que el paciente suele introducir el dato
+_PREFIJOS = re.compile(
+    r"^(?:me llamo|soy|con (?:el|la)|para (?:el|las?)|a las|el dia)\s+"
+    r"|^(?:(?:mi|el|su)\s+)?(?:dni|documento|nombre(?: completo)?|telefono|celular|numero|"
+    r"correo|email|e-mail|fecha|hora|medico)\b\s*(?:(?:es|seria|sera)\b|:)?\s*"
+    r"|^(?:es|seria|sera)\s+"
+)
+_SEPARADOR_DIGITOS = re.compile(r"(?<=\d)[\s.\-](?=\d)")
+_PALABRAS_INTENCION = re.compile(r"\b(agendar|consultar|cancelar|anular|cita|citas|hola|ayuda)\b")
+
+
+def _quitar_prefijo(texto_norm):
+    return _PREFIJOS.sub("", texto_norm, count=1).strip()
+
+
+def _solo_digitos(texto_norm):
+    """Devuelve los dígitos si la respuesta es un único número (admite espacios/puntos/guiones)."""
+    compacto = _SEPARADOR_DIGITOS.sub("", _quitar_prefijo(texto_norm))
+    return compacto if compacto.isdigit() else None
+
+
+# --- Parsers por campo ---
+def parsear_dni(texto):
+    digitos = _solo_digitos(normalizar(texto))
+    return digitos if digitos and len(digitos) == 8 else None
+
+
+def parsear_telefono(texto):
+    digitos = _solo_digitos(normalizar(texto).replace("+", ""))
+    if digitos and len(digitos) == 11 and digitos.startswith("51"):
+        digitos = digitos[2:]  # Código de país de Perú
+    return digitos if digitos and len(digitos) == 9 and digitos.startswith("9") else None
+
+
+_PATRON_EMAIL = re.compile(r"^[\w.+\-]+@[\w\-]+(?:\.[\w\-]+)*\.[a-z]{2,}$")
+
+
+def parsear_email(texto):
+    candidato = _quitar_prefijo(str(texto).strip().lower())
+    candidato = candidato.replace(" arroba ", "@").replace(" punto ", ".").strip(" .,;")
+    return candidato if _PATRON_EMAIL.match(candidato) else None
+
+
+_PATRON_NOMBRE = re.compile(r"^[a-zñ]+(?:[ '\-][a-zñ]+){0,5}$")
+# Palabras que no forman parte de un nombre: "no se", "ok gracias", "mejor otro dia" van al NLP
+_PALABRAS_NO_NOMBRE = {
+    "no", "si", "se", "ok", "okay", "vale", "bueno", "bien", "gracias", "claro", "listo", "perfecto", "perdon",
+    "disculpa", "adios", "chau", "nada", "nunca", "tampoco", "mejor", "otro", "otra", "dia", "hoy", "manana",
+    "ahora", "luego", "despues", "tarde", "noche", "semana", "hora", "fecha", "doctor", "doctora", "medico",
+    "quiero", "quisiera", "prefiero", "puedo", "puede", "tengo", "necesito", "espera", "momento", "que", "como",
+    "cuando", "donde", "porque", "por", "para", "mi", "me", "yo", "usted", "eso", "esto", "esa", "ese", "un", "una",
+    "el", "los", "las", "y", "pero", "sin", "con", "ya", "tal", "vez", "gusto", "buenas", "buenos", "dias",
+    "noches", "tardes", "sabe", "seguro", "cambiar",
+}
+
+
+def parsear_nombre(texto):
+    texto_norm = normalizar(texto)
+    if _PALABRAS_INTENCION.search(texto_norm):
+        return None  # Probablemente es otra petición, no un nombre
+    original = re.sub(r"\s+", " ", str(texto)).strip(" .,;:!¡?¿")
+    sin_prefijo = _quitar_prefijo(texto_norm)
+    if not _PATRON_NOMBRE.match(sin_prefijo) or len(sin_prefijo) < 3:
+        return None
+    if _PALABRAS_NO_NOMBRE.intersection(re.split(r"[ '\-]", sin_prefijo)):
+        return None
+    # Conservar las tildes del original, quitando solo el prefijo ("me llamo ...")
+    palabras = original.split(" ")[-len(sin_prefijo.split(" ")):]
+    return " ".join(p.capitalize() for p in palabras)
+
+
+def parsear_medico(texto):
+    # Tolera tildes y errores de transcripción ("doctora moralez" -> Dra.Morales)
+    return buscar_medico(_quitar_prefijo(normalizar(texto)))
+
+
+def parsear_fecha(texto):
+    # "mañana", "el próximo martes", "15 de noviembre", "15/11/2026"... (gramatica_fechas.py).
+    # Toda la respuesta debe ser la fecha: "cancela mi cita de mañana" va al NLP
+    texto_norm = normalizar(texto)
+    return fecha_en_texto(texto_norm, completo=True) or fecha_en_texto(_quitar_prefijo(texto_norm), completo=True)
+
+
+_PATRON_HORA = re.compile(r"^(\d{1,2})(?:[:h.](\d{2}))?\s*(am|pm|a\.m|p\.m)?\.?(?:\s*(?:horas|hrs|h))?$")
+
+
+def parsear_hora(texto):
+    texto_norm = _quitar_prefijo(normalizar(texto))
+    match = _PATRON_HORA.match(texto_norm)
+    if not match:
+        # Respuesta en palabras: "cuatro y media de la tarde", "la una", "al mediodía"
+        if not texto_norm.startswith(("a la", "al ")):
+            texto_norm = ("a " if texto_norm.startswith("la") else "a las ") + texto_norm
+        return hora_en_texto(texto_norm, completo=True)
+    hora = ajustar_periodo(int(match.group(1)), match.group(3), veinticuatro=es_24h(match.group(1), match.group(2)))
+    minutos = int(match.group(2) or 0)
+    if not (0 <= hora <= 23 and 0 <= minutos <= 59):
+        return None
+    return f"{hora:02d}:{minutos:02d}"
+
+
+# --- Registro ---
+PARSERS_SLOTS = {
+    "DNI": parsear_dni,
+    "Nombre": parsear_nombre,
+    "Telefono": parsear_telefono,
+    "Email": parsear_email,
+    "Medico": parsear_medico,
+    "Fecha": parsear_fecha,
+    "Hora": parsear_hora,
+}
+
+
+def parsear_slot(campo, texto):
+    """Valor normalizado del campo si 'texto' es una respuesta válida para él; si no, None."""
+    parser = PARSERS_SLOTS.get(campo)
+    if parser is None or not isinstance(texto, str) or not texto.strip():
+        return None
+    try:
+        return parser(texto)
+    except Exception:
+        return None
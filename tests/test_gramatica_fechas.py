@@ -0,0 +1,24 @@
+from datetime import date
+
+import gramatica_fechas
+import slots
+
+HOY = date(2026, 10, 19)
+
+
+def test_hhmm_es_hora_de_24h():
+    assert gramatica_fechas.resolver("07:30", HOY) == {"Hora": "07:30"}
+    assert gramatica_fechas.resolver("2026-10-20 07:30", HOY) == {"Fecha": "2026-10-20", "Hora": "07:30"}
+    assert slots.parsear_hora("07:30") == "07:30"
+    assert slots.parsear_hora("1:00") == "01:00"
+
+
+def test_hora_suelta_temprana_es_por_la_tarde():
+    assert gramatica_fechas.resolver("a las 3", HOY) == {"Hora": "15:00"}
+    assert slots.parsear_hora("a las 3") == "15:00"
+    assert slots.parsear_hora("tres y media") == "15:30"
+
+
+def test_periodo_explicito_manda():
+    assert gramatica_fechas.resolver("a las 7 de la mañana", HOY) == {"Hora": "07:00"}
+    assert gramatica_fechas.resolver("4 pm", HOY) == {"Hora": "16:00"}
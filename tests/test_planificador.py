@@ -0,0 +1,52 @@
+import asyncio
+
+from planificador import Planificador
+
+POOLS = {
+    "nlp": {"limite": 4, "max_cola": 8, "prioridad": 0, "espera_max_s": 5},
+    "admin": {"limite": 4, "max_cola": 8, "prioridad": 5, "espera_max_s": 5},
+}
+
+
+def test_hueco_global_va_primero_al_pool_mas_prioritario():
+    async def escenario():
+        planificador = Planificador(POOLS, max_total=1)
+        admitidos = []
+
+        async def pedir(pool):
+            await planificador.adquirir(pool)
+            admitidos.append(pool)
+
+        await planificador.adquirir("admin") # Ocupa el único hueco global
+        admin = asyncio.create_task(pedir("admin"))
+        await asyncio.sleep(0)
+        nlp = asyncio.create_task(pedir("nlp")) # Llega después, pero con más prioridad
+        await asyncio.sleep(0)
+        planificador.liberar("admin")
+        await asyncio.wait_for(nlp, 1)
+        assert admitidos == ["nlp"] and not admin.done()
+        planificador.liberar("nlp")
+        await asyncio.wait_for(admin, 1)
+        assert admitidos == ["nlp", "admin"]
+
+    asyncio.run(escenario())
+
+
+def test_via_rapida_no_adelanta_a_un_pool_mas_prioritario_en_espera():
+    async def escenario():
+        planificador = Planificador(POOLS, max_total=1)
+        await planificador.adquirir("admin")
+        nlp = asyncio.create_task(planificador.adquirir("nlp"))
+        await asyncio.sleep(0)
+        # Hueco libre sin pasar aún por el despacho: un "admin" nuevo no debe quedárselo
+        planificador.pools["admin"].activos -= 1
+        planificador.activos_total -= 1
+        admin = asyncio.create_task(planificador.adquirir("admin"))
+        await asyncio.wait_for(nlp, 1)
+        assert not admin.done()
+        assert planificador.pools["nlp"].activos == 1 and planificador.pools["admin"].activos == 0
+        planificador.liberar("nlp")
+        await asyncio.wait_for(admin, 1)
+        assert planificador.pools["admin"].activos == 1
+
+    asyncio.run(escenario())
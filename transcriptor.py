@@ -1,19 +1,218 @@
+import os
+import threading
 import time
+from concurrent.futures import Future, TimeoutError as PlazoVencido
+
+import numpy as np
+from trazas import trazado, registrar, observar
 try:
-    from faster_whisper import WhisperModel
+    from faster_whisper import WhisperModel, decode_audio
     model = WhisperModel("small", device="cpu")
     model_loaded = True
 except ImportError:
     model_loaded = False
 
+FRECUENCIA_WHISPER = 16000 # Whisper trabaja con audio mono a 16 kHz
+MAX_CLIP_LOTE_S = 30 # Ventana de Whisper: los clips más largos se transcriben solos (con segmentación)
+
+# --- Lotes dinámicos (varias notas de voz a la vez en una sola pasada del modelo) ---
+STT_LOTES = os.environ.get("STT_LOTES", "1") == "1"
+STT_LOTE_VENTANA_MS = float(os.environ.get("STT_LOTE_VENTANA_MS", 50)) # Espera máx. a que lleguen más clips
+STT_LOTE_MAX = int(os.environ.get("STT_LOTE_MAX", 8))
+STT_PLAZO_S = float(os.environ.get("STT_PLAZO_S", 20)) # Plazo por petición (como espera_max_s del pool "voz")
+MENSAJE_NO_DISPONIBLE = "⚠️ Transcripción no disponible. Instala 'faster-whisper' con: pip install faster-whisper"
+
+
+def preparar_audio(audio, sample_rate):
+    """Convierte el array del micrófono (int16/float, mono o estéreo) a float32 mono 16 kHz."""
+    audio = np.asarray(audio)
+    if np.issubdtype(audio.dtype, np.integer):
+        audio = audio.astype(np.float32) / np.iinfo(audio.dtype).max
+    else:
+        audio = audio.astype(np.float32)
+    if audio.ndim == 2:
+        audio = audio.mean(axis=1)
+    if sample_rate != FRECUENCIA_WHISPER and len(audio):
+        duracion = len(audio) / sample_rate
+        t_destino = np.arange(int(duracion * FRECUENCIA_WHISPER)) / FRECUENCIA_WHISPER
+        t_origen = np.arange(len(audio)) / sample_rate
+        audio = np.interp(t_destino, t_origen, audio).astype(np.float32)
+    return audio
+
+
+def _transcribir_uno(audio_16k):
+    """Una transcripción con model.transcribe (clips largos, o si falla el lote)."""
+    segments, info = model.transcribe(audio_16k, language="es")
+    return " ".join([seg.text for seg in segments]).strip()
+
+
+def _transcribir_lote(audios_16k):
+    """
+    Varios clips de <= 30 s en una sola llamada a CTranslate2: las features se
+    rellenan a la ventana de 30 s, se codifican juntas y se decodifican en lote.
+    """
+    from faster_whisper.audio import pad_or_trim
+    from faster_whisper.tokenizer import Tokenizer
+
+    tokenizer = Tokenizer(model.hf_tokenizer, model.model.is_multilingual, task="transcribe", language="es")
+    features = np.stack([pad_or_trim(model.feature_extractor(audio)) for audio in audios_16k])
+    prompt = model.get_prompt(tokenizer, [], without_timestamps=True)
+    resultados = model.model.generate(model.encode(features), [prompt] * len(audios_16k), beam_size=5,
+                                      max_length=model.max_length, suppress_blank=True, suppress_tokens=[-1])
+    textos = []
+    for resultado in resultados:
+        tokens = [t for t in resultado.sequences_ids[0] if t < tokenizer.eot]
+        textos.append(tokenizer.decode(tokens).strip())
+    return textos
+
+
+class _Peticion:
+    __slots__ = ("audio", "llegada", "plazo", "futuro")
+
+    def __init__(self, audio, plazo_s):
+        self.audio = audio
+        self.llegada = time.monotonic()
+        self.plazo = self.llegada + plazo_s
+        self.futuro = Future()
+
+
+class PlanificadorTranscripcion:
+    """
+    Junta las peticiones que llegan dentro de STT_LOTE_VENTANA_MS (hasta
+    STT_LOTE_MAX), las transcribe en un lote y devuelve a cada llamante su
+    texto. El orden es por plazo (la más urgente primero); las que vencen
+    antes de empezar se descartan sin ocupar el modelo.
+    """
+
+    def __init__(self, ventana_ms=STT_LOTE_VENTANA_MS, max_lote=STT_LOTE_MAX,
+                 transcribir_lote=None, transcribir_uno=None):
+        self.ventana_s = ventana_ms / 1000
+        self.max_lote = max_lote
+        self._transcribir_lote = transcribir_lote or _transcribir_lote
+        self._transcribir_uno = transcribir_uno or _transcribir_uno
+        self._pendientes = []
+        self._condicion = threading.Condition()
+        self._hilo = None
+        self.lote_disponible = True # Pasa a False si el modelo no admite lotes (se transcribe uno a uno)
+        if hasattr(os, "register_at_fork"):
+            os.register_at_fork(after_in_child=self._despues_de_fork)
+
+    def _despues_de_fork(self):
+        # El hilo no sobrevive al fork (servidor.py): se vuelve a crear con la primera petición
+        self._condicion = threading.Condition()
+        self._pendientes = []
+        self._hilo = None
+
+    def transcribir(self, audio_16k, plazo_s=STT_PLAZO_S):
+        """Bloquea hasta tener el texto del clip (o lanza PlazoVencido si no llega a tiempo)."""
+        peticion = _Peticion(audio_16k, plazo_s)
+        with self._condicion:
+            if self._hilo is None or not self._hilo.is_alive():
+                self._hilo = threading.Thread(target=self._bucle, name="stt-lotes", daemon=True)
+                self._hilo.start()
+            self._pendientes.append(peticion)
+            self._condicion.notify()
+        try:
+            return peticion.futuro.result(timeout=plazo_s)
+        except PlazoVencido:
+            peticion.futuro.cancel()
+            raise
+
+    # --- Hilo del modelo ---
+    def _siguiente_lote(self):
+        with self._condicion:
+            while not self._pendientes:
+                self._condicion.wait()
+            # Ventana contada desde la petición más antigua: con carga no se añade espera
+            limite = min(p.llegada for p in self._pendientes) + self.ventana_s
+            while len(self._pendientes) < self.max_lote and time.monotonic() < limite:
+                self._condicion.wait(limite - time.monotonic())
+            ahora = time.monotonic()
+            vencidas = [p for p in self._pendientes if p.plazo <= ahora or p.futuro.cancelled()]
+            vivas = sorted((p for p in self._pendientes if p not in vencidas), key=lambda p: p.plazo)
+            lote, self._pendientes = vivas[:self.max_lote], vivas[self.max_lote:]
+        for p in vencidas:
+            # set_running_or_notify_cancel: a partir de aquí el llamante ya no puede cancelar
+            if p.futuro.set_running_or_notify_cancel():
+                p.futuro.set_exception(PlazoVencido("Plazo de transcripción vencido en cola"))
+        if vencidas:
+            registrar("stt_plazo_vencido", nivel="warning", modulo="transcriptor", descartadas=len(vencidas))
+        # Las canceladas mientras se formaba el lote no entran al modelo
+        return [p for p in lote if p.futuro.set_running_or_notify_cancel()]
+
+    @staticmethod
+    def _resolver(p, texto=None, error=None):
+        if p.futuro.done():
+            return
+        if error is None:
+            p.futuro.set_result(texto)
+        else:
+            p.futuro.set_exception(error)
+
+    def _bucle(self):
+        while True:
+            lote = self._siguiente_lote()
+            if not lote:
+                continue
+            inicio = time.perf_counter()
+            cortos = [p for p in lote if len(p.audio) <= MAX_CLIP_LOTE_S * FRECUENCIA_WHISPER]
+            largos = [p for p in lote if p not in cortos]
+            if len(cortos) > 1 and self.lote_disponible:
+                try:
+                    for p, texto in zip(cortos, self._transcribir_lote([p.audio for p in cortos])):
+                        self._resolver(p, texto)
+                except Exception as e:
+                    self.lote_disponible = not isinstance(e, (AttributeError, ImportError, TypeError))
+                    registrar("error_stt_lote", nivel="error", modulo="transcriptor", error=str(e),
+                              desactivado=not self.lote_disponible)
+                    largos = lote
+            else:
+                largos = lote
+            for p in largos:
+                if p.futuro.done():
+                    continue
+                try:
+                    self._resolver(p, self._transcribir_uno(p.audio))
+                except Exception as e:
+                    self._resolver(p, error=e)
+            proceso = time.perf_counter() - inicio
+            audio_s = sum(len(p.audio) for p in lote) / FRECUENCIA_WHISPER
+            observar("stt_lote", proceso)
+            registrar("stt_lote", modulo="transcriptor", tamano=len(lote), audio_s=round(audio_s, 2),
+                      proceso_s=round(proceso, 3), rtf=round(proceso / audio_s, 3) if audio_s else None,
+                      espera_max_ms=round((time.monotonic() - min(p.llegada for p in lote)) * 1000 - proceso * 1000))
+
+
+planificador_stt = PlanificadorTranscripcion()
+
+
+def _transcribir(audio_16k):
+    if STT_LOTES:
+        return planificador_stt.transcribir(audio_16k)
+    return _transcribir_uno(audio_16k)
+
+
+@trazado("transcribir_audio")
 def transcribir_audio(ruta_audio):
     """Devuelve el texto transcrito del archivo."""
     if not model_loaded:
-        return "⚠️ Transcripción no disponible. Instala 'faster-whisper' con: pip install faster-whisper"
+        return MENSAJE_NO_DISPONIBLE
+    try:
+        return _transcribir(decode_audio(ruta_audio, sampling_rate=FRECUENCIA_WHISPER))
+    except PlazoVencido:
+        return "⚠️ La transcripción tardó demasiado, inténtalo de nuevo."
+    except Exception as e:
+        return f"❌ Error al transcribir: {e}"
+
+
+@trazado("transcribir_audio")
+def transcribir_array(audio, sample_rate):
+    """Como transcribir_audio, pero desde el array en memoria (sin archivo WAV temporal)."""
+    if not model_loaded:
+        return MENSAJE_NO_DISPONIBLE
     try:
-        time.sleep(0.5)
-        segments, info = model.transcribe(ruta_audio)
-        texto = " ".join([seg.text for seg in segments])
-        return texto.strip()
+        return _transcribir(preparar_audio(audio, sample_rate))
+    except PlazoVencido:
+        return "⚠️ La transcripción tardó demasiado, inténtalo de nuevo."
     except Exception as e:
         return f"❌ Error al transcribir: {e}"
@@ -0,0 +1,230 @@
+# ============================================================
+# ⏱️ Trazas: spans por etapa, métricas Prometheus y logs JSON
+# ============================================================
+# Cada etapa del camino de una petición (Whisper, spaCy, Sheets, joblib, TTS)
+# se envuelve en un span con el id de la petición. Los spans alimentan
+# histogramas de latencia y contadores (expuestos en /metrics) y se escriben
+# como líneas JSON en el log.
+import contextvars
+import functools
+import inspect
+import json
+import logging
+import os
+import sys
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+
+# --- Configuración ---
+LOG_NIVEL = os.environ.get("LOG_NIVEL", "INFO").upper()
+LOG_SPANS = os.environ.get("LOG_SPANS", "1") == "1" # Una línea JSON por span (además de las métricas)
+PREFIJO_METRICAS = "citas"
+# Límites de los histogramas (segundos), de una consulta a Sheets a una síntesis TTS larga
+LIMITES_HISTOGRAMA = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+_id_peticion = contextvars.ContextVar("id_peticion", default=None)
+
+
+# --- Logs JSON ---
+class FormatoJSON(logging.Formatter):
+    def format(self, record):
+        datos = {
+            "ts": round(record.created, 3),
+            "nivel": record.levelname.lower(),
+            "modulo": record.name,
+            "evento": record.getMessage(),
+        }
+        datos.update(getattr(record, "campos", {}))
+        if record.exc_info:
+            datos["excepcion"] = self.formatException(record.exc_info)
+        return json.dumps(datos, ensure_ascii=False, default=str)
+
+
+_logger = logging.getLogger("citas")
+if not _logger.handlers:
+    _manejador = logging.StreamHandler(sys.stdout)
+    _manejador.setFormatter(FormatoJSON())
+    _logger.addHandler(_manejador)
+    _logger.setLevel(LOG_NIVEL)
+    _logger.propagate = False
+
+
+def registrar(evento, nivel="info", modulo=None, **campos):
+    """Escribe un evento como línea JSON, con el id de la petición en curso."""
+    logger = _logger.getChild(modulo) if modulo else _logger
+    nivel_num = getattr(logging, nivel.upper())
+    if not logger.isEnabledFor(nivel_num):
+        return
+    id_peticion = _id_peticion.get()
+    if id_peticion:
+        campos["id_peticion"] = id_peticion
+    logger.log(nivel_num, evento, extra={"campos": campos})
+
+
+# --- Métricas ---
+class _Histograma:
+    __slots__ = ("cubetas", "suma", "cuenta")
+
+    def __init__(self):
+        self.cubetas = [0] * (len(LIMITES_HISTOGRAMA) + 1) # La última es +Inf
+        self.suma = 0.0
+        self.cuenta = 0
+
+    def observar(self, valor):
+        for i, limite in enumerate(LIMITES_HISTOGRAMA):
+            if valor <= limite:
+                self.cubetas[i] += 1
+                break
+        else:
+            self.cubetas[-1] += 1
+        self.suma += valor
+        self.cuenta += 1
+
+
+_lock_metricas = threading.Lock()
+_histogramas = {}  # nombre del span -> _Histograma
+_contadores = {}   # (nombre, (("etiqueta", "valor"), ...)) -> int
+
+
+def _tras_fork():
+    # Si otro hilo tenía el lock al hacer fork (servidor.py), en el hijo quedaría cerrado para siempre
+    global _lock_metricas
+    _lock_metricas = threading.Lock()
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_tras_fork)
+
+
+def incrementar(nombre, cantidad=1, **etiquetas):
+    clave = (nombre, tuple(sorted(etiquetas.items())))
+    with _lock_metricas:
+        _contadores[clave] = _contadores.get(clave, 0) + cantidad
+
+
+def observar(nombre_span, segundos):
+    with _lock_metricas:
+        histograma = _histogramas.get(nombre_span)
+        if histograma is None:
+            histograma = _histogramas[nombre_span] = _Histograma()
+        histograma.observar(segundos)
+
+
+def resumen_spans(reiniciar=False):
+    """{span: {"cuenta", "total_s"}} acumulado hasta ahora (lo usan benchmark.py y carga.py)."""
+    with _lock_metricas:
+        resumen = {nombre: {"cuenta": h.cuenta, "total_s": round(h.suma, 6)} for nombre, h in _histogramas.items()}
+        if reiniciar:
+            _histogramas.clear()
+    return resumen
+
+
+def _etiquetas(pares):
+    if not pares:
+        return ""
+    return "{" + ",".join(f'{k}="{str(v).replace(chr(34), chr(39))}"' for k, v in pares) + "}"
+
+
+def exportar_prometheus():
+    """Métricas en formato de texto de Prometheus (para la ruta /metrics)."""
+    nombre_hist = f"{PREFIJO_METRICAS}_span_duracion_segundos"
+    lineas = [f"# HELP {nombre_hist} Duración de cada etapa de la petición.",
+              f"# TYPE {nombre_hist} histogram"]
+    with _lock_metricas:
+        for span, h in sorted(_histogramas.items()):
+            acumulado = 0
+            for limite, n in zip(LIMITES_HISTOGRAMA + ("+Inf",), h.cubetas):
+                acumulado += n
+                lineas.append(f'{nombre_hist}_bucket{{span="{span}",le="{limite}"}} {acumulado}')
+            lineas.append(f'{nombre_hist}_sum{{span="{span}"}} {h.suma:.6f}')
+            lineas.append(f'{nombre_hist}_count{{span="{span}"}} {h.cuenta}')
+        nombres = sorted({nombre for nombre, _ in _contadores})
+        for nombre in nombres:
+            metrica = f"{PREFIJO_METRICAS}_{nombre}_total"
+            lineas.append(f"# TYPE {metrica} counter")
+            for (n, pares), valor in sorted(_contadores.items()):
+                if n == nombre:
+                    lineas.append(f"{metrica}{_etiquetas(pares)} {valor}")
+    return "\n".join(lineas) + "\n"
+
+
+# --- Peticiones y spans ---
+def id_peticion_actual():
+    return _id_peticion.get()
+
+
+@contextmanager
+def peticion(tipo, id_peticion=None):
+    """Abre una petición (turno de chat, turno de voz, llamada CRUD) con un id propio y la mide."""
+    token = _id_peticion.set(id_peticion or uuid.uuid4().hex[:12])
+    try:
+        with span(tipo):
+            yield _id_peticion.get()
+    finally:
+        _id_peticion.reset(token)
+
+
+@contextmanager
+def span(nombre, **atributos):
+    """Mide el bloque: alimenta el histograma 'nombre' y, si LOG_SPANS, escribe una línea JSON."""
+    inicio = time.perf_counter()
+    estado = "ok"
+    try:
+        yield
+    except BaseException:
+        estado = "error"
+        raise
+    finally:
+        duracion = time.perf_counter() - inicio
+        observar(nombre, duracion)
+        if estado == "error":
+            incrementar("span_errores", span=nombre)
+        if LOG_SPANS:
+            registrar("span", modulo="trazas", span=nombre, duracion_ms=round(duracion * 1000, 2),
+                      estado=estado, **atributos)
+
+
+def trazado(nombre=None):
+    """Decorador: envuelve la función (sync o async) en un span."""
+    def decorador(funcion):
+        nombre_span = nombre or funcion.__name__
+        if inspect.iscoroutinefunction(funcion):
+            @functools.wraps(funcion)
+            async def envoltura_async(*args, **kwargs):
+                with span(nombre_span):
+                    return await funcion(*args, **kwargs)
+            return envoltura_async
+
+        @functools.wraps(funcion)
+        def envoltura(*args, **kwargs):
+            with span(nombre_span):
+                return funcion(*args, **kwargs)
+        return envoltura
+    return decorador
+
+
+# --- gspread ---
+METODOS_GSPREAD = {"find", "findall", "cell", "row_values", "col_values", "append_row", "append_rows",
+                   "update_cell", "update", "batch_update", "get_all_values", "get_all_records", "batch_get",
+                   "delete_rows", "get"}
+
+
+class HojaTrazada:
+    """Envuelve un Worksheet de gspread: cada llamada de red queda medida como span 'gspread.<método>'."""
+
+    def __init__(self, hoja):
+        self._hoja = hoja
+        self._titulo = getattr(hoja, "title", "?")
+
+    def __getattr__(self, nombre):
+        atributo = getattr(self._hoja, nombre)
+        if nombre not in METODOS_GSPREAD or not callable(atributo):
+            return atributo
+
+        @functools.wraps(atributo)
+        def llamada(*args, **kwargs):
+            with span(f"gspread.{nombre}", hoja=self._titulo):
+                return atributo(*args, **kwargs)
+        return llamada